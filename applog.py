@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+LEVELS = {"debug": 10, "info": 20, "warning": 30, "error": 40}
+RING_SIZE = 1000
+BATCH_MAX = 500
+MAX_BYTES = 5 * 1024 * 1024
+BACKUPS = 3
+ROTATE_SECONDS = 86400
+SAMPLE_SECONDS = 600
+
+
+class Logger:
+    # log() only checks the level / sampling and enqueues; formatting, file
+    # I/O, rotation and console echo happen on one background thread.
+    def __init__(self):
+        self.level = LEVELS["info"]
+        self.path = None
+        self.echo = bool(sys.stdout and sys.stdout.isatty())
+        self.max_bytes = MAX_BYTES
+        self.backups = BACKUPS
+        self.rotate_seconds = ROTATE_SECONDS
+        self.sample_seconds = SAMPLE_SECONDS
+        self.ring = deque(maxlen=RING_SIZE)
+        self.queue = queue.SimpleQueue()
+        self.counts = {name: 0 for name in LEVELS}
+        self.sampled_out = 0
+        self._samples = {}  # (sample, uid) -> [last emitted, suppressed since]
+        self._file = None
+        self._opened_at = 0.0
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def configure(self, path=None, level=None, echo=None, max_bytes=None, backups=None,
+                  rotate_seconds=None, sample_seconds=None):
+        if level is not None:
+            if level not in LEVELS:
+                raise ValueError(f"Invalid log level: {level}. Use {', '.join(LEVELS)}")
+            self.level = LEVELS[level]
+        if echo is not None:
+            self.echo = echo
+        if max_bytes is not None:
+            self.max_bytes = int(max_bytes)
+        if backups is not None:
+            self.backups = int(backups)
+        if rotate_seconds is not None:
+            self.rotate_seconds = int(rotate_seconds)
+        if sample_seconds is not None:
+            self.sample_seconds = int(sample_seconds)
+        if path is not None and path != self.path:
+            # Reopened by the writer thread on its next batch
+            self.flush()
+            self.path = path
+
+    def enabled(self, level: str) -> bool:
+        return LEVELS[level] >= self.level
+
+    def log(self, msg: str, level: str = "info", uid=None, sample=None, **fields):
+        if LEVELS[level] < self.level:
+            return
+        now = time.time()
+        if sample and self.sample_seconds:
+            # Routine per-UID lines: at most one per sample_seconds per UID
+            key = (sample, uid)
+            slot = self._samples.get(key)
+            if slot and now - slot[0] < self.sample_seconds:
+                slot[1] += 1
+                self.sampled_out += 1
+                return
+            if slot and slot[1]:
+                fields["suppressed"] = slot[1]
+            self._samples[key] = [now, 0]
+        if uid is not None:
+            fields["uid"] = uid
+        if self._thread is None:
+            self._start()
+        self.queue.put((now, level, msg, fields))
+
+    def _start(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def flush(self, timeout: float = 5.0):
+        if self._thread is None:
+            return
+        done = threading.Event()
+        self.queue.put(done)
+        done.wait(timeout)
+
+    def _open(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._opened_at = time.time()
+
+    def _rotate(self):
+        self._file.close()
+        self._file = None
+        for i in range(self.backups - 1, 0, -1):
+            src = f"{self.path}.{i}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.path}.{i + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self._open()
+
+    def _run(self):
+        path = None
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < BATCH_MAX:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            if self.path != path:
+                path = self.path
+                self._open()
+            lines = []
+            waiters = []
+            for entry in batch:
+                if isinstance(entry, threading.Event):
+                    waiters.append(entry)
+                    continue
+                ts, level, msg, fields = entry
+                stamp = datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S")
+                record = {"ts": round(ts, 3), "time": stamp, "level": level, "msg": msg}
+                record.update(fields)
+                self.ring.append(record)
+                self.counts[level] += 1
+                if self._file:
+                    lines.append(json.dumps(record, ensure_ascii=False, default=str))
+                if self.echo:
+                    prefix = "" if level == "info" else f"{level.upper()}: "
+                    print(f"[{stamp}] {prefix}{msg}", flush=False)
+            try:
+                if lines:
+                    self._file.write("\n".join(lines) + "\n")
+                    self._file.flush()
+                    if (
+                        self._file.tell() >= self.max_bytes
+                        or time.time() - self._opened_at >= self.rotate_seconds
+                    ):
+                        self._rotate()
+                if self.echo:
+                    sys.stdout.flush()
+            except Exception as e:
+                print(f"Logging failed: {e}", file=sys.stderr)
+            for w in waiters:
+                w.set()
+
+    def recent(self, limit: int = 200, level: str = None, uid=None):
+        floor = LEVELS.get(level or "debug", 0)
+        out = []
+        for record in reversed(list(self.ring)):
+            if LEVELS[record["level"]] < floor:
+                continue
+            if uid is not None and record.get("uid") != uid:
+                continue
+            out.append(record)
+            if len(out) >= limit:
+                break
+        out.reverse()
+        return out
+
+    def stats(self):
+        return {
+            "counts": dict(self.counts),
+            "sampled_out": self.sampled_out,
+            "queued": self.queue.qsize(),
+        }
+
+
+LOGGER = Logger()
+
+
+def log(msg: str, level: str = "info", **fields):
+    LOGGER.log(msg, level, **fields)
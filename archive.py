@@ -0,0 +1,399 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import mmap
+import os
+import queue
+import struct
+import sys
+import threading
+import time
+import zlib
+from collections import deque
+from datetime import datetime
+
+from applog import log
+
+APP_DISPLAY_NAME = "B站关注通知"
+ARCHIVE_DIR = os.path.join(
+    os.path.expanduser("~"),
+    "Library",
+    "Application Support",
+    APP_DISPLAY_NAME,
+    "archive",
+)
+BLOCK_HEADER = struct.Struct("<II")  # compressed length, record count
+INDEX_ENTRY = struct.Struct("<QqqQ")  # uid key, min ts, max ts, block offset
+BLOCK_RECORDS = 256
+BLOCK_SECONDS = 60
+SEGMENT_BYTES = 8 * 1024 * 1024
+SEGMENT_SECONDS = 86400
+RETENTION_DAYS = 365
+RETENTION_MB = 512
+QUEUE_MAX = 10000
+RECENT_IDS = 256
+LATE_SLACK_SECONDS = 86400  # accept items up to a day older than the watermark
+
+
+def uid_key(uid: str) -> int:
+    uid = str(uid)
+    return int(uid) if uid.isdigit() else zlib.crc32(uid.encode("utf-8"))
+
+
+def read_block(f, offset: int):
+    f.seek(offset)
+    header = f.read(BLOCK_HEADER.size)
+    if len(header) < BLOCK_HEADER.size:
+        return None, offset
+    length, _ = BLOCK_HEADER.unpack(header)
+    blob = f.read(length)
+    if len(blob) < length:
+        return None, offset  # torn tail from a crash
+    lines = zlib.decompress(blob).decode("utf-8").splitlines()
+    return [json.loads(x) for x in lines], offset + BLOCK_HEADER.size + length
+
+
+def block_entries(records, offset: int):
+    spans = {}
+    for r in records:
+        key = uid_key(r["uid"])
+        ts = int(r.get("ts") or 0)
+        lo, hi = spans.get(key, (ts, ts))
+        spans[key] = (min(lo, ts), max(hi, ts))
+    return [(k, lo, hi, offset) for k, (lo, hi) in spans.items()]
+
+
+class SealedSegment:
+    def __init__(self, path: str):
+        self.path = path
+        self.idx_path = path[: -len(".log")] + ".idx"
+        self.size = os.path.getsize(path)
+        self.mtime = os.path.getmtime(path)
+        with open(self.idx_path, "rb") as f:
+            self.idx = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.path.getsize(self.idx_path) else b""
+        self.count = len(self.idx) // INDEX_ENTRY.size
+
+    def _entry(self, i: int):
+        return INDEX_ENTRY.unpack_from(self.idx, i * INDEX_ENTRY.size)
+
+    def offsets(self, key: int, since: int, until: int):
+        # Entries are sorted by (uid, min_ts): bisect to the uid, stop past until
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._entry(mid)[0] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        out = []
+        for i in range(lo, self.count):
+            k, min_ts, max_ts, offset = self._entry(i)
+            if k != key or min_ts >= until:
+                break
+            if max_ts >= since:
+                out.append(offset)
+        return out
+
+
+def write_index(path: str, entries):
+    entries = sorted(entries)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        for e in entries:
+            f.write(INDEX_ENTRY.pack(*e))
+    os.replace(tmp, path)
+
+
+class Archive:
+    def __init__(self, directory: str, normalize=None,
+                 retention_days: int = RETENTION_DAYS, retention_mb: int = RETENTION_MB):
+        # normalize(uid, item, fetched_at) -> record dict or None; runs on the writer thread
+        self.dir = directory
+        self.normalize = normalize
+        self.retention_days = retention_days
+        self.retention_mb = retention_mb
+        self.queue = queue.Queue(maxsize=QUEUE_MAX)
+        self.lock = threading.Lock()
+        self.sealed = []
+        self.active_path = None
+        self.active_file = None
+        self.active_entries = []
+        self.active_started = 0.0
+        self.pending = []
+        self.pending_since = 0.0
+        self.watermarks = {}
+        self.recent = {}
+        self.dropped = 0
+        self.written = 0
+        self.next_seq = 1
+        self._stop = threading.Event()
+
+    @property
+    def watermark_path(self):
+        return os.path.join(self.dir, "watermarks.json")
+
+    def load(self):
+        os.makedirs(self.dir, exist_ok=True)
+        logs = sorted(f for f in os.listdir(self.dir) if f.startswith("arch-") and f.endswith(".log"))
+        for name in logs:
+            path = os.path.join(self.dir, name)
+            self.next_seq = max(self.next_seq, int(name[5:-4]) + 1)
+            if not os.path.exists(path[: -len(".log")] + ".idx"):
+                # Left active by a previous run: index it now and keep it sealed
+                self._build_index(path)
+            self.sealed.append(SealedSegment(path))
+        if os.path.exists(self.watermark_path):
+            try:
+                with open(self.watermark_path, "r", encoding="utf-8") as f:
+                    self.watermarks = {k: int(v) for k, v in json.load(f).items()}
+            except Exception as e:
+                log(f"[archive] failed to load watermarks: {e}", "error")
+        self.enforce_retention()
+
+    def _build_index(self, path: str):
+        entries = []
+        valid = 0
+        with open(path, "rb") as f:
+            offset = 0
+            while True:
+                records, nxt = read_block(f, offset)
+                if records is None:
+                    break
+                entries.extend(block_entries(records, offset))
+                valid = offset = nxt
+        if valid < os.path.getsize(path):
+            os.truncate(path, valid)
+        write_index(path[: -len(".log")] + ".idx", entries)
+
+    def submit(self, uid: str, items, fetched_at: float = None):
+        # Called from the poll loop; never blocks
+        try:
+            self.queue.put_nowait((uid, items, fetched_at or time.time()))
+        except queue.Full:
+            self.dropped += 1
+
+    def _accept(self, record) -> bool:
+        uid, rid, ts = record["uid"], record["id"], int(record.get("ts") or 0)
+        recent = self.recent.get(uid)
+        if recent is None:
+            recent = self.recent[uid] = (deque(maxlen=RECENT_IDS), set())
+        order, ids = recent
+        if rid in ids or ts < self.watermarks.get(uid, 0) - LATE_SLACK_SECONDS:
+            return False
+        if len(order) == order.maxlen:
+            ids.discard(order[0])
+        order.append(rid)
+        ids.add(rid)
+        return True
+
+    def _ingest(self, uid, items, fetched_at):
+        for item in items:
+            record = self.normalize(uid, item, fetched_at) if self.normalize else item
+            if not record or not record.get("id") or not self._accept(record):
+                continue
+            if not self.pending:
+                self.pending_since = time.time()
+            self.pending.append(record)
+
+    def _open_active(self):
+        self.active_path = os.path.join(self.dir, "arch-%08d.log" % self.next_seq)
+        self.next_seq += 1
+        self.active_file = open(self.active_path, "ab")
+        self.active_entries = []
+        self.active_started = time.time()
+
+    def _seal_active(self):
+        if not self.active_file:
+            return
+        self.active_file.close()
+        write_index(self.active_path[: -len(".log")] + ".idx", self.active_entries)
+        seg = SealedSegment(self.active_path)
+        with self.lock:
+            self.sealed.append(seg)
+            self.active_path = None
+            self.active_file = None
+            self.active_entries = []
+        self.enforce_retention()
+
+    def _flush_block(self):
+        if not self.pending:
+            return
+        records, self.pending = self.pending, []
+        records.sort(key=lambda r: (r["uid"], int(r.get("ts") or 0)))
+        if not self.active_file:
+            self._open_active()
+        blob = zlib.compress(
+            "\n".join(json.dumps(r, ensure_ascii=False, separators=(",", ":")) for r in records).encode("utf-8"),
+            6,
+        )
+        offset = self.active_file.tell()
+        self.active_file.write(BLOCK_HEADER.pack(len(blob), len(records)) + blob)
+        self.active_file.flush()
+        with self.lock:
+            self.active_entries.extend(block_entries(records, offset))
+        self.written += len(records)
+        for r in records:
+            ts = int(r.get("ts") or 0)
+            if ts > self.watermarks.get(r["uid"], 0):
+                self.watermarks[r["uid"]] = ts
+        tmp = self.watermark_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.watermarks, f)
+        os.replace(tmp, self.watermark_path)
+        if (
+            self.active_file.tell() >= SEGMENT_BYTES
+            or time.time() - self.active_started >= SEGMENT_SECONDS
+        ):
+            self._seal_active()
+
+    def enforce_retention(self):
+        cutoff = time.time() - self.retention_days * 86400
+        budget = self.retention_mb * 1024 * 1024
+        with self.lock:
+            total = sum(s.size for s in self.sealed)
+            victims = []
+            for seg in self.sealed:
+                if seg.mtime < cutoff or total > budget:
+                    victims.append(seg)
+                    total -= seg.size
+            self.sealed = [s for s in self.sealed if s not in victims]
+        for seg in victims:
+            for path in (seg.path, seg.idx_path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        if victims:
+            log(f"[archive] retention removed {len(victims)} segments")
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                uid, items, fetched_at = self.queue.get(timeout=1)
+                self._ingest(uid, items, fetched_at)
+            except queue.Empty:
+                pass
+            except Exception as e:
+                log(f"[archive] ingest failed: {e}", "error")
+            try:
+                if self.pending and (
+                    len(self.pending) >= BLOCK_RECORDS
+                    or time.time() - self.pending_since >= BLOCK_SECONDS
+                ):
+                    self._flush_block()
+            except Exception as e:
+                log(f"[archive] write failed: {e}", "error")
+        self._flush_block()
+
+    def start(self):
+        t = threading.Thread(target=self._run, daemon=True)
+        t.start()
+        self._thread = t
+        return t
+
+    def stop(self):
+        self._stop.set()
+        t = getattr(self, "_thread", None)
+        if t:
+            t.join(timeout=5)
+
+    def query(self, uid: str, since: int = 0, until: int = None, limit: int = None):
+        # Records for uid with since <= ts < until, oldest first, deduped by id
+        until = until or 2 ** 62
+        key = uid_key(uid)
+        with self.lock:
+            sources = [(s.path, s.offsets(key, since, until)) for s in self.sealed]
+            if self.active_path:
+                offsets = sorted(
+                    off for k, lo, hi, off in self.active_entries
+                    if k == key and hi >= since and lo < until
+                )
+                sources.append((self.active_path, offsets))
+        out = {}
+        for path, offsets in sources:
+            if not offsets:
+                continue
+            try:
+                with open(path, "rb") as f:
+                    for off in offsets:
+                        records, _ = read_block(f, off)
+                        for r in records or ():
+                            ts = int(r.get("ts") or 0)
+                            if r.get("uid") == str(uid) and since <= ts < until:
+                                out.setdefault(r["id"], r)
+            except FileNotFoundError:
+                continue  # removed by retention meanwhile
+        records = sorted(out.values(), key=lambda r: (int(r.get("ts") or 0), r["id"]))
+        return records[:limit] if limit else records
+
+    def stats(self):
+        with self.lock:
+            return {
+                "segments": len(self.sealed) + (1 if self.active_path else 0),
+                "bytes": sum(s.size for s in self.sealed)
+                + (os.path.getsize(self.active_path) if self.active_path else 0),
+                "written": self.written,
+                "dropped": self.dropped,
+                "queued": self.queue.qsize(),
+            }
+
+
+def parse_time(value: str) -> int:
+    if not value:
+        return 0
+    if value.isdigit():
+        return int(value)
+    for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d"):
+        try:
+            return int(datetime.strptime(value, fmt).timestamp())
+        except ValueError:
+            continue
+    raise ValueError(f"Invalid time: {value} (use YYYY-MM-DD[ HH:MM:SS] or unix seconds)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export archived dynamics")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    export = sub.add_parser("export", help="print a UID's history as JSON lines")
+    export.add_argument("uid")
+    export.add_argument("--since", default="")
+    export.add_argument("--until", default="")
+    export.add_argument("--dir", default=ARCHIVE_DIR)
+    sub.add_parser("stats", help="show archive size").add_argument("--dir", default=ARCHIVE_DIR)
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.dir):
+        print(f"Archive not found: {args.dir}")
+        sys.exit(1)
+    archive = Archive(args.dir)
+    with archive.lock:
+        for name in sorted(os.listdir(args.dir)):
+            if name.startswith("arch-") and name.endswith(".log"):
+                path = os.path.join(args.dir, name)
+                if os.path.exists(path[: -len(".log")] + ".idx"):
+                    archive.sealed.append(SealedSegment(path))
+                else:
+                    # Active segment of a running monitor: scan it read-only
+                    archive.active_path = path
+                    with open(path, "rb") as f:
+                        offset = 0
+                        while True:
+                            records, nxt = read_block(f, offset)
+                            if records is None:
+                                break
+                            archive.active_entries.extend(block_entries(records, offset))
+                            offset = nxt
+    if args.cmd == "stats":
+        print(json.dumps(archive.stats()))
+        return
+    try:
+        since, until = parse_time(args.since), parse_time(args.until)
+    except ValueError as e:
+        print(e)
+        sys.exit(1)
+    for r in archive.query(args.uid, since, until or None):
+        print(json.dumps(r, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+import gzip
+import json
+import threading
+import time
+from collections import deque
+from urllib.parse import urlparse
+
+import requests
+
+CAPTURE_VERSION = 1
+FLUSH_SECONDS = 1.0
+# URL path suffix -> (kind, query param carrying the UID)
+CAPTURED_ENDPOINTS = {
+    "/x/polymer/web-dynamic/v1/feed/space": ("feed", "host_mid"),
+    "/dynamic_svr/v1/dynamic_svr/space_history": ("vc", "host_uid"),
+    "/x/space/acc/info": ("name", "mid"),
+}
+
+
+def classify(url: str, params):
+    path = urlparse(url).path
+    for suffix, (kind, param) in CAPTURED_ENDPOINTS.items():
+        if path.endswith(suffix):
+            return kind, str((params or {}).get(param, ""))
+    return None, None
+
+
+class RecordingSession(requests.Session):
+    # Drop-in Session that also appends captured API traffic to a gzip file
+    def __init__(self, path: str, meta: dict = None):
+        super().__init__()
+        self.path = path
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.file = gzip.open(path, "wt", encoding="utf-8")
+        self.last_flush = time.monotonic()
+        self.records = 0
+        header = {"capture": CAPTURE_VERSION, "started": self.started}
+        header.update(meta or {})
+        self._write(header)
+
+    def _write(self, record: dict):
+        with self.lock:
+            if self.file.closed:
+                return
+            self.file.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+            if time.monotonic() - self.last_flush >= FLUSH_SECONDS:
+                self.file.flush()
+                self.last_flush = time.monotonic()
+
+    def request(self, method, url, params=None, **kwargs):
+        kind, uid = classify(url, params)
+        if not kind:
+            return super().request(method, url, params=params, **kwargs)
+        t = time.time() - self.started
+        began = time.perf_counter()
+        try:
+            resp = super().request(method, url, params=params, **kwargs)
+        except requests.RequestException as e:
+            self._write(
+                {
+                    "t": round(t, 3),
+                    "kind": kind,
+                    "uid": uid,
+                    "elapsed": round(time.perf_counter() - began, 4),
+                    "error": f"{type(e).__name__}: {e}",
+                }
+            )
+            raise
+        self._write(
+            {
+                "t": round(t, 3),
+                "kind": kind,
+                "uid": uid,
+                "elapsed": round(time.perf_counter() - began, 4),
+                "status": resp.status_code,
+                "body": resp.text,
+            }
+        )
+        self.records += 1
+        return resp
+
+    def close(self):
+        with self.lock:
+            if not self.file.closed:
+                self.file.close()
+        super().close()
+
+
+class ReplayExhausted(requests.ConnectionError):
+    pass
+
+
+class ReplaySession(requests.Session):
+    # Serves recorded responses per (kind, uid) in the order they were captured
+    def __init__(self, path: str, realtime: bool = False):
+        super().__init__()
+        self.realtime = realtime
+        self.queues = {}
+        self.header = {}
+        self.total = 0
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for n, line in enumerate(f):
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break  # torn tail of an interrupted recording
+                if n == 0 and "capture" in record:
+                    self.header = record
+                    continue
+                self.queues.setdefault((record["kind"], record["uid"]), deque()).append(record)
+                self.total += 1
+        self.served = {"feed": 0, "vc": 0, "name": 0}
+        self.missing = 0
+        self.recorded_elapsed = 0.0
+        self.started = None
+
+    def uids(self):
+        seen = []
+        for kind, uid in self.queues:
+            if kind == "feed" and uid not in seen:
+                seen.append(uid)
+        return seen
+
+    def remaining(self, kind: str = "feed") -> int:
+        return sum(len(q) for (k, _), q in self.queues.items() if k == kind)
+
+    def request(self, method, url, params=None, **kwargs):
+        kind, uid = classify(url, params)
+        if not kind:
+            raise ReplayExhausted(f"Not captured: {url}")
+        q = self.queues.get((kind, uid))
+        if not q:
+            self.missing += 1
+            raise ReplayExhausted(f"No recorded {kind} response for {uid}")
+        record = q.popleft()
+        if self.started is None:
+            self.started = time.monotonic() - record["t"]
+        if self.realtime:
+            delay = self.started + record["t"] + record.get("elapsed", 0) - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        self.served[kind] += 1
+        self.recorded_elapsed += record.get("elapsed", 0)
+        if "error" in record:
+            raise requests.ConnectionError(record["error"])
+        resp = requests.Response()
+        resp.status_code = record["status"]
+        resp._content = record["body"].encode("utf-8")
+        resp.encoding = "utf-8"
+        resp.headers["Content-Type"] = "application/json"
+        resp.url = url
+        resp.request = requests.Request(method, url, params=params).prepare()
+        return resp
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+import threading
+import time
+
+import requests
+
+from applog import log
+
+CLOSED = "closed"
+OPEN = "open"
+FAILURE_THRESHOLD = 3
+PROBE_MIN_SECONDS = 15
+PROBE_MAX_SECONDS = 300
+PROBE_URL = "https://api.bilibili.com/"
+PROBE_TIMEOUT = 3
+
+
+def is_connection_error(exc: Exception) -> bool:
+    # HTTP / API errors mean the network is up; only these count as outages
+    return isinstance(exc, (requests.ConnectionError, requests.Timeout))
+
+
+def http_probe(session: requests.Session):
+    def probe():
+        try:
+            session.head(PROBE_URL, timeout=PROBE_TIMEOUT, allow_redirects=False)
+            return True
+        except requests.RequestException:
+            return False
+
+    return probe
+
+
+class CircuitBreaker:
+    # Opens after `threshold` consecutive connection failures; while open,
+    # allow() fails fast and only a single probe per interval tests recovery;
+    # callers arriving while that probe is in flight fail fast too.
+    def __init__(self, probe, threshold: int = FAILURE_THRESHOLD,
+                 probe_min: float = PROBE_MIN_SECONDS, probe_max: float = PROBE_MAX_SECONDS,
+                 clock=time.monotonic):
+        self.probe = probe
+        self.threshold = threshold
+        self.probe_min = probe_min
+        self.probe_max = probe_max
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.probing = False
+        self.state = CLOSED
+        self.failures = 0
+        self.probe_delay = probe_min
+        self.next_probe = 0.0
+        self.opened_at = None
+        self.last_outage = 0.0  # seconds the last open period lasted
+        self.trips = 0
+        self.recoveries = 0
+        self.probes = 0
+
+    @property
+    def is_open(self) -> bool:
+        return self.state == OPEN
+
+    def allow(self) -> bool:
+        with self.lock:
+            if self.state == CLOSED:
+                return True
+            now = self.clock()
+            if self.probing or now < self.next_probe:
+                return False
+            self.probing = True
+            self.probes += 1
+        try:
+            ok = self.probe()
+        except Exception:
+            ok = False
+        with self.lock:
+            self.probing = False
+            if ok:
+                log(f"[net] connectivity restored after {int(now - self.opened_at)}s, catching up")
+                self.state = CLOSED
+                self.failures = 0
+                self.probe_delay = self.probe_min
+                self.last_outage = now - self.opened_at
+                self.opened_at = None
+                self.recoveries += 1
+                return True
+            self.probe_delay = min(self.probe_delay * 2, self.probe_max)
+            self.next_probe = now + self.probe_delay
+            log(f"[net] probe failed, next in {int(self.probe_delay)}s", "debug")
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == CLOSED and self.failures >= self.threshold:
+                self.state = OPEN
+                self.trips += 1
+                self.opened_at = self.clock()
+                self.probe_delay = self.probe_min
+                self.next_probe = self.opened_at + self.probe_delay
+                log(f"[net] {self.failures} consecutive connection failures, pausing requests", "warning")
+
+    def seconds_until_probe(self) -> float:
+        with self.lock:
+            if self.state == CLOSED:
+                return 0.0
+            return max(0.0, self.next_probe - self.clock())
+
+    def stats(self):
+        until = self.seconds_until_probe()
+        with self.lock:
+            return {
+                "state": self.state,
+                "failures": self.failures,
+                "trips": self.trips,
+                "recoveries": self.recoveries,
+                "probes": self.probes,
+                "next_probe_in": round(until, 1),
+            }
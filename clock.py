@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+import time
+
+
+class SystemClock:
+    # What the poll loop reads and sleeps on
+    def time(self) -> float:
+        return time.time()
+
+    def monotonic(self) -> float:
+        return time.monotonic()
+
+    def sleep(self, seconds: float):
+        time.sleep(seconds)
+
+
+SYSTEM_CLOCK = SystemClock()
+
+
+class VirtualClock:
+    # Simulated time for tools/simulate.py: sleep() returns at once and moves
+    # both clocks; suspend() moves only wall time, like a machine that slept
+    def __init__(self, start: float = None):
+        self.wall = float(start if start is not None else int(time.time()))
+        self.mono = 0.0
+        self.slept = 0.0
+
+    def time(self) -> float:
+        return self.wall
+
+    def monotonic(self) -> float:
+        return self.mono
+
+    def sleep(self, seconds: float):
+        if seconds > 0:
+            self.wall += seconds
+            self.mono += seconds
+            self.slept += seconds
+
+    def suspend(self, seconds: float):
+        self.wall += seconds
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+import json
+import os
+import socket
+import threading
+
+from applog import log
+
+# Same config directory as main.py and menubar.py; kept here so clients of
+# the socket need not import the monitor
+APP_DIR = os.path.join(os.path.expanduser("~"), "Library", "Application Support", "B站关注通知")
+CONTROL_SOCKET = os.path.join(APP_DIR, "control.sock")
+MAX_LINE = 1024 * 1024
+CLIENT_TIMEOUT = 10
+
+
+class ControlServer:
+    # Newline-delimited JSON over a Unix socket: {"cmd": ..., "args": {...}}
+    # in, {"ok": true, "result": ...} or {"ok": false, "error": ...} out.
+    # The accept thread blocks in the kernel, so an idle channel costs nothing.
+    def __init__(self, path: str, commands: dict):
+        self.path = path
+        # name -> fn(args: dict) -> JSON-serializable result
+        self.commands = commands
+        self.sock = None
+        self.handled = 0
+
+    def start(self):
+        if os.path.exists(self.path):
+            if ping(self.path):
+                raise RuntimeError(f"another monitor is listening on {self.path}")
+            os.remove(self.path)  # stale socket from a crash
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        old = os.umask(0o177)  # owner-only, like the token file
+        try:
+            sock.bind(self.path)
+        finally:
+            os.umask(old)
+        sock.listen(8)
+        self.sock = sock
+        t = threading.Thread(target=self._serve, daemon=True)
+        t.start()
+        return t
+
+    def stop(self):
+        if not self.sock:
+            return
+        try:
+            self.sock.close()
+        finally:
+            self.sock = None
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+    def _serve(self):
+        while self.sock:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                break  # closed by stop()
+            threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+    def _handle(self, conn):
+        with conn, conn.makefile("rwb") as f:
+            conn.settimeout(CLIENT_TIMEOUT)
+            while True:
+                try:
+                    line = f.readline(MAX_LINE)
+                except OSError:
+                    return
+                if not line:
+                    return
+                reply = self.dispatch(line)
+                try:
+                    f.write(json.dumps(reply, ensure_ascii=False, default=str).encode("utf-8") + b"\n")
+                    f.flush()
+                except OSError:
+                    return
+
+    def dispatch(self, line: bytes):
+        self.handled += 1
+        try:
+            req = json.loads(line)
+            cmd = req.get("cmd")
+            args = req.get("args") or {}
+        except (ValueError, AttributeError):
+            return {"ok": False, "error": "expected a JSON object per line"}
+        fn = self.commands.get(cmd)
+        if not fn:
+            return {"ok": False, "error": f"unknown command {cmd!r}; try help"}
+        try:
+            return {"ok": True, "result": fn(args)}
+        except (ValueError, TypeError, KeyError) as e:
+            return {"ok": False, "error": f"{cmd}: {e}"}
+        except Exception as e:
+            log(f"[ctl] {cmd} failed: {e}", "error")
+            return {"ok": False, "error": f"{cmd} failed: {e}"}
+
+
+def call(path: str, cmd: str, args: dict = None, timeout: float = CLIENT_TIMEOUT):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(path)
+        with sock.makefile("rwb") as f:
+            f.write(json.dumps({"cmd": cmd, "args": args or {}}).encode("utf-8") + b"\n")
+            f.flush()
+            line = f.readline(MAX_LINE)
+    if not line:
+        raise ConnectionError("monitor closed the control connection")
+    return json.loads(line)
+
+
+def ping(path: str) -> bool:
+    try:
+        call(path, "help", timeout=1)
+        return True
+    except OSError:
+        return False
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+import hashlib
+import json
+import re
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from applog import log
+
+EVICT_SECONDS = 1800
+EVICT_MAX_SECONDS = 6 * 3600
+FAIL_EVICT_SECONDS = 60
+FAIL_THRESHOLD = 3
+HEALTH_ALPHA = 0.2
+UNHEALTHY = 0.5  # an exit whose success average drops below this is taken out like an unreachable one
+POOL_SIZE = 4
+RISK_CODE = re.compile(rb'"code"\s*:\s*-412\b')
+# Query params that carry the UID a request is about
+UID_PARAMS = ("host_mid", "host_uid", "mid", "uid")
+# ...or the dynamic it fetches (detail checks), so those spread over exits too
+ITEM_PARAMS = ("id", "dynamic_id")
+
+
+def is_risk_control(r: requests.Response) -> bool:
+    # HTTP 412, or a JSON body starting {"code":-412,...}
+    if r.status_code == 412:
+        return True
+    return bool(RISK_CODE.search(r.content[:64]))
+
+
+def _hash_unit(key: str) -> float:
+    # Uniform float in (0, 1)
+    h = int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+    return (h + 1) / (2**64 + 1)
+
+
+class Exit:
+    def __init__(self, spec: dict, base: requests.Session):
+        self.name = str(spec.get("name") or spec.get("proxy") or "direct")
+        self.proxy = spec.get("proxy")
+        self.rate = float(spec.get("rate") or 0)  # requests/s through this exit, 0 = unlimited
+        self.session = requests.Session()
+        self.session.headers.update(base.headers)
+        adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        if self.proxy:
+            self.session.proxies = {"http": self.proxy, "https": self.proxy}
+        if spec.get("cookies"):
+            # A separate account: its own cookie file in save_cookies() format
+            with open(spec["cookies"], "r", encoding="utf-8") as f:
+                self.session.cookies = requests.utils.cookiejar_from_dict(json.load(f))
+        else:
+            self.session.cookies = base.cookies
+        self.health = 1.0
+        self.failures = 0
+        self.evicted_until = 0.0
+        self.evict_seconds = EVICT_SECONDS
+        self.next_slot = 0.0
+        self.requests = 0
+        self.risk_hits = 0
+        self.errors = 0
+        self.lock = threading.Lock()
+
+    def available(self, now: float) -> bool:
+        return now >= self.evicted_until
+
+    def wait_turn(self):
+        # Per-exit pacing: the per-IP budget is what the pool multiplies
+        if not self.rate:
+            return
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + 1.0 / self.rate
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class EgressPool:
+    # Session-compatible front for several exits (proxies / cookie profiles).
+    # Requests about a UID go to the exit with the highest rendezvous score
+    # for it. Scores depend only on exit name and UID, so a UID keeps its exit
+    # unless that exit is out; adding or removing an exit only moves its own
+    # UIDs. An exit that sees -412, or whose health drops too low, is
+    # evicted for a while; connection errors fail over to the next exit.
+    def __init__(self, base: requests.Session, specs, evict_seconds: int = EVICT_SECONDS,
+                 clock=time.monotonic):
+        if not specs:
+            raise ValueError("egress needs at least one exit")
+        self.base = base
+        self.exits = [Exit(s if isinstance(s, dict) else {"proxy": s}, base) for s in specs]
+        names = [e.name for e in self.exits]
+        if len(set(names)) != len(names):
+            raise ValueError(f"egress exit names must be unique: {names}")
+        for e in self.exits:
+            e.evict_seconds = evict_seconds
+        self.evict_seconds = evict_seconds
+        self.clock = clock
+        self.headers = base.headers
+        self.cookies = base.cookies
+        self.failovers = 0
+
+    def ranked(self, key: str):
+        # Rendezvous hashing; evicted exits last, soonest-back first
+        now = self.clock()
+        up = sorted(
+            (e for e in self.exits if e.available(now)),
+            key=lambda e: _hash_unit(f"{e.name}\0{key}"),
+            reverse=True,
+        )
+        down = sorted((e for e in self.exits if not e.available(now)), key=lambda e: e.evicted_until)
+        return up, down
+
+    def exit_for(self, key: str):
+        up, down = self.ranked(key)
+        return (up or down)[0]
+
+    def _key(self, url: str, params):
+        for p in UID_PARAMS + ITEM_PARAMS:
+            if params and params.get(p):
+                return str(params[p])
+        return url.split("?", 1)[0]
+
+    def request(self, method: str, url: str, params=None, **kwargs):
+        key = self._key(url, params)
+        up, down = self.ranked(key)
+        if not up:
+            raise requests.ConnectionError(
+                f"all egress exits evicted (next back: {down[0].name} in {int(down[0].evicted_until - self.clock())}s)"
+            )
+        last_error = None
+        for i, e in enumerate(up):
+            if i:
+                self.failovers += 1
+            e.wait_turn()
+            e.requests += 1
+            try:
+                r = e.session.request(method, url, params=params, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as exc:
+                self._failed(e, exc)
+                last_error = exc
+                continue
+            if is_risk_control(r):
+                self._evict(e, key)
+                last_error = None
+                if i + 1 < len(up):
+                    continue
+                return r
+            self._succeeded(e)
+            return r
+        raise last_error
+
+    def get(self, url, params=None, **kwargs):
+        return self.request("GET", url, params=params, **kwargs)
+
+    def post(self, url, data=None, json=None, **kwargs):
+        return self.request("POST", url, data=data, json=json, **kwargs)
+
+    def head(self, url, **kwargs):
+        return self.request("HEAD", url, **kwargs)
+
+    def _succeeded(self, e: Exit):
+        e.failures = 0
+        e.health += HEALTH_ALPHA * (1.0 - e.health)
+
+    def _failed(self, e: Exit, exc):
+        e.errors += 1
+        e.failures += 1
+        e.health -= HEALTH_ALPHA * e.health
+        if e.failures >= FAIL_THRESHOLD or e.health < UNHEALTHY:
+            e.evicted_until = self.clock() + FAIL_EVICT_SECONDS
+            e.failures = 0
+            # Back on probation: one more failure sends it out again
+            e.health = UNHEALTHY
+            log(f"[egress] {e.name} unreachable ({exc}), out for {FAIL_EVICT_SECONDS}s", "warning")
+
+    def _evict(self, e: Exit, key: str):
+        e.risk_hits += 1
+        if e.evicted_until and self.clock() - e.evicted_until > self.evict_seconds:
+            # Behaved for a full period since the last eviction
+            e.evict_seconds = self.evict_seconds
+        e.evicted_until = self.clock() + e.evict_seconds
+        log(f"[egress] {e.name} hit risk control (-412) on {key}, out for {e.evict_seconds}s", "warning")
+        # Repeat offenders stay out longer
+        e.evict_seconds = min(e.evict_seconds * 2, EVICT_MAX_SECONDS)
+
+    def close(self):
+        for e in self.exits:
+            e.session.close()
+
+    def stats(self):
+        now = self.clock()
+        return {
+            "failovers": self.failovers,
+            "exits": {
+                e.name: {
+                    "up": e.available(now),
+                    "health": round(e.health, 3),
+                    "requests": e.requests,
+                    "risk_hits": e.risk_hits,
+                    "errors": e.errors,
+                    "back_in": max(0, int(e.evicted_until - now)),
+                }
+                for e in self.exits
+            },
+        }
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+import gzip
+import json
+import os
+import threading
+import time
+from array import array
+
+from applog import log
+
+METRICS = ("like", "comment", "forward")
+TRACK_DAYS = 7
+MAX_TRACKED = 5000
+MAX_SAMPLES = 512
+MIN_SPACING = 55  # just under the default poll interval
+SPACING_DIVISOR = 64  # a post of age A is sampled at most every A / 64 seconds
+SAVE_SECONDS = 600
+
+
+def item_stats(item):
+    # (like, comment, forward) from module_stat, or None
+    if not isinstance(item, dict):
+        return None
+    stat = (item.get("modules") or {}).get("module_stat")
+    if not isinstance(stat, dict):
+        return None
+    out = []
+    for m in METRICS:
+        count = (stat.get(m) or {}).get("count")
+        out.append(int(count) if isinstance(count, (int, float)) else 0)
+    return tuple(out)
+
+
+def parse_alerts(specs):
+    rules = []
+    for spec in specs or []:
+        if not isinstance(spec, dict) or spec.get("metric") not in METRICS:
+            raise ValueError(f"engagement alert needs metric in {', '.join(METRICS)}: {spec!r}")
+        rules.append((spec["metric"], int(spec["gain"]), int(spec.get("window_seconds", 3600))))
+    return rules
+
+
+class Series:
+    # Samples kept as running deltas (seconds since pub, then counts) in
+    # int arrays; `last` holds the absolute values of the newest sample.
+    __slots__ = ("uid", "pub", "t", "like", "comment", "forward", "last")
+
+    def __init__(self, uid: str, pub: int):
+        self.uid = uid
+        self.pub = pub
+        self.t = array("i")
+        self.like = array("i")
+        self.comment = array("i")
+        self.forward = array("i")
+        self.last = None  # (t, like, comment, forward)
+
+    def append(self, ts: int, counts):
+        prev = self.last or (self.pub, 0, 0, 0)
+        self.t.append(ts - prev[0])
+        for name, value, before in zip(METRICS, counts, prev[1:]):
+            getattr(self, name).append(value - before)
+        self.last = (ts,) + tuple(counts)
+
+    def samples(self):
+        out = []
+        t, values = self.pub, [0, 0, 0]
+        for i in range(len(self.t)):
+            t += self.t[i]
+            values = [v + getattr(self, m)[i] for v, m in zip(values, METRICS)]
+            out.append([t] + values)
+        return out
+
+    def value_at_or_before(self, ts: int, metric: str):
+        # Walks backwards from the newest sample; curves are short
+        col = getattr(self, metric)
+        idx = METRICS.index(metric) + 1
+        t, value = self.last[0], self.last[idx]
+        for i in range(len(self.t) - 1, -1, -1):
+            if t <= ts:
+                return value
+            t -= self.t[i]
+            value -= col[i]
+        return None
+
+    def to_json(self):
+        return {"uid": self.uid, "pub": self.pub, **{k: list(getattr(self, k)) for k in ("t",) + METRICS}}
+
+    @classmethod
+    def from_json(cls, data):
+        s = cls(str(data["uid"]), int(data["pub"]))
+        for k in ("t",) + METRICS:
+            getattr(s, k).extend(data[k])
+        if len(s.t):
+            samples = s.samples()
+            s.last = tuple(samples[-1])
+        return s
+
+
+class EngagementTracker:
+    # Sampled from feed items the poller already fetched, so it costs no
+    # requests. Each dynamic is tracked for its first `days`; the whole set
+    # is capped at `max_tracked` (oldest posts dropped first).
+    def __init__(self, path=None, days: int = TRACK_DAYS, max_tracked: int = MAX_TRACKED,
+                 alerts=None, notifier=None, pub_ts=None, name_of=None):
+        self.path = path
+        self.window = days * 86400
+        self.max_tracked = max_tracked
+        self.alerts = parse_alerts(alerts)
+        # notifier(title, message, url)
+        self.notifier = notifier
+        self.pub_ts = pub_ts
+        self.name_of = name_of
+        self.lock = threading.Lock()
+        self.series = {}  # dynamic id -> Series
+        self.alerted = set()  # (dynamic id, rule index)
+        self.samples = 0
+        self.fired = 0
+        self.dirty = False
+        self.saved_at = time.time()
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with gzip.open(self.path, "rt", encoding="utf-8") as f:
+                data = json.load(f)
+            self.series = {k: Series.from_json(v) for k, v in data.get("series", {}).items()}
+            self.alerted = {(x[0], x[1]) for x in data.get("alerted", [])}
+        except Exception as e:
+            log(f"[engagement] failed to load {self.path}: {e}", "error")
+
+    def save(self):
+        if not self.path:
+            return
+        with self.lock:
+            body = json.dumps(
+                {
+                    "series": {k: s.to_json() for k, s in self.series.items()},
+                    "alerted": sorted(self.alerted),
+                },
+                separators=(",", ":"),
+            )
+            self.dirty = False
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp = self.path + ".tmp"
+            with gzip.open(tmp, "wt", encoding="utf-8", compresslevel=6) as f:
+                f.write(body)
+            os.replace(tmp, self.path)
+            self.saved_at = time.time()
+        except OSError as e:
+            log(f"[engagement] failed to save {self.path}: {e}", "error")
+
+    def observe(self, uid: str, items, now: float = None):
+        now = int(now or time.time())
+        fired = []
+        with self.lock:
+            for item in items:
+                if not isinstance(item, dict) or not item.get("id_str"):
+                    continue
+                pub = self.pub_ts(item) if self.pub_ts else None
+                if not pub or now - pub > self.window:
+                    continue
+                counts = item_stats(item)
+                if counts is None:
+                    continue
+                dyn_id = item["id_str"]
+                s = self.series.get(dyn_id)
+                if s is None:
+                    s = self.series[dyn_id] = Series(uid, pub)
+                elif s.last[1:] == counts:
+                    continue
+                elif len(s.t) >= MAX_SAMPLES:
+                    continue
+                elif now - s.last[0] < max(MIN_SPACING, (now - pub) // SPACING_DIVISOR):
+                    continue
+                s.append(now, counts)
+                self.samples += 1
+                self.dirty = True
+                fired.extend(self._check_alerts(dyn_id, s, now))
+            self._trim(now)
+        for dyn_id, s, metric, gain, window in fired:
+            self._notify(dyn_id, s, metric, gain, window)
+        if self.dirty and time.time() - self.saved_at >= SAVE_SECONDS:
+            self.save()
+
+    def _check_alerts(self, dyn_id, s, now):
+        out = []
+        for i, (metric, gain, window) in enumerate(self.alerts):
+            if (dyn_id, i) in self.alerted:
+                continue
+            current = s.last[METRICS.index(metric) + 1]
+            if s.pub >= now - window:
+                base = 0  # whole life of the post fits in the window
+            else:
+                base = s.value_at_or_before(now - window, metric)
+                if base is None:
+                    continue  # not observed long enough to know
+            if current - base >= gain:
+                self.alerted.add((dyn_id, i))
+                self.fired += 1
+                out.append((dyn_id, s, metric, current - base, window))
+        return out
+
+    def _notify(self, dyn_id, s, metric, gain, window):
+        label = {"like": "点赞", "comment": "评论", "forward": "转发"}[metric]
+        minutes = max(1, window // 60)
+        log(f"[engagement] {dyn_id} +{gain} {metric} within {minutes}m", uid=s.uid)
+        if self.notifier:
+            name = (self.name_of(s.uid) if self.name_of else None) or s.uid
+            self.notifier(
+                "Bilibili 热度提醒",
+                f"{name} 的动态 {minutes} 分钟内{label} +{gain}",
+                f"https://t.bilibili.com/{dyn_id}",
+            )
+
+    def _trim(self, now):
+        if len(self.series) <= self.max_tracked:
+            return
+        # Drop the oldest posts first
+        extra = len(self.series) - self.max_tracked
+        for dyn_id, _ in sorted(self.series.items(), key=lambda kv: kv[1].pub)[:extra]:
+            del self.series[dyn_id]
+        live = set(self.series)
+        self.alerted = {x for x in self.alerted if x[0] in live}
+
+    def curve(self, dyn_id: str):
+        with self.lock:
+            s = self.series.get(dyn_id)
+            if s is None:
+                return None
+            return {"id": dyn_id, "uid": s.uid, "pub_ts": s.pub, "fields": ["ts"] + list(METRICS), "samples": s.samples()}
+
+    def latest(self, uid: str = None, limit: int = 50):
+        # Most liked tracked dynamics with their current counts
+        with self.lock:
+            rows = [
+                {"id": k, "uid": s.uid, "pub_ts": s.pub, **dict(zip(METRICS, s.last[1:]))}
+                for k, s in self.series.items()
+                if uid is None or s.uid == uid
+            ]
+        rows.sort(key=lambda r: r["like"], reverse=True)
+        return rows[:limit]
+
+    def stats(self):
+        with self.lock:
+            return {
+                "tracked": len(self.series),
+                "samples": self.samples,
+                "stored_values": sum(len(s.t) for s in self.series.values()) * (1 + len(METRICS)),
+                "alerts_fired": self.fired,
+            }
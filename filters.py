@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+import re
+import unicodedata
+from collections import deque
+
+TYPE_PREFIX = "DYNAMIC_TYPE_"
+RULE_KEYS = (
+    "include_types",
+    "exclude_types",
+    "include_keywords",
+    "exclude_keywords",
+    "include_regex",
+    "exclude_regex",
+    "min_length",
+)
+
+
+def normalize_text(text: str) -> str:
+    return unicodedata.normalize("NFKC", text or "").lower()
+
+
+def normalize_type(name: str) -> str:
+    name = str(name or "").strip().upper()
+    if name and not name.startswith(TYPE_PREFIX):
+        name = TYPE_PREFIX + name
+    return name
+
+
+class AhoCorasick:
+    def __init__(self, patterns):
+        # patterns: iterable of (keyword, pattern_id)
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [frozenset()]
+        outputs = [set()]
+        for word, pid in patterns:
+            node = 0
+            for ch in word:
+                nxt = self.goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[node][ch] = nxt
+                    self.goto.append({})
+                    self.fail.append(0)
+                    outputs.append(set())
+                node = nxt
+            outputs[node].add(pid)
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self.goto[node].items():
+                queue.append(nxt)
+                f = self.fail[node]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                target = self.goto[f].get(ch, 0)
+                self.fail[nxt] = target if target != nxt else 0
+                outputs[nxt] |= outputs[self.fail[nxt]]
+        self.out = [frozenset(o) for o in outputs]
+
+    def __len__(self):
+        return len(self.goto) - 1
+
+    def matches(self, text: str) -> set:
+        goto, fail, out = self.goto, self.fail, self.out
+        found = set()
+        node = 0
+        for ch in text:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if out[node]:
+                found |= out[node]
+        return found
+
+
+def _compile_regex(patterns):
+    patterns = [p for p in patterns or [] if p]
+    if not patterns:
+        return None
+    return re.compile("|".join(f"(?:{p})" for p in patterns), re.IGNORECASE)
+
+
+class RuleSet:
+    def __init__(self, spec: dict, keyword_ids: dict):
+        self.include_types = {normalize_type(t) for t in spec.get("include_types") or []}
+        self.exclude_types = {normalize_type(t) for t in spec.get("exclude_types") or []}
+        self.include_ids = self._keyword_ids(spec.get("include_keywords"), keyword_ids)
+        self.exclude_ids = self._keyword_ids(spec.get("exclude_keywords"), keyword_ids)
+        self.include_re = _compile_regex(spec.get("include_regex"))
+        self.exclude_re = _compile_regex(spec.get("exclude_regex"))
+        self.min_length = int(spec.get("min_length") or 0)
+        self.needs_text = bool(
+            self.include_ids
+            or self.exclude_ids
+            or self.include_re
+            or self.exclude_re
+            or self.min_length
+        )
+
+    @staticmethod
+    def _keyword_ids(words, keyword_ids: dict) -> frozenset:
+        ids = set()
+        for w in words or []:
+            w = normalize_text(str(w)).strip()
+            if w:
+                ids.add(keyword_ids.setdefault(w, len(keyword_ids)))
+        return frozenset(ids)
+
+    def allows(self, dyn_type: str, text: str, hits: set) -> bool:
+        if self.include_types and dyn_type not in self.include_types:
+            return False
+        if dyn_type in self.exclude_types:
+            return False
+        if not self.needs_text:
+            return True
+        if self.min_length and len(text.strip()) < self.min_length:
+            return False
+        if self.exclude_ids and not self.exclude_ids.isdisjoint(hits):
+            return False
+        if self.exclude_re and self.exclude_re.search(text):
+            return False
+        if self.include_ids or self.include_re:
+            if self.include_ids and not self.include_ids.isdisjoint(hits):
+                return True
+            return bool(self.include_re and self.include_re.search(text))
+        return True
+
+
+class FilterRules:
+    def __init__(self, spec: dict):
+        # spec: {"global": {...}, "uids": {"<uid>": {...}}}; keys see RULE_KEYS
+        spec = spec or {}
+        keyword_ids = {}
+        self.global_rules = RuleSet(spec.get("global") or {}, keyword_ids)
+        self.uid_rules = {
+            str(uid): RuleSet(rules or {}, keyword_ids)
+            for uid, rules in (spec.get("uids") or {}).items()
+        }
+        # One automaton for every keyword of every rule set
+        self.matcher = AhoCorasick(keyword_ids.items()) if keyword_ids else None
+        self.keyword_count = len(keyword_ids)
+
+    def allows(self, uid: str, dyn_type: str, get_text) -> bool:
+        dyn_type = normalize_type(dyn_type)
+        rule_sets = [self.global_rules]
+        if uid in self.uid_rules:
+            rule_sets.append(self.uid_rules[uid])
+        text = ""
+        hits = set()
+        if any(r.needs_text for r in rule_sets):
+            text = normalize_text(get_text())
+            if self.matcher:
+                hits = self.matcher.matches(text)
+        return all(r.allows(dyn_type, text, hits) for r in rule_sets)
+
+
+def compile_filter_rules(spec: dict):
+    if not spec:
+        return None
+    unknown = set()
+    for rules in [spec.get("global") or {}] + list((spec.get("uids") or {}).values()):
+        unknown.update(k for k in (rules or {}) if k not in RULE_KEYS)
+    if unknown:
+        raise ValueError(f"Unknown filter rule keys: {', '.join(sorted(unknown))}")
+    return FilterRules(spec)
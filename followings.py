@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+import json
+import os
+import threading
+import time
+
+import requests
+
+from applog import log
+
+NAV_URL = "https://api.bilibili.com/x/web-interface/nav"
+FOLLOWINGS_URL = "https://api.bilibili.com/x/relation/followings"
+PAGE_SIZE = 50
+PAGE_DELAY_SECONDS = 0.5
+SYNC_SECONDS = 3600
+REQUEST_TIMEOUT = (3.05, 10)
+
+
+def fetch_own_mid(session: requests.Session):
+    r = session.get(NAV_URL, timeout=REQUEST_TIMEOUT)
+    r.raise_for_status()
+    data = r.json()
+    if data.get("code") != 0 or not (data.get("data") or {}).get("mid"):
+        raise RuntimeError(f"Fetch account info failed: {data}")
+    return str(data["data"]["mid"])
+
+
+def fetch_followings_page(session: requests.Session, mid: str, page: int):
+    # Newest follows first: new follows always show up on page 1
+    r = session.get(
+        FOLLOWINGS_URL,
+        params={"vmid": mid, "pn": page, "ps": PAGE_SIZE, "order": "desc"},
+        headers={"Referer": f"https://space.bilibili.com/{mid}/fans/follow"},
+        timeout=REQUEST_TIMEOUT,
+    )
+    r.raise_for_status()
+    data = r.json()
+    if data.get("code") != 0:
+        raise RuntimeError(f"Fetch followings failed: {data}")
+    body = data.get("data") or {}
+    entries = [(str(x["mid"]), x.get("uname") or "") for x in body.get("list") or [] if x.get("mid")]
+    return entries, int(body.get("total") or 0)
+
+
+class FollowingsSync:
+    # Keeps the watched UID list equal to the account's followings (plus the
+    # configured uids). Each sync fetches page 1 first and stops there when
+    # nothing changed; new follows are read from the head of the list, and a
+    # full walk only happens when something was unfollowed.
+    def __init__(self, session, path=None, interval: int = SYNC_SECONDS, exclude=None,
+                 on_change=None, breaker=None):
+        self.session = session
+        self.path = path
+        self.interval = interval
+        self.exclude = {str(x) for x in exclude or []}
+        # on_change(added: {uid: name}, removed: [uid])
+        self.on_change = on_change
+        self.breaker = breaker
+        self.mid = None
+        self.uids = []  # followings, newest first
+        self.names = {}
+        self.total = 0
+        self.synced_at = 0
+        self.pages = 0
+        self.syncs = 0
+        self.full_syncs = 0
+        self._stop = threading.Event()
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.mid = data.get("mid")
+            self.uids = [str(x) for x in data.get("uids", [])]
+            self.names = data.get("names", {})
+            self.total = int(data.get("total", len(self.uids)))
+            self.synced_at = int(data.get("synced_at", 0))
+        except Exception as e:
+            log(f"[follow] failed to load {self.path}: {e}", "error")
+
+    def save(self):
+        if not self.path:
+            return
+        try:
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(
+                    {
+                        "mid": self.mid,
+                        "total": self.total,
+                        "synced_at": self.synced_at,
+                        "uids": self.uids,
+                        "names": self.names,
+                    },
+                    f,
+                    ensure_ascii=True,
+                )
+            os.replace(tmp, self.path)
+        except OSError as e:
+            log(f"[follow] failed to save {self.path}: {e}", "error")
+
+    def watched(self):
+        return [u for u in self.uids if u not in self.exclude]
+
+    def _page(self, page: int):
+        if page > 1:
+            time.sleep(PAGE_DELAY_SECONDS)
+        self.pages += 1
+        return fetch_followings_page(self.session, self.mid, page)
+
+    def sync(self):
+        if not self.mid:
+            self.mid = fetch_own_mid(self.session)
+        known = set(self.uids)
+        entries, total = self._page(1)
+        names = dict(entries)
+        head = [uid for uid, _ in entries]
+        if total == self.total and head == self.uids[: len(head)]:
+            self.synced_at = int(time.time())
+            self.syncs += 1
+            self.save()
+            return {}, []
+        # New follows are at the head; keep paging until a page reaches known UIDs
+        page = 1
+        while entries and not any(uid in known for uid, _ in entries) and len(head) < total:
+            page += 1
+            entries, total = self._page(page)
+            names.update(entries)
+            head.extend(uid for uid, _ in entries)
+        new = []
+        for uid in head:
+            if uid in known:
+                break
+            new.append(uid)
+        if total == len(self.uids) + len(new):
+            # Only additions: everything after them is the previous list
+            merged = new + self.uids
+        else:
+            # Something was unfollowed (or the cache is stale): walk the whole list
+            self.full_syncs += 1
+            merged = list(head)
+            seen = set(merged)
+            while len(merged) < total:
+                page += 1
+                entries, total = self._page(page)
+                if not entries:
+                    break
+                for uid, name in entries:
+                    names[uid] = name
+                    if uid not in seen:
+                        seen.add(uid)
+                        merged.append(uid)
+        added = {u: names.get(u, "") for u in merged if u not in known}
+        kept = set(merged)
+        removed = [u for u in self.uids if u not in kept]
+        self.uids = merged
+        self.names = {u: names.get(u) or self.names.get(u, "") for u in merged}
+        self.total = total
+        self.synced_at = int(time.time())
+        self.syncs += 1
+        self.save()
+        return added, removed
+
+    def run_once(self):
+        if self.breaker and self.breaker.is_open:
+            return
+        try:
+            added, removed = self.sync()
+        except Exception as e:
+            log(f"[follow] sync failed: {e}", "warning")
+            return
+        added = {u: n for u, n in added.items() if u not in self.exclude}
+        removed = [u for u in removed if u not in self.exclude]
+        if added or removed:
+            log(f"[follow] +{len(added)} -{len(removed)} (following {len(self.uids)})")
+            if self.on_change:
+                self.on_change(added, removed)
+        else:
+            log(f"[follow] unchanged ({len(self.uids)})", "debug")
+
+    def start(self):
+        def run():
+            # Synced recently (e.g. a quick restart): wait out the interval
+            delay = max(0, self.synced_at + self.interval - time.time())
+            while not self._stop.wait(delay):
+                self.run_once()
+                delay = self.interval
+
+        t = threading.Thread(target=run, daemon=True)
+        t.start()
+        return t
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        return {
+            "following": len(self.uids),
+            "syncs": self.syncs,
+            "full_syncs": self.full_syncs,
+            "pages": self.pages,
+            "synced_at": self.synced_at,
+        }
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+import hashlib
+import io
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from PIL import Image
+
+from applog import log
+
+THUMB_SIZE = (480, 480)
+THUMB_QUALITY = 80
+CACHE_MAX_BYTES = 100 * 1024 * 1024
+CONCURRENCY = 4
+QUEUE_MAX = 500
+URLS_MAX = 20000  # remembered remote urls, least recently used dropped first
+FAIL_RETRY_SECONDS = 300  # a failed url is not downloaded again before this
+DOWNLOAD_MAX_BYTES = 16 * 1024 * 1024
+REQUEST_TIMEOUT = (3.05, 10)
+REFERER = "https://www.bilibili.com/"
+
+
+def image_key(url: str) -> str:
+    return hashlib.sha1(url.encode("utf-8")).hexdigest()
+
+
+def make_thumbnail(data: bytes, size=THUMB_SIZE) -> bytes:
+    with Image.open(io.BytesIO(data)) as img:
+        img.seek(0)  # first frame of GIFs
+        img.thumbnail(size)
+        if img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        out = io.BytesIO()
+        img.save(out, "JPEG", quality=THUMB_QUALITY, optimize=True)
+        return out.getvalue()
+
+
+class ImageCache:
+    # Thumbnails of remote images in a size-capped LRU directory, filled by a
+    # bounded pool of background downloads. get() never touches the network.
+    def __init__(self, directory: str, max_bytes: int = CACHE_MAX_BYTES, size=THUMB_SIZE,
+                 concurrency: int = CONCURRENCY):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.size = size
+        self.concurrency = concurrency
+        self.session = requests.Session()
+        self.session.headers.update({"Referer": REFERER})
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # key -> bytes on disk, oldest first
+        self.total = 0
+        self.urls = OrderedDict()  # key -> remote url, recently seen keys last
+        self.inflight = set()
+        self.failures = OrderedDict()  # key -> monotonic time of the last failed download
+        self.hits = 0
+        self.misses = 0
+        self.fetched = 0
+        self.failed = 0
+        self.evicted = 0
+        self.skipped = 0
+        self._pool = None
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.jpg")
+
+    def load(self):
+        os.makedirs(self.directory, exist_ok=True)
+        found = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith(".tmp"):
+                os.remove(path)
+                continue
+            if not name.endswith(".jpg"):
+                continue
+            st = os.stat(path)
+            found.append((st.st_mtime, name[:-4], st.st_size))
+        found.sort()
+        with self.lock:
+            for _, key, size in found:
+                self.entries[key] = size
+                self.total += size
+        self._evict()
+
+    def start(self):
+        self._pool = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="images")
+
+    def stop(self):
+        if self._pool:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def local_url(self, url: str) -> str:
+        # Path the dashboard uses instead of the CDN url
+        url = normalize_url(url)
+        key = image_key(url)
+        with self.lock:
+            self._remember(key, url)
+        return f"/img/{key}"
+
+    def prefetch(self, urls):
+        for url in urls:
+            if url:
+                self._schedule(normalize_url(url))
+
+    def _schedule(self, url: str):
+        key = image_key(url)
+        with self.lock:
+            self._remember(key, url)
+            if key in self.entries or key in self.inflight or not self._pool:
+                return
+            failed_at = self.failures.get(key)
+            if failed_at is not None:
+                if time.monotonic() - failed_at < FAIL_RETRY_SECONDS:
+                    return
+                del self.failures[key]
+            if len(self.inflight) >= QUEUE_MAX:
+                # Best effort: a miss is retried when the image is requested
+                self.skipped += 1
+                return
+            self.inflight.add(key)
+        self._pool.submit(self._fetch, key, url)
+
+    def _remember(self, key: str, url: str):
+        # Caller holds self.lock
+        self.urls[key] = url
+        self.urls.move_to_end(key)
+        while len(self.urls) > URLS_MAX:
+            self.urls.popitem(last=False)
+
+    def _fetch(self, key: str, url: str):
+        try:
+            with self.session.get(url, timeout=REQUEST_TIMEOUT, stream=True) as r:
+                r.raise_for_status()
+                data = r.raw.read(DOWNLOAD_MAX_BYTES + 1, decode_content=True)
+            if len(data) > DOWNLOAD_MAX_BYTES:
+                raise ValueError("image too large")
+            thumb = make_thumbnail(data, self.size)
+            path = self._path(key)
+            tmp = path + ".tmp"
+            with open(tmp, "wb") as f:
+                f.write(thumb)
+            os.replace(tmp, path)
+            with self.lock:
+                self.entries[key] = len(thumb)
+                self.total += len(thumb)
+                self.fetched += 1
+            self._evict()
+        except Exception as e:
+            with self.lock:
+                self.failed += 1
+                now = time.monotonic()
+                self.failures.pop(key, None)
+                self.failures[key] = now
+                while self.failures:
+                    oldest = next(iter(self.failures))
+                    if now - self.failures[oldest] < FAIL_RETRY_SECONDS and len(self.failures) <= URLS_MAX:
+                        break
+                    del self.failures[oldest]
+            log(f"[img] fetch failed {url}: {e}", "debug")
+        finally:
+            with self.lock:
+                self.inflight.discard(key)
+
+    def _evict(self):
+        victims = []
+        with self.lock:
+            while self.total > self.max_bytes and self.entries:
+                key, size = self.entries.popitem(last=False)
+                self.total -= size
+                self.evicted += 1
+                victims.append(key)
+        for key in victims:
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def get(self, key: str):
+        # Cached thumbnail bytes, or None after queueing a download for a known url
+        with self.lock:
+            cached = key in self.entries
+            if cached:
+                self.entries.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+                url = self.urls.get(key)
+        if not cached:
+            if url:
+                self._schedule(url)
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            # mtime carries the LRU order across restarts
+            os.utime(path)
+            return data
+        except OSError:
+            with self.lock:
+                size = self.entries.pop(key, None)
+                if size is not None:
+                    self.total -= size
+            return None
+
+    def stats(self):
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "bytes": self.total,
+                "hits": self.hits,
+                "misses": self.misses,
+                "fetched": self.fetched,
+                "failed": self.failed,
+                "evicted": self.evicted,
+                "skipped": self.skipped,
+                "inflight": len(self.inflight),
+                "backing_off": len(self.failures),
+                "urls": len(self.urls),
+            }
+
+
+def normalize_url(url: str) -> str:
+    if url.startswith("//"):
+        return "https:" + url
+    if url.startswith("http://"):
+        return "https://" + url[len("http://"):]
+    return url
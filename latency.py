@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+import json
+import math
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+
+from applog import log
+
+STAGES = ("detect", "notify")
+SLOT_SECONDS = 3600
+WINDOW_HOURS = 24
+RECENT_MAX = 1000
+UID_SAMPLES = 64
+SAVE_SECONDS = 600
+CLOCK_SKEW = 300  # pub_ts this far in the future is a bad timestamp, not a fast detection
+
+
+def _bounds():
+    # Bucket upper bounds in seconds, 20% apart from 1 s to a week; one
+    # overflow bucket past the last
+    out, b = [], 1.0
+    while b < 7 * 86400:
+        out.append(round(b, 1))
+        b *= 1.2
+    return out
+
+
+BOUNDS = _bounds()
+
+
+def parse_slo(spec):
+    spec = spec or {}
+    if not isinstance(spec, dict):
+        raise ValueError(f"latency_slo must be an object: {spec!r}")
+    p = float(spec.get("percentile", 95))
+    seconds = float(spec.get("seconds", 90))
+    stage = spec.get("stage", "detect")
+    if not 0 < p < 100 or seconds <= 0 or stage not in STAGES:
+        raise ValueError(f"latency_slo needs 0 < percentile < 100, seconds > 0, stage in {', '.join(STAGES)}: {spec!r}")
+    return {"percentile": p, "seconds": seconds, "stage": stage}
+
+
+def hist_percentile(counts, p):
+    # Upper bound of the bucket holding the p-th percentile (at most 20% high)
+    total = sum(counts)
+    if not total:
+        return None
+    rank = math.ceil(total * p / 100)
+    acc = 0
+    for i, c in enumerate(counts):
+        acc += c
+        if acc >= rank:
+            return BOUNDS[min(i, len(BOUNDS) - 1)]
+    return BOUNDS[-1]
+
+
+def sample_percentile(values, p):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, math.ceil(len(ordered) * p / 100) - 1)]
+
+
+class LatencyTracker:
+    # Time from a creator posting (pub_ts) to the unread entry existing
+    # ("detect") and to the first notification that included it ("notify").
+    # Global histograms are kept per hour for a rolling window; per UID only
+    # the most recent samples.
+    def __init__(self, path=None, slo=None, window_hours: int = WINDOW_HOURS):
+        self.path = path
+        self.slo = parse_slo(slo)
+        self.window = window_hours * SLOT_SECONDS
+        self.lock = threading.Lock()
+        # [slot start, {stage: bucket counts}, within SLO, SLO samples]
+        self.slots = deque()
+        self.by_uid = {}  # uid -> recent detect latencies
+        self.pending = {}  # entry id -> record waiting for a notification
+        self.recent = deque(maxlen=RECENT_MAX)
+        self.detections = 0
+        self.skipped = 0
+        self.dirty = False
+        self.saved_at = time.time()
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("bounds") == len(BOUNDS) and data.get("slo") == self.slo:
+                # Otherwise the bucket layout or the SLO counted changed; start over
+                self.slots = deque(data.get("slots", []))
+            self.by_uid = {k: deque(v, maxlen=UID_SAMPLES) for k, v in data.get("by_uid", {}).items()}
+        except Exception as e:
+            log(f"[latency] failed to load {self.path}: {e}", "error")
+
+    def save(self):
+        if not self.path:
+            return
+        with self.lock:
+            self._expire(time.time())
+            body = json.dumps(
+                {
+                    "bounds": len(BOUNDS),
+                    "slo": self.slo,
+                    "slots": list(self.slots),
+                    "by_uid": {k: list(v) for k, v in self.by_uid.items()},
+                },
+                separators=(",", ":"),
+            )
+            self.dirty = False
+        try:
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(body)
+            os.replace(tmp, self.path)
+            self.saved_at = time.time()
+        except OSError as e:
+            log(f"[latency] failed to save {self.path}: {e}", "error")
+
+    def detected(self, uid: str, entry_id: str, pub_ts, fetched_at: float, added_at: float):
+        if not pub_ts or pub_ts > added_at + CLOCK_SKEW:
+            self.skipped += 1
+            return None
+        latency = max(0.0, added_at - pub_ts)
+        rec = {
+            "uid": uid,
+            "id": entry_id,
+            "pub": int(pub_ts),
+            "fetched": round(fetched_at, 3),
+            "added": round(added_at, 3),
+            "notified": None,
+        }
+        with self.lock:
+            self.recent.append(rec)
+            self.pending[entry_id] = rec
+            while len(self.pending) > RECENT_MAX:
+                self.pending.pop(next(iter(self.pending)))
+            self.detections += 1
+            self._add("detect", latency, added_at)
+            self.by_uid.setdefault(uid, deque(maxlen=UID_SAMPLES)).append(round(latency, 1))
+        if self.dirty and time.time() - self.saved_at >= SAVE_SECONDS:
+            self.save()
+        return latency
+
+    def notified(self, at: float):
+        # Every notification lists all unread UIDs, so it covers every pending detection
+        with self.lock:
+            for rec in self.pending.values():
+                rec["notified"] = round(at, 3)
+                self._add("notify", max(0.0, at - rec["pub"]), at)
+            self.pending.clear()
+
+    def _add(self, stage: str, latency: float, at: float):
+        start = int(at // SLOT_SECONDS) * SLOT_SECONDS
+        if not self.slots or self.slots[-1][0] < start:
+            self.slots.append([start, {s: [0] * (len(BOUNDS) + 1) for s in STAGES}, 0, 0])
+            self._expire(at)
+        slot = self.slots[-1] if self.slots[-1][0] == start else self._find_slot(start)
+        if slot is None:
+            return
+        slot[1][stage][bisect_left(BOUNDS, latency)] += 1
+        if stage == self.slo["stage"]:
+            slot[3] += 1
+            if latency <= self.slo["seconds"]:
+                slot[2] += 1
+        self.dirty = True
+
+    def _find_slot(self, start):
+        # A late sample for an earlier hour (clock adjusted): count it there if kept
+        for slot in self.slots:
+            if slot[0] == start:
+                return slot
+        return None
+
+    def _expire(self, now: float):
+        while self.slots and self.slots[0][0] + SLOT_SECONDS <= now - self.window:
+            self.slots.popleft()
+
+    def report(self, uid: str = None, now: float = None, top: int = 10):
+        now = now or time.time()
+        with self.lock:
+            self._expire(now)
+            merged = {s: [0] * (len(BOUNDS) + 1) for s in STAGES}
+            good = total = 0
+            for _, counts, g, t in self.slots:
+                for s in STAGES:
+                    merged[s] = [a + b for a, b in zip(merged[s], counts[s])]
+                good += g
+                total += t
+            recent = [dict(r) for r in self.recent if uid is None or r["uid"] == uid]
+            per_uid = {k: list(v) for k, v in self.by_uid.items() if uid is None or k == uid}
+        slo = self.slo
+        ratio = good / total if total else None
+        allowed_bad = total * (1 - slo["percentile"] / 100)
+        out = {
+            "window_hours": self.window // SLOT_SECONDS,
+            "stages": {s: self._summary(merged[s]) for s in STAGES},
+            "slo": {
+                "target": f"p{slo['percentile']:g} {slo['stage']} latency <= {slo['seconds']:g}s",
+                "samples": total,
+                "within": good,
+                "within_ratio": round(ratio, 4) if ratio is not None else None,
+                "met": ratio is None or ratio >= slo["percentile"] / 100,
+                "error_budget_left": round(1 - (total - good) / allowed_bad, 3) if allowed_bad else None,
+            },
+            "breakdown": self._breakdown(recent),
+        }
+        rows = [
+            {
+                "uid": k,
+                "samples": len(v),
+                "p50": sample_percentile(v, 50),
+                "p95": sample_percentile(v, 95),
+                "max": max(v),
+            }
+            for k, v in per_uid.items()
+            if v
+        ]
+        rows.sort(key=lambda r: r["p95"], reverse=True)
+        out["uids"] = rows[:top] if uid is None else rows
+        if uid is not None:
+            out["recent"] = recent[-50:]
+        return out
+
+    def _summary(self, counts):
+        n = sum(counts)
+        return {
+            "count": n,
+            **{f"p{p}": hist_percentile(counts, p) for p in (50, 90, 95, 99)},
+            "over_7d": counts[-1],
+        }
+
+    def _breakdown(self, recent):
+        # Median time spent in each step, over the recent detections
+        steps = {"posted_to_fetched": [], "fetched_to_added": [], "added_to_notified": []}
+        for r in recent:
+            steps["posted_to_fetched"].append(r["fetched"] - r["pub"])
+            steps["fetched_to_added"].append(r["added"] - r["fetched"])
+            if r["notified"] is not None:
+                steps["added_to_notified"].append(r["notified"] - r["added"])
+        return {k: round(sample_percentile(v, 50), 3) if v else None for k, v in steps.items()}
+
+    def stats(self):
+        with self.lock:
+            return {
+                "detections": self.detections,
+                "pending_notify": len(self.pending),
+                "skipped": self.skipped,
+            }
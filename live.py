@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+import threading
+import time
+
+import requests
+
+from applog import log
+
+LIVE_STATUS_URL = "https://api.live.bilibili.com/room/v1/Room/get_status_info_by_uids"
+LIVE_BATCH = 50
+LIVE_POLL_SECONDS = 60
+REQUEST_TIMEOUT = (3.05, 10)
+STATUS_LIVE = 1  # 0 offline, 1 live, 2 replaying recorded videos
+
+
+def fetch_live_status(session: requests.Session, uids):
+    # One request for many UIDs: {uid: {"live_status", "room_id", "title", "live_time", ...}}
+    r = session.post(
+        LIVE_STATUS_URL,
+        json={"uids": [int(u) for u in uids]},
+        headers={"Referer": "https://live.bilibili.com/"},
+        timeout=REQUEST_TIMEOUT,
+    )
+    r.raise_for_status()
+    data = r.json()
+    if data.get("code") != 0:
+        raise RuntimeError(f"Fetch live status failed: {data}")
+    return {str(k): v for k, v in (data.get("data") or {}).items() if isinstance(v, dict)}
+
+
+def live_event_id(info: dict) -> str:
+    return f"live-{info.get('room_id')}-{info.get('live_time') or 0}"
+
+
+class LiveMonitor:
+    # Polls live status for all tracked UIDs in batches on its own thread and
+    # turns offline->live transitions into "live" unread entries.
+    def __init__(self, session, state, get_uids, notifier=None, interval: int = LIVE_POLL_SECONDS,
+                 batch: int = LIVE_BATCH, breaker=None):
+        self.session = session
+        self.state = state
+        self.get_uids = get_uids
+        # notifier(title, message, url)
+        self.notifier = notifier
+        self.interval = interval
+        self.batch = batch
+        self.breaker = breaker
+        self.status = {}  # uid -> (live_status, event id)
+        self.requests = 0
+        self.transitions = 0
+        self._stop = threading.Event()
+
+    def check_once(self):
+        if self.breaker and self.breaker.is_open:
+            return
+        uids = [u for u in self.get_uids() if str(u).isdigit()]
+        for i in range(0, len(uids), self.batch):
+            chunk = uids[i : i + self.batch]
+            try:
+                self.requests += 1
+                infos = fetch_live_status(self.session, chunk)
+            except Exception as e:
+                log(f"[live] status fetch failed ({len(chunk)} uids): {e}", "warning")
+                continue
+            for uid in chunk:
+                info = infos.get(uid)
+                if info is not None:
+                    self._update(uid, info)
+
+    def _update(self, uid: str, info: dict):
+        live = info.get("live_status") == STATUS_LIVE
+        event_id = live_event_id(info) if live else None
+        prev = self.status.get(uid)
+        self.status[uid] = (live, event_id)
+        if prev is None:
+            return  # first observation is only a baseline
+        was_live, prev_event = prev
+        if live and not was_live:
+            self._went_live(uid, info, event_id)
+        elif was_live and not live and prev_event:
+            # Stream is over; the live entry is no longer actionable
+            self.state.remove_unread(uid, [prev_event])
+            log(f"[live] uid={uid} ended", uid=uid)
+
+    def _went_live(self, uid: str, info: dict, event_id: str):
+        self.transitions += 1
+        room_id = info.get("room_id")
+        title = info.get("title") or ""
+        url = f"https://live.bilibili.com/{room_id}"
+        if info.get("uname") and not self.state.get_name(uid):
+            self.state.set_name(uid, info["uname"])
+        self.state.add_unread_entries(
+            uid,
+            [
+                {
+                    "id": event_id,
+                    "ts": int(time.time()),
+                    "type": "live",
+                    "title": title,
+                    "url": url,
+                }
+            ],
+        )
+        name = self.state.get_name(uid) or uid
+        log(f"[live] uid={uid} started room={room_id} title={title}", uid=uid)
+        if self.notifier:
+            self.notifier("Bilibili 开播提醒", f"{name} 开播了：{title}", url)
+
+    def start(self):
+        def run():
+            while not self._stop.is_set():
+                try:
+                    self.check_once()
+                except Exception as e:
+                    log(f"[live] check failed: {e}", "error")
+                self._stop.wait(self.interval)
+
+        t = threading.Thread(target=run, daemon=True)
+        t.start()
+        return t
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        return {
+            "tracked": len(self.status),
+            "live": sum(1 for live, _ in self.status.values() if live),
+            "requests": self.requests,
+            "transitions": self.transitions,
+        }
@@ -1,9 +1,19 @@
 #!/usr/bin/env python3
+import argparse
+import atexit
+import base64
+import gzip
+import heapq
+import itertools
 import json
 import os
+import re
+import signal
 import sys
 import time
 import threading
+import zlib
+from collections import OrderedDict, deque, namedtuple
 from datetime import datetime
 from http.server import BaseHTTPRequestHandler, HTTPServer
 from urllib.parse import urlparse, parse_qs
@@ -11,6 +21,24 @@ from urllib.parse import urlparse, parse_qs
 import requests
 import qrcode
 
+from applog import LOGGER, log
+from archive import Archive
+from capture import RecordingSession
+from circuit import CircuitBreaker, http_probe, is_connection_error
+from clock import SYSTEM_CLOCK
+from control import CONTROL_SOCKET, ControlServer
+from egress import EgressPool
+from engagement import EngagementTracker
+from filters import compile_filter_rules
+from followings import FollowingsSync
+from images import ImageCache
+from latency import LatencyTracker
+from live import LiveMonitor
+from search_index import SearchIndex
+from snapshot import SnapshotWriter
+from verifier import Verifier
+from webhook import WebhookSink
+
 APP_NAME = "bilibiliMessage"
 APP_DISPLAY_NAME = "B站关注通知"
 APP_VERSION = "1.1.0"
@@ -24,10 +52,23 @@ COOKIE_FILE = os.path.join(APP_DIR, "cookies.json")
 CONFIG_FILE = os.path.join(APP_DIR, "config.json")
 STATE_FILE = os.path.join(APP_DIR, "state.json")
 TOKEN_FILE = os.path.join(APP_DIR, "token.txt")
+LOG_FILE = os.path.join(APP_DIR, "main.log")
+STATUS_FILE = os.path.join(APP_DIR, "status.bin")
 POLL_SECONDS = 60  # 1 minute
 SERVER_HOST = "127.0.0.1"
 SERVER_PORT = 8765
 NOTIFIER_BIN = None
+REQUEST_TIMEOUT = (3.05, 10)  # connect, read: fail fast when offline
+VC_INTERVAL_SECONDS = 600
+VC_SPECIAL_TTL = 7 * 86400  # keep polling vc for UIDs that recently had vc-only posts
+VC_DELIVERED_MAX = 50
+FORWARD_WINDOW_SECONDS = 72 * 3600
+FORWARD_INDEX_MAX = 20000
+GAP_SECONDS = 120  # wall-clock time unaccounted for by the monotonic clock: the machine slept
+CATCHUP_RATE = 2.0  # requests/s while catching up after a sleep
+CATCHUP_MAX_PAGES = 5
+PAGE_DELAY_SECONDS = 0.5
+SNAPSHOT_HEARTBEAT_SECONDS = 30  # status.bin is rewritten at least this often while polling
 
 USER_AGENT = (
     "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) "
@@ -36,11 +77,6 @@ USER_AGENT = (
 )
 
 
-def log(msg: str):
-    ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    print(f"[{ts}] {msg}")
-
-
 def load_config():
     os.makedirs(APP_DIR, exist_ok=True)
     if not os.path.exists(CONFIG_FILE):
@@ -53,7 +89,7 @@ def load_config():
                 fdst.write(content)
             log(f"Created {CONFIG_FILE} from {project_cfg}")
         else:
-            log(f"Missing {CONFIG_FILE}. Create it from project config.json")
+            log(f"Missing {CONFIG_FILE}. Create it from project config.json", "error")
             sys.exit(1)
     with open(CONFIG_FILE, "r", encoding="utf-8") as f:
         return json.load(f)
@@ -120,12 +156,12 @@ def notify(
                 cmd.extend(["-sender", sender])
             res = subprocess.run(cmd, check=False, capture_output=True, text=True)
             if res.returncode != 0:
-                log(f"terminal-notifier failed: {res.stderr.strip()}")
+                log(f"terminal-notifier failed: {res.stderr.strip()}", "warning")
         else:
             script = f'display notification \"{message}\" with title \"{title}\"'
             subprocess.run(["/usr/bin/osascript", "-e", script], check=False)
     except Exception as e:
-        log(f"Failed to send notification: {e}")
+        log(f"Failed to send notification: {e}", "error")
 
 
 def show_qr_in_terminal(url: str):
@@ -170,7 +206,7 @@ def login_via_qr(session: requests.Session, config: dict):
 
             subprocess.run(["/usr/bin/open", png_path], check=False)
     except Exception as e:
-        log(f"Failed to save QR PNG: {e}")
+        log(f"Failed to save QR PNG: {e}", "warning")
     log(f"Or copy this URL into a QR generator if needed: {url}")
 
     log("Waiting for scan confirmation...")
@@ -212,11 +248,22 @@ def is_logged_in(session: requests.Session) -> bool:
 
 
 def fetch_latest_items(session: requests.Session, uid: str):
+    return fetch_items_page(session, uid)[0]
+
+
+def fetch_items_page(session: requests.Session, uid: str, offset: str = ""):
+    # (items, offset of the next older page, has_more)
+    return parse_items_page(fetch_feed_body(session, uid, offset), uid)
+
+
+def fetch_feed_body(session: requests.Session, uid: str, offset: str = "") -> bytes:
     params = {
         "host_mid": uid,
         "timezone_offset": -480,
         "features": "itemOpusStyle",
     }
+    if offset:
+        params["offset"] = offset
     r = session.get(
         "https://api.bilibili.com/x/polymer/web-dynamic/v1/feed/space",
         params=params,
@@ -224,36 +271,193 @@ def fetch_latest_items(session: requests.Session, uid: str):
             "User-Agent": USER_AGENT,
             "Referer": f"https://space.bilibili.com/{uid}/dynamic",
         },
-        timeout=10,
+        timeout=REQUEST_TIMEOUT,
     )
     r.raise_for_status()
-    data = r.json()
+    return r.content
+
+
+def parse_items_page(raw: bytes, uid: str):
+    data = json.loads(raw)
     if data.get("code") != 0:
         raise RuntimeError(f"Fetch dynamic failed for {uid}: {data}")
-    return data.get("data", {}).get("items", [])
+    body = data.get("data") or {}
+    return body.get("items") or [], str(body.get("offset") or ""), bool(body.get("has_more"))
 
 
-def fetch_latest_ids_vc(session: requests.Session, uid: str, limit: int = 20):
+_DIGEST_RE = re.compile(rb'"(?:id_str|pub_ts)":\s*"?(\d+)')
+
+
+def body_digest(raw: bytes):
+    # Ids and publish times in page order, forwarded originals included:
+    # like/comment/forward counts change between polls, these only when the
+    # page does. A regex, so a match costs no JSON decode. Cheap, not
+    # collision-proof: a false match only delays a new post until the page
+    # changes again, since the next decode still diffs from last_seen.
+    # None (never matches) for bodies without items, e.g. errors.
+    keys = _DIGEST_RE.findall(raw)
+    if not keys:
+        return None
+    return len(keys), zlib.crc32(b",".join(keys))
+
+
+def fetch_latest_cards_vc(session: requests.Session, uid: str, limit: int = 20):
     # Legacy endpoint sometimes includes special dynamics (e.g., charge-only)
     params = {"host_uid": uid, "offset_dynamic_id": 0, "need_top": 1}
     r = session.get(
         "https://api.vc.bilibili.com/dynamic_svr/v1/dynamic_svr/space_history",
         params=params,
         headers={"User-Agent": USER_AGENT},
-        timeout=10,
+        timeout=REQUEST_TIMEOUT,
     )
     r.raise_for_status()
     data = r.json()
     if data.get("code") != 0:
         raise RuntimeError(f"Fetch vc dynamic failed for {uid}: {data}")
     cards = data.get("data", {}).get("cards", []) or []
-    ids = []
+    out = []
     for c in cards[:limit]:
         desc = (c or {}).get("desc") or {}
-        did = desc.get("dynamic_id") or desc.get("dynamic_id_str")
+        did = desc.get("dynamic_id_str") or desc.get("dynamic_id")
         if did:
-            ids.append(str(did))
-    return ids
+            ts = desc.get("timestamp")
+            out.append((str(did), ts if isinstance(ts, int) else None))
+    return out
+
+
+def fetch_latest_ids_vc(session: requests.Session, uid: str, limit: int = 20):
+    return [did for did, _ in fetch_latest_cards_vc(session, uid, limit)]
+
+
+class VcPolicy:
+    # Decides when the secondary vc source is worth a request for a UID
+    def __init__(self, mode: str, interval: int, forced_uids=()):
+        self.mode = mode
+        self.interval = interval
+        self.forced = {str(x) for x in forced_uids}
+        self.special = {}  # uid -> last time vc found an id missing from the feed
+        self.last_fetch = {}
+        self.delivered = {}  # uid -> recent vc-only ids already added as unread
+        self.fetched = 0
+        self.skipped = 0
+
+    def reason(self, uid: str, items, last_seen, last_seen_ts, now: float):
+        if self.mode == "always":
+            return "always"
+        if uid in self.forced:
+            return "forced"
+        if uid in self.special and now - self.special[uid] < VC_SPECIAL_TTL:
+            return "special"
+        feed = [it for it in items if isinstance(it, dict) and get_item_tag(it) != "置顶"]
+        if last_seen and feed:
+            if last_seen not in {it.get("id_str") for it in feed}:
+                return "anchor"
+            newest_ts = get_item_pub_ts(feed[0])
+            if last_seen_ts and newest_ts and newest_ts < last_seen_ts:
+                return "pub_ts"
+        if now - self.last_fetch.get(uid, 0) >= self.interval:
+            return "interval"
+        return None
+
+    def should_fetch(self, uid: str, items, last_seen, last_seen_ts, now: float):
+        reason = self.reason(uid, items, last_seen, last_seen_ts, now)
+        if reason:
+            self.fetched += 1
+            self.last_fetch[uid] = now
+        else:
+            self.skipped += 1
+        return reason
+
+    def filter_delivered(self, uid: str, ids):
+        seen = set(self.delivered.get(uid, ()))
+        return [x for x in ids if x not in seen]
+
+    def record_vc_only(self, uid: str, ids, now: float):
+        if not ids:
+            return
+        self.special[uid] = now
+        recent = self.delivered.setdefault(uid, deque(maxlen=VC_DELIVERED_MAX))
+        recent.extend(ids)
+
+
+def build_vc_policy(config: dict):
+    if not config.get("use_vc_api", False):
+        return None
+    vc_mode = str(config.get("vc_policy", "smart"))
+    if vc_mode not in ("smart", "always"):
+        raise ValueError("Invalid vc_policy in config.json. Use smart or always.")
+    return VcPolicy(
+        vc_mode,
+        int(config.get("vc_interval_seconds", VC_INTERVAL_SECONDS)),
+        config.get("vc_uids", []) or [],
+    )
+
+
+def get_orig_id(item):
+    # Original dynamic id of a forward, else None
+    if not isinstance(item, dict) or item.get("type") != "DYNAMIC_TYPE_FORWARD":
+        return None
+    orig = item.get("orig")
+    if isinstance(orig, dict) and orig.get("id_str"):
+        return str(orig["id_str"])
+    return None
+
+
+class ForwardIndex:
+    # Original dynamic id -> the unread entry that represents it, for a
+    # time window and bounded in size (least recently registered dropped)
+    def __init__(self, window: int = FORWARD_WINDOW_SECONDS, max_entries: int = FORWARD_INDEX_MAX):
+        self.window = window
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # orig id -> (registered at, uid, entry id)
+        self.collapsed = 0
+
+    def _expire(self, now: float):
+        while self.entries:
+            key, (ts, _, _) = next(iter(self.entries.items()))
+            if now - ts <= self.window and len(self.entries) <= self.max_entries:
+                break
+            self.entries.popitem(last=False)
+
+    def lookup(self, orig_id: str, now: float):
+        self._expire(now)
+        hit = self.entries.get(orig_id)
+        return (hit[1], hit[2]) if hit else None
+
+    def register(self, orig_id: str, uid: str, entry_id: str, now: float):
+        self.entries[orig_id] = (now, uid, entry_id)
+        self.entries.move_to_end(orig_id)
+        self._expire(now)
+
+    def rebuild(self, unread_by_uid, now: float):
+        # After a restart: every unread entry still represents its original
+        for uid, entries in unread_by_uid.items():
+            for e in entries:
+                ts = e.get("ts") or now
+                if now - ts <= self.window:
+                    self.entries[e.get("orig") or str(e.get("id"))] = (ts, uid, str(e.get("id")))
+        self.entries = OrderedDict(sorted(self.entries.items(), key=lambda kv: kv[1][0]))
+        self._expire(now)
+
+
+def merge_vc_ids(items, new_ids, vc_cards, last_seen):
+    # Returns (merged ids newest-first by pub_ts, vc-only ids). vc cards are
+    # only trusted up to the last_seen anchor.
+    feed_ts = {}
+    for it in items:
+        if isinstance(it, dict) and it.get("id_str"):
+            feed_ts[it["id_str"]] = get_item_pub_ts(it) or 0
+    merged = {x: feed_ts.get(x, 0) for x in new_ids}
+    vc_only = []
+    for xid, ts in vc_cards:
+        if xid == last_seen:
+            break
+        if xid in feed_ts or xid in merged:
+            continue
+        merged[xid] = ts or 0
+        vc_only.append(xid)
+    ordered = sorted(merged, key=lambda x: (merged[x], len(x), x), reverse=True)
+    return ordered, vc_only
 
 
 def fetch_user_name(session: requests.Session, uid: str):
@@ -261,7 +465,7 @@ def fetch_user_name(session: requests.Session, uid: str):
         "https://api.bilibili.com/x/space/acc/info",
         params={"mid": uid},
         headers={"User-Agent": USER_AGENT},
-        timeout=10,
+        timeout=REQUEST_TIMEOUT,
     )
     r.raise_for_status()
     data = r.json()
@@ -298,6 +502,92 @@ def get_item_pub_ts(item):
     return None
 
 
+def get_item_text(item):
+    if not isinstance(item, dict):
+        return ""
+    modules = item.get("modules") or {}
+    dyn = modules.get("module_dynamic") or {}
+    parts = []
+    desc = dyn.get("desc") or {}
+    if desc.get("text"):
+        parts.append(desc["text"])
+    major = dyn.get("major") or {}
+    for key in ("archive", "article", "opus", "common", "pgc", "music", "courses"):
+        sub = major.get(key)
+        if not isinstance(sub, dict):
+            continue
+        for field in ("title", "desc"):
+            if sub.get(field):
+                parts.append(str(sub[field]))
+        summary = sub.get("summary") or {}
+        if summary.get("text"):
+            parts.append(summary["text"])
+    return "\n".join(parts)
+
+
+def get_item_content(item):
+    # What counts as an edit: the text and the cover image
+    cover, _ = get_item_images(item)
+    return f"{get_item_text(item)}\n{cover or ''}"
+
+
+def get_item_images(item):
+    # (cover, avatar) urls, either may be None
+    if not isinstance(item, dict):
+        return None, None
+    modules = item.get("modules") or {}
+    face = (modules.get("module_author") or {}).get("face")
+    major = (modules.get("module_dynamic") or {}).get("major") or {}
+    cover = None
+    for key in ("archive", "pgc", "common", "live", "ugc_season", "courses"):
+        sub = major.get(key)
+        if isinstance(sub, dict) and sub.get("cover"):
+            cover = sub["cover"]
+            break
+    if not cover:
+        covers = (major.get("article") or {}).get("covers") or []
+        pics = (major.get("opus") or {}).get("pics") or []
+        draws = (major.get("draw") or {}).get("items") or []
+        if covers:
+            cover = covers[0]
+        elif pics and isinstance(pics[0], dict):
+            cover = pics[0].get("url")
+        elif draws and isinstance(draws[0], dict):
+            cover = draws[0].get("src")
+    return cover or None, face or None
+
+
+def normalize_item(uid: str, item, fetched_at: float):
+    if not isinstance(item, dict) or not item.get("id_str"):
+        return None
+    return {
+        "id": item["id_str"],
+        "uid": uid,
+        "ts": get_item_pub_ts(item) or int(fetched_at),
+        "type": item.get("type"),
+        "text": get_item_text(item),
+        "fetched": int(fetched_at),
+    }
+
+
+def index_items(index: SearchIndex, uid: str, items):
+    docs = []
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        item_id = item.get("id_str")
+        if not item_id or index.contains(item_id):
+            continue
+        docs.append((item_id, uid, get_item_pub_ts(item) or 0, get_item_text(item)))
+    if docs:
+        index.add(docs)
+
+
+def item_allowed(rules, uid: str, item: dict) -> bool:
+    # Filtered items still count for last_seen; they just never become unread
+    return rules.allows(uid, item.get("type"), lambda: get_item_text(item))
+
+
 def latest_non_pinned_id(items):
     for item in items:
         tag = get_item_tag(item)
@@ -316,7 +606,33 @@ def latest_non_pinned_id_ts(items):
     return None, None
 
 
-def collect_new_ids(items, last_seen, min_ts=None):
+def reaches_anchor(items, last_seen, last_seen_ts) -> bool:
+    # True once a page contains last_seen or anything not newer than it
+    for item in items:
+        if not isinstance(item, dict) or get_item_tag(item) == "置顶":
+            continue
+        if item.get("id_str") == last_seen:
+            return True
+        pub_ts = get_item_pub_ts(item)
+        if pub_ts and pub_ts <= last_seen_ts:
+            return True
+    return False
+
+
+def post_rate(items, now: float):
+    # Posts/s implied by a page: non-pinned items over the time they span
+    stamps = [
+        get_item_pub_ts(it)
+        for it in items
+        if isinstance(it, dict) and get_item_tag(it) != "置顶"
+    ]
+    stamps = [t for t in stamps if t]
+    if not stamps:
+        return 0.0
+    return len(stamps) / max(now - min(stamps), POLL_SECONDS)
+
+
+def collect_new_ids(items, last_seen, min_ts=None, rules=None, uid=None):
     new_ids = []
     if not last_seen:
         # First run: return all non-pinned dynamics
@@ -331,6 +647,8 @@ def collect_new_ids(items, last_seen, min_ts=None):
                 pub_ts = get_item_pub_ts(item)
                 if pub_ts and pub_ts < min_ts:
                     break
+            if rules and not item_allowed(rules, uid, item):
+                continue
             if item_id:
                 new_ids.append(item_id)
         return new_ids
@@ -351,6 +669,8 @@ def collect_new_ids(items, last_seen, min_ts=None):
             pub_ts = get_item_pub_ts(item)
             if pub_ts and pub_ts < min_ts:
                 break
+        if rules and not item_allowed(rules, uid, item):
+            continue
         if item_id:
             new_ids.append(item_id)
     
@@ -362,15 +682,35 @@ def collect_new_ids(items, last_seen, min_ts=None):
     return new_ids
 
 
+# One immutable version of the state. Writers never modify a published view:
+# they copy the one mapping they change (per-UID entry tuples are replaced,
+# not mutated) and swap in a new view, so readers just take `state.view`.
+StateView = namedtuple("StateView", "version unread last_seen last_seen_ts names")
+
+
 class ReadState:
-    def __init__(self, persist: bool):
+    def __init__(self, persist: bool, clock=None):
+        self.clock = clock or SYSTEM_CLOCK
+        # Serializes writers only; readers never take it
         self.lock = threading.Lock()
-        self.unread_by_uid = {}
-        self.last_seen_by_uid = {}
-        self.last_seen_ts_by_uid = {}
-        self.names_by_uid = {}
+        self._save_lock = threading.Lock()
+        self.view = StateView(0, {}, {}, {}, {})
         self.token = os.urandom(16).hex()
         self.persist = persist
+        # SnapshotWriter for status.bin, refreshed on every save
+        self.snapshot = None
+        self._published = None
+        self._published_at = 0.0
+        self._saved = None
+
+    @property
+    def version(self):
+        # Bumped on every mutation; used as the HTTP ETag for state views
+        return self.view.version
+
+    def _commit(self, **changes):
+        # Caller holds self.lock
+        self.view = self.view._replace(version=self.view.version + 1, **changes)
 
     def load(self):
         if not self.persist or not os.path.exists(STATE_FILE):
@@ -378,69 +718,143 @@ class ReadState:
         try:
             with open(STATE_FILE, "r", encoding="utf-8") as f:
                 data = json.load(f)
-            self.last_seen_by_uid = data.get("last_seen", {})
-            self.unread_by_uid = data.get("unread", {})
-            self.names_by_uid = data.get("names", {})
-            self.last_seen_ts_by_uid = data.get("last_seen_ts", {})
+            self.restore(data)
+        except Exception as e:
+            log(f"Failed to load state: {e}", "error")
+
+    def restore(self, data: dict):
+        # Replace everything with a state.json-shaped dict
+        with self.lock:
+            self._commit(
+                unread={u: tuple(v) for u, v in (data.get("unread") or {}).items() if v},
+                last_seen=dict(data.get("last_seen") or {}),
+                last_seen_ts=dict(data.get("last_seen_ts") or {}),
+                names=dict(data.get("names") or {}),
+            )
+
+    def publish(self, force: bool = False):
+        if not self.snapshot:
+            return
+        try:
+            with self._save_lock:
+                v = self.view
+                if v.version == self._published and not force:
+                    return
+                rows = [
+                    (uid, v.names.get(uid), len(v.unread.get(uid, ())), v.last_seen_ts.get(uid))
+                    for uid in v.last_seen_ts.keys() | v.unread.keys() | v.names.keys()
+                ]
+                self.snapshot.write(v.version, rows)
+                self._published = v.version
+                self._published_at = time.time()
         except Exception as e:
-            log(f"Failed to load state: {e}")
+            log(f"Failed to publish status snapshot: {e}", "error")
+
+    def heartbeat(self):
+        # Readers take status.bin's written_at as proof the monitor is alive,
+        # so it is rewritten now and then even when nothing changed
+        if self.snapshot and time.time() - self._published_at >= SNAPSHOT_HEARTBEAT_SECONDS:
+            self.publish(force=True)
 
     def save(self):
+        self.publish()
         if not self.persist:
             return
         try:
             os.makedirs(APP_DIR, exist_ok=True)
-            data = {
-                "last_seen": self.last_seen_by_uid,
-                "unread": self.unread_by_uid,
-                "names": self.names_by_uid,
-                "last_seen_ts": self.last_seen_ts_by_uid,
-            }
-            with open(STATE_FILE, "w", encoding="utf-8") as f:
-                json.dump(data, f, ensure_ascii=True, indent=2)
+            with self._save_lock:
+                # Always the newest view; saves that queued behind it have nothing left to write
+                v = self.view
+                if v.version == self._saved:
+                    return
+                body = json.dumps(
+                    {
+                        "last_seen": v.last_seen,
+                        "unread": v.unread,
+                        "names": v.names,
+                        "last_seen_ts": v.last_seen_ts,
+                    },
+                    ensure_ascii=True,
+                    indent=2,
+                )
+                # Write-then-rename: a crash mid-save never leaves a truncated state.json
+                tmp = STATE_FILE + ".tmp"
+                with open(tmp, "w", encoding="utf-8") as f:
+                    f.write(body)
+                os.replace(tmp, STATE_FILE)
+                self._saved = v.version
         except Exception as e:
-            log(f"Failed to save state: {e}")
+            log(f"Failed to save state: {e}", "error")
 
     def mark_read(self, uid: str):
+        self.mark_read_batch(uids=[uid])
+
+    def mark_read_batch(self, uids=None, ids=None, before_ts=None, all_uids=False):
+        # One lock, one save. `uids` (or all_uids) picks the scope; within it,
+        # `ids` / `before_ts` select entries, otherwise the whole UID is cleared.
+        # Returns the number of unread entries removed.
+        if not (uids or ids or before_ts or all_uids):
+            return 0
+        ids = set(str(x) for x in ids or [])
+        removed = 0
         with self.lock:
-            if uid in self.unread_by_uid:
-                del self.unread_by_uid[uid]
-            # Update last_seen to the latest dynamic when marking as read
-            # This prevents duplicate notifications
-            if uid in self.last_seen_by_uid:
-                # Keep the existing last_seen ID
-                pass
+            unread = dict(self.view.unread)
+            scope = list(unread) if all_uids or not uids else [u for u in uids if u in unread]
+            for uid in scope:
+                current = unread[uid]
+                if ids or before_ts:
+                    kept = tuple(
+                        x
+                        for x in current
+                        if str(x.get("id")) not in ids and not (before_ts and x.get("ts", 0) < before_ts)
+                    )
+                else:
+                    kept = ()
+                removed += len(current) - len(kept)
+                if kept:
+                    unread[uid] = kept
+                else:
+                    del unread[uid]
+            if not removed:
+                return 0
+            self._commit(unread=unread)
         self.save()
+        return removed
 
     def set_last_seen(self, uid: str, dynamic_id: str, pub_ts: int = None):
         with self.lock:
-            self.last_seen_by_uid[uid] = dynamic_id
-            if pub_ts:
-                self.last_seen_ts_by_uid[uid] = int(pub_ts)
-            else:
-                # Use current time as fallback if no timestamp available
-                self.last_seen_ts_by_uid[uid] = int(time.time())
+            v = self.view
+            # Use current time as fallback if no timestamp available
+            ts = int(pub_ts) if pub_ts else int(self.clock.time())
+            self._commit(
+                last_seen={**v.last_seen, uid: dynamic_id},
+                last_seen_ts={**v.last_seen_ts, uid: ts},
+            )
         self.save()
 
     def get_last_seen(self, uid: str):
-        with self.lock:
-            return self.last_seen_by_uid.get(uid)
+        return self.view.last_seen.get(uid)
 
     def get_last_seen_ts(self, uid: str):
-        with self.lock:
-            return self.last_seen_ts_by_uid.get(uid)
+        return self.view.last_seen_ts.get(uid)
 
     def add_unread(self, uid: str, ids):
         if not ids:
             return
+        now = int(self.clock.time())
+        self.add_unread_entries(uid, [{"id": x, "ts": now} for x in ids])
+
+    def add_unread_entries(self, uid: str, entries):
+        # entries: dicts with at least "id" and "ts"; extra keys (type, title,
+        # url) are kept and surface in the timeline API
+        if not entries:
+            return
         with self.lock:
-            current = self.unread_by_uid.get(uid, [])
-            now = int(time.time())
-            current.extend([{"id": x, "ts": now} for x in ids])
+            v = self.view
             # de-dup by id while preserving order
             seen = set()
             deduped = []
-            for x in current:
+            for x in itertools.chain(v.unread.get(uid, ()), entries):
                 if not isinstance(x, dict):
                     continue
                 xid = x.get("id")
@@ -448,35 +862,234 @@ class ReadState:
                     continue
                 seen.add(xid)
                 deduped.append(x)
-            self.unread_by_uid[uid] = deduped
+            self._commit(unread={**v.unread, uid: tuple(deduped)})
         self.save()
 
-    def get_unread_uids(self):
+    def _replace_entry(self, uid: str, entry_id: str, update):
+        # update(entry) -> new entry, or None to leave it; False if the entry is gone
         with self.lock:
-            return list(self.unread_by_uid.keys())
+            v = self.view
+            current = v.unread.get(uid, ())
+            for i, e in enumerate(current):
+                if e.get("id") == entry_id:
+                    break
+            else:
+                return False
+            new = update(e)
+            if new is None:
+                return True
+            self._commit(unread={**v.unread, uid: current[:i] + (new,) + current[i + 1 :]})
+        self.save()
+        return True
+
+    def add_reposter(self, uid: str, entry_id: str, reposter: dict):
+        # Attach a forward to an existing unread entry; False if it is gone
+        def update(e):
+            reposters = e.get("reposters", [])
+            if any(r.get("id") == reposter.get("id") for r in reposters):
+                return None
+            return dict(e, reposters=reposters + [reposter])
+
+        return self._replace_entry(uid, entry_id, update)
+
+    def update_unread_entry(self, uid: str, entry_id: str, fields: dict):
+        # Merge fields into one unread entry; False if it is gone
+        return self._replace_entry(uid, entry_id, lambda e: dict(e, **fields))
+
+    def remove_unread(self, uid: str, ids):
+        if not ids:
+            return 0
+        return self.mark_read_batch(uids=[uid], ids=ids)
+
+    def get_unread_uids(self):
+        return list(self.view.unread)
 
     def get_unread_count(self, uid: str):
-        with self.lock:
-            return len(self.unread_by_uid.get(uid, []))
+        return len(self.view.unread.get(uid, ()))
 
     def set_name(self, uid: str, name: str):
         if not name:
             return
         with self.lock:
-            self.names_by_uid[uid] = name
+            v = self.view
+            if v.names.get(uid) == name:
+                return
+            self._commit(names={**v.names, uid: name})
         self.save()
 
     def get_name(self, uid: str):
-        with self.lock:
-            return self.names_by_uid.get(uid)
+        return self.view.names.get(uid)
 
     def get_unread_items(self, uid: str):
-        with self.lock:
-            return list(self.unread_by_uid.get(uid, []))
+        return list(self.view.unread.get(uid, ()))
+
+    def unread_snapshot(self):
+        # Unread tuples + names of one view; shared, never to be modified
+        v = self.view
+        return v.version, v.unread, v.names
+
+
+TIMELINE_FIELDS = ("id", "uid", "name", "ts", "url", "type", "title", "img", "face", "orig", "reposters", "edited")
+TIMELINE_DEFAULT_LIMIT = 50
+TIMELINE_MAX_LIMIT = 500
+GZIP_MIN_BYTES = 1024
+READ_BODY_MAX = 1024 * 1024
+
+
+def timeline_key(entry: dict, uid: str):
+    # Newest first; ids of equal length compare numerically as strings
+    entry_id = str(entry.get("id") or "")
+    return (int(entry.get("ts") or 0), len(entry_id), entry_id, uid)
+
+
+def iter_unread_desc(uid: str, items, before=None):
+    # add_unread appends in detection order, so ts never decreases along the
+    # list. Walk ts groups from the end and order each (small) group by id.
+    end = len(items)
+    while end > 0:
+        ts = int(items[end - 1].get("ts") or 0)
+        start = end - 1
+        while start > 0 and int(items[start - 1].get("ts") or 0) == ts:
+            start -= 1
+        if before is None or ts <= before[0]:
+            group = []
+            for entry in items[start:end]:
+                key = timeline_key(entry, uid)
+                if before is None or key < before:
+                    group.append((key, entry))
+            group.sort(key=lambda x: x[0], reverse=True)
+            yield from group
+        end = start
+
+
+def merge_unread_timeline(unread_by_uid: dict, before=None):
+    streams = [
+        iter_unread_desc(uid, items, before) for uid, items in unread_by_uid.items()
+    ]
+    return heapq.merge(*streams, key=lambda x: x[0], reverse=True)
+
+
+def encode_cursor(key) -> str:
+    raw = json.dumps([key[0], key[2], key[3]], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    pad = "=" * (-len(cursor) % 4)
+    ts, entry_id, uid = json.loads(base64.urlsafe_b64decode(cursor + pad))
+    entry_id = str(entry_id)
+    return (int(ts), len(entry_id), entry_id, str(uid))
+
+
+def build_timeline_page(unread_by_uid, names, limit, cursor=None, fields=None, uids=None):
+    before = decode_cursor(cursor) if cursor else None
+    if uids:
+        unread_by_uid = {u: unread_by_uid[u] for u in uids if u in unread_by_uid}
+    fields = fields or TIMELINE_FIELDS
+    page = list(itertools.islice(merge_unread_timeline(unread_by_uid, before), limit + 1))
+    out = []
+    for key, entry in page[:limit]:
+        uid = key[3]
+        row = dict(entry)
+        row["uid"] = uid
+        row["name"] = names.get(uid) or uid
+        row.setdefault("url", f"https://t.bilibili.com/{entry.get('id')}")
+        if "reposters" in row:
+            row["reposters"] = [dict(r, name=names.get(r["uid"]) or r["uid"]) for r in row["reposters"]]
+        out.append({f: row[f] for f in fields if f in row})
+    next_cursor = encode_cursor(page[limit - 1][0]) if len(page) > limit else None
+    return {
+        "items": out,
+        "next_cursor": next_cursor,
+        "total": sum(len(v) for v in unread_by_uid.values()),
+    }
+
+
+DASHBOARD_HTML = """<!doctype html>
+<html><head><meta charset="utf-8"><title>Unread</title>
+<style>
+body{font-family:-apple-system,sans-serif;margin:16px}
+.row{padding:4px 0;border-bottom:1px solid #eee}
+.meta{color:#888;font-size:12px}
+.face{width:24px;height:24px;border-radius:50%;vertical-align:middle;margin-right:6px}
+.cover{max-width:240px;max-height:160px;margin-top:4px}
+</style></head>
+<body><h3>Unread (<span id="total">0</span>)</h3>
+<p><a id="readall" href="#">Mark all as read</a></p>
+<div id="list"></div>
+<p><button id="more" hidden>Load more</button></p>
+<script>
+const token = new URLSearchParams(location.search).get("token") || "";
+const list = document.getElementById("list");
+const more = document.getElementById("more");
+let cursor = null;
+function fmt(ts) { return new Date(ts * 1000).toLocaleString(); }
+function row(it) {
+  const div = document.createElement("div");
+  div.className = "row";
+  const a = document.createElement("a");
+  a.href = it.url; a.target = "_blank";
+  a.textContent = it.type === "live" ? "🔴 " + it.name + " 直播中: " + (it.title || "") : it.name;
+  if (it.face) div.appendChild(thumb(it.face, "face"));
+  const meta = document.createElement("span");
+  meta.className = "meta";
+  meta.textContent = " uid " + it.uid + " · " + fmt(it.ts) + " ";
+  if (it.reposters) meta.textContent += "· 也被 " + it.reposters.map(r => r.name).join(", ") + " 转发 ";
+  if (it.edited) meta.textContent += "· 已编辑 " + fmt(it.edited) + " ";
+  const read = document.createElement("a");
+  read.href = "#";
+  read.textContent = "Mark read";
+  read.onclick = async (e) => {
+    e.preventDefault();
+    const data = await markRead({uids: [it.uid], ids: [it.id]});
+    if (data) div.remove();
+  };
+  div.append(a, meta, read);
+  if (it.img) { div.appendChild(document.createElement("br")); div.appendChild(thumb(it.img, "cover")); }
+  return div;
+}
+function thumb(src, cls) {
+  const img = document.createElement("img");
+  img.src = src + "?token=" + token; img.className = cls; img.loading = "lazy";
+  img.onerror = () => img.remove();
+  return img;
+}
+async function markRead(body) {
+  const r = await fetch("/api/read?token=" + token, {method: "POST", body: JSON.stringify(body)});
+  if (!r.ok) return null;
+  const data = await r.json();
+  const total = document.getElementById("total");
+  total.textContent = Math.max(0, Number(total.textContent) - data.removed);
+  return data;
+}
+async function load() {
+  let url = "/api/unread?token=" + token + "&limit=50";
+  if (cursor) url += "&cursor=" + cursor;
+  const r = await fetch(url);
+  if (!r.ok) { list.textContent = "Failed: " + r.status; return; }
+  const data = await r.json();
+  document.getElementById("total").textContent = data.total;
+  data.items.forEach(it => list.appendChild(row(it)));
+  cursor = data.next_cursor;
+  more.hidden = !cursor;
+}
+more.onclick = load;
+document.getElementById("readall").onclick = async (e) => {
+  e.preventDefault();
+  if (await markRead({all: true})) { list.textContent = ""; cursor = null; more.hidden = true; }
+};
+load();
+</script></body></html>
+"""
 
 
 class ReadHandler(BaseHTTPRequestHandler):
     state: ReadState = None
+    search: SearchIndex = None
+    archive: Archive = None
+    images: ImageCache = None
+    engagement: EngagementTracker = None
+    latency: LatencyTracker = None
 
     def do_GET(self):
         parsed = urlparse(self.path)
@@ -485,25 +1098,69 @@ class ReadHandler(BaseHTTPRequestHandler):
         token = (qs.get("token") or [""])[0]
         if parsed.path == "/":
             if token != self.state.token:
-                self.send_response(403)
-                self.end_headers()
-                self.wfile.write(b"forbidden")
-                log(f"[read] forbidden token={token} uid={uid}")
+                self._forbidden(f"[read] forbidden token={token} uid={uid}")
                 return
-            self.send_response(200)
-            self.send_header("Content-Type", "text/html; charset=utf-8")
-            self.end_headers()
-            body = ["<html><body><h3>Unread</h3>"]
-            body.append('<p><a href="/readall?token=%s">Mark all as read</a></p>' % token)
-            for u in self.state.get_unread_uids():
-                name = self.state.get_name(u) or u
-                count = self.state.get_unread_count(u)
-                body.append(
-                    f'<div><b>{name}</b> (uid {u}) - {count} '
-                    f'<a href="/read?uid={u}&token={token}">Mark read</a></div>'
-                )
-            body.append("</body></html>")
-            self.wfile.write("".join(body).encode("utf-8"))
+            # Thin client: all data comes from /api/unread
+            self._send_body(200, DASHBOARD_HTML.encode("utf-8"), "text/html; charset=utf-8")
+            return
+
+        if parsed.path == "/api/unread":
+            if token != self.state.token:
+                self._forbidden(f"[api] forbidden token={token}")
+                return
+            self._serve_unread_timeline(parsed.query, qs)
+            return
+
+        if parsed.path == "/api/search":
+            if token != self.state.token:
+                self._forbidden(f"[api] forbidden token={token}")
+                return
+            self._serve_search(qs)
+            return
+
+        if parsed.path == "/api/archive":
+            if token != self.state.token:
+                self._forbidden(f"[api] forbidden token={token}")
+                return
+            self._serve_archive(qs)
+            return
+
+        if parsed.path == "/api/engagement":
+            if token != self.state.token:
+                self._forbidden(f"[api] forbidden token={token}")
+                return
+            self._serve_engagement(qs)
+            return
+
+        if parsed.path == "/api/latency":
+            if token != self.state.token:
+                self._forbidden(f"[api] forbidden token={token}")
+                return
+            if not self.latency:
+                self._send_body(404, b"latency tracking disabled", "text/plain; charset=utf-8")
+                return
+            uid = (qs.get("uid") or [""])[0] or None
+            self._send_json(self.latency.report(uid))
+            return
+
+        if parsed.path.startswith("/img/"):
+            if token != self.state.token:
+                self._forbidden(f"[img] forbidden token={token}")
+                return
+            self._serve_image(parsed.path[len("/img/"):])
+            return
+
+        if parsed.path == "/logs":
+            if token != self.state.token:
+                self._forbidden(f"[logs] forbidden token={token}")
+                return
+            try:
+                limit = max(1, min(int((qs.get("limit") or [200])[0]), 1000))
+            except ValueError:
+                limit = 200
+            level = (qs.get("level") or [""])[0] or None
+            records = LOGGER.recent(limit, level if level in ("debug", "info", "warning", "error") else None, uid or None)
+            self._send_json({"items": records, "stats": LOGGER.stats()})
             return
 
         if parsed.path == "/status":
@@ -511,7 +1168,7 @@ class ReadHandler(BaseHTTPRequestHandler):
                 self.send_response(403)
                 self.end_headers()
                 self.wfile.write(b"forbidden")
-                log(f"[status] forbidden token={token}")
+                log(f"[status] forbidden token={token}", "warning")
                 return
             payload = []
             for u in self.state.get_unread_uids():
@@ -534,11 +1191,10 @@ class ReadHandler(BaseHTTPRequestHandler):
                 self.send_response(403)
                 self.end_headers()
                 self.wfile.write(b"forbidden")
-                log(f"[read] forbidden token={token} uid={uid}")
+                log(f"[read] forbidden token={token} uid={uid}", "warning")
                 return
-            for u in self.state.get_unread_uids():
-                self.state.mark_read(u)
-            log("[read] marked all (web)")
+            removed = self.state.mark_read_batch(all_uids=True)
+            log(f"[read] marked all (web), {removed} entries")
             self.send_response(200)
             self.send_header("Content-Type", "text/html; charset=utf-8")
             self.end_headers()
@@ -552,7 +1208,7 @@ class ReadHandler(BaseHTTPRequestHandler):
                 self.send_response(403)
                 self.end_headers()
                 self.wfile.write(b"forbidden")
-                log(f"[read] forbidden token={token} uid={uid}")
+                log(f"[read] forbidden token={token} uid={uid}", "warning")
                 return
             if uid:
                 self.state.mark_read(uid)
@@ -569,13 +1225,173 @@ class ReadHandler(BaseHTTPRequestHandler):
         self.end_headers()
         self.wfile.write(b"not found")
 
+    def do_POST(self):
+        parsed = urlparse(self.path)
+        qs = parse_qs(parsed.query)
+        token = (qs.get("token") or [""])[0]
+        if parsed.path != "/api/read":
+            self._send_body(404, b"not found", "text/plain; charset=utf-8")
+            return
+        if token != self.state.token:
+            self._forbidden(f"[read] forbidden token={token}")
+            return
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            if length > READ_BODY_MAX:
+                raise ValueError("body too large")
+            body = json.loads(self.rfile.read(length) or b"{}")
+            uids = [str(u) for u in body.get("uids") or []]
+            ids = [str(x) for x in body.get("ids") or []]
+            before = int(body["before"]) if body.get("before") else None
+            all_uids = body.get("all") is True
+        except (ValueError, TypeError, AttributeError, KeyError):
+            self._send_body(400, b"bad request", "text/plain; charset=utf-8")
+            return
+        removed = self.state.mark_read_batch(uids, ids, before, all_uids)
+        log(f"[read] batch uids={len(uids)} ids={len(ids)} before={before} all={all_uids}: {removed} entries")
+        self._send_json({"removed": removed, "version": self.state.version})
+
+    def _forbidden(self, msg: str):
+        self.send_response(403)
+        self.end_headers()
+        self.wfile.write(b"forbidden")
+        log(msg, "warning")
+
+    def _send_body(self, code: int, body: bytes, content_type: str, headers=None):
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, payload, headers=None):
+        body = json.dumps(payload, ensure_ascii=True, separators=(",", ":")).encode("utf-8")
+        headers = dict(headers or {})
+        headers["Vary"] = "Accept-Encoding"
+        accept = self.headers.get("Accept-Encoding") or ""
+        if len(body) >= GZIP_MIN_BYTES and "gzip" in accept:
+            body = gzip.compress(body, compresslevel=5)
+            headers["Content-Encoding"] = "gzip"
+        self._send_body(200, body, "application/json; charset=utf-8", headers)
+
+    def _serve_unread_timeline(self, query: str, qs: dict):
+        # ETag depends only on state version + query, so a 304 costs no merge
+        etag = '"%d-%08x"' % (self.state.version, zlib.crc32(query.encode("utf-8")))
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        try:
+            limit = int((qs.get("limit") or [TIMELINE_DEFAULT_LIMIT])[0])
+            limit = max(1, min(limit, TIMELINE_MAX_LIMIT))
+            cursor = (qs.get("cursor") or [""])[0] or None
+            fields = [f for f in (qs.get("fields") or [""])[0].split(",") if f]
+            uids = [u for u in (qs.get("uid") or [""])[0].split(",") if u]
+            version, unread, names = self.state.unread_snapshot()
+            payload = build_timeline_page(unread, names, limit, cursor, fields, uids)
+        except (ValueError, TypeError):
+            self._send_body(400, b"bad request", "text/plain; charset=utf-8")
+            return
+        etag = '"%d-%08x"' % (version, zlib.crc32(query.encode("utf-8")))
+        self._send_json(payload, {"ETag": etag, "Cache-Control": "no-cache"})
+
+    def _serve_search(self, qs: dict):
+        if not self.search:
+            self._send_body(404, b"search index disabled", "text/plain; charset=utf-8")
+            return
+        started = time.perf_counter()
+        try:
+            q = (qs.get("q") or [""])[0]
+            limit = max(1, min(int((qs.get("limit") or [20])[0]), TIMELINE_MAX_LIMIT))
+            since = int((qs.get("since") or [0])[0]) or None
+            until = int((qs.get("until") or [0])[0]) or None
+            uids = [u for u in (qs.get("uid") or [""])[0].split(",") if u]
+            results, candidates = self.search.search(q, uids, since, until, limit)
+        except ValueError as e:
+            self._send_body(400, str(e).encode("utf-8"), "text/plain; charset=utf-8")
+            return
+        for row in results:
+            row["name"] = self.state.get_name(row["uid"]) or row["uid"]
+            row["url"] = f"https://t.bilibili.com/{row['id']}"
+        self._send_json(
+            {
+                "items": results,
+                "candidates": candidates,
+                "took_ms": round((time.perf_counter() - started) * 1000, 2),
+            }
+        )
+
+    def _serve_engagement(self, qs: dict):
+        if not self.engagement:
+            self._send_body(404, b"engagement tracking disabled", "text/plain; charset=utf-8")
+            return
+        ids = [x for x in (qs.get("id") or [""])[0].split(",") if x]
+        if ids:
+            curves = [c for c in (self.engagement.curve(x) for x in ids) if c]
+            self._send_json({"items": curves})
+            return
+        try:
+            limit = max(1, min(int((qs.get("limit") or [50])[0]), 500))
+        except ValueError:
+            limit = 50
+        uid = (qs.get("uid") or [""])[0] or None
+        self._send_json({"items": self.engagement.latest(uid, limit), "stats": self.engagement.stats()})
+
+    def _serve_image(self, key: str):
+        # Content is addressed by url hash, so it never changes
+        etag = f'"{key}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        data = None
+        if self.images and re.fullmatch(r"[0-9a-f]{40}", key):
+            data = self.images.get(key)
+        if data is None:
+            self._send_body(404, b"not cached", "text/plain; charset=utf-8", {"Cache-Control": "no-store"})
+            return
+        self._send_body(
+            200,
+            data,
+            "image/jpeg",
+            {"Cache-Control": "private, max-age=31536000, immutable", "ETag": etag},
+        )
+
+    def _serve_archive(self, qs: dict):
+        if not self.archive:
+            self._send_body(404, b"archive disabled", "text/plain; charset=utf-8")
+            return
+        uid = (qs.get("uid") or [""])[0]
+        try:
+            since = int((qs.get("since") or [0])[0])
+            until = int((qs.get("until") or [0])[0]) or None
+            limit = int((qs.get("limit") or [0])[0]) or None
+        except ValueError:
+            self._send_body(400, b"bad request", "text/plain; charset=utf-8")
+            return
+        if not uid:
+            self._send_body(400, b"uid required", "text/plain; charset=utf-8")
+            return
+        self._send_json({"items": self.archive.query(uid, since, until, limit)})
+
     def log_message(self, format, *args):
         # silence default logging
         return
 
 
-def start_server(state: ReadState):
+def start_server(state: ReadState, search: SearchIndex = None, archive: Archive = None,
+                 images: ImageCache = None, engagement: EngagementTracker = None,
+                 latency: LatencyTracker = None):
     ReadHandler.state = state
+    ReadHandler.engagement = engagement
+    ReadHandler.latency = latency
+    ReadHandler.images = images
+    ReadHandler.search = search
+    ReadHandler.archive = archive
     server = HTTPServer((SERVER_HOST, SERVER_PORT), ReadHandler)
     t = threading.Thread(target=server.serve_forever, daemon=True)
     t.start()
@@ -588,45 +1404,686 @@ def write_token(token: str):
         with open(TOKEN_FILE, "w", encoding="utf-8") as f:
             f.write(token)
     except Exception as e:
-        log(f"Failed to write token file: {e}")
+        log(f"Failed to write token file: {e}", "error")
+
+
+def build_commands(state: ReadState, poller, subsystems=None):
+    # Control socket / stdin commands: name -> fn(args) -> JSON-able result
+    subsystems = {k: v for k, v in (subsystems or {}).items() if v}
+
+    def status(args):
+        return [
+            {"uid": u, "name": state.get_name(u) or u, "count": state.get_unread_count(u)}
+            for u in state.get_unread_uids()
+        ]
+
+    def read(args):
+        uids = [str(u) for u in args.get("uids") or []]
+        if not uids:
+            raise ValueError("needs uids")
+        return {"removed": state.mark_read_batch(uids=uids)}
+
+    def readall(args):
+        return {"removed": state.mark_read_batch(all_uids=True)}
+
+    def mark(args):
+        # Same selectors as POST /api/read
+        before = int(args["before"]) if args.get("before") else None
+        removed = state.mark_read_batch(
+            [str(u) for u in args.get("uids") or []],
+            [str(x) for x in args.get("ids") or []],
+            before,
+            args.get("all") is True,
+        )
+        return {"removed": removed}
+
+    def queue(args):
+        limit = int(args.get("limit", 20))
+        return {
+            "uids": len(poller.uids),
+            "cursor": poller.cursor,
+            "next": poller.queue()[:limit],
+            "pending_changes": poller.pending_uid_changes(),
+            "rolled_over": poller.rolled_over,
+            "catching_up": len(poller.catchup),
+        }
+
+    def backoff(args):
+        vc = poller.vc_policy
+        return {
+            "breaker": poller.breaker.stats() if poller.breaker else None,
+            "next_delay": poller.next_delay(POLL_SECONDS),
+            "vc": {"fetched": vc.fetched, "skipped": vc.skipped, "special_uids": len(vc.special)} if vc else None,
+            "egress": poller.session.stats() if isinstance(poller.session, EgressPool) else None,
+        }
+
+    def timings(args):
+        uid = args.get("uid")
+        # Copy first: the poll thread inserts while this runs on the control thread
+        rows = [dict(t, uid=u) for u, t in list(poller.timings.items()) if not uid or u == str(uid)]
+        rows.sort(key=lambda r: r["ms"], reverse=True)
+        return rows[: int(args.get("limit", 20))]
+
+    def stats(args):
+        out = {
+            "poller": {
+                "uids": len(poller.uids),
+                "items_diffed": poller.items_diffed,
+                "detected": poller.detected,
+                "rolled_over": poller.rolled_over,
+                "catchups": poller.catchups,
+                "extra_pages": poller.extra_pages,
+                "unchanged": poller.unchanged,
+                "decoded": poller.decoded,
+                "unchanged_rate": round(poller.unchanged / max(1, poller.unchanged + poller.decoded), 3),
+            },
+            "state_version": state.version,
+            "log": LOGGER.stats(),
+        }
+        out.update({name: obj.stats() for name, obj in subsystems.items()})
+        return out
+
+    def latency(args):
+        if not poller.latency:
+            raise ValueError("latency tracking disabled")
+        return poller.latency.report(str(args["uid"]) if args.get("uid") else None)
+
+    commands = {
+        "status": status,
+        "read": read,
+        "readall": readall,
+        "mark": mark,
+        "queue": queue,
+        "backoff": backoff,
+        "timings": timings,
+        "stats": stats,
+        "latency": latency,
+    }
+    commands["help"] = lambda args: sorted(commands)
+    return commands
 
 
-def start_stdin_commands(state: ReadState):
+def start_stdin_commands(commands: dict):
+    # Interactive runs only: under the menu bar or launchd stdin is at EOF,
+    # and the control socket is the way in
+    if not (sys.stdin and sys.stdin.isatty()):
+        return None
+
     def run():
-        while True:
-            try:
-                line = sys.stdin.readline()
-            except Exception:
-                break
-            if not line:
-                time.sleep(0.1)
-                continue
-            line = line.strip()
-            if not line:
-                continue
+        for line in sys.stdin:
             parts = line.split()
+            if not parts:
+                continue
             cmd = parts[0].lower()
-            if cmd == "read" and len(parts) >= 2:
-                uid = parts[1]
-                state.mark_read(uid)
-                log(f"[read] marked uid={uid} (stdin)")
-            elif cmd == "readall":
-                for uid in state.get_unread_uids():
-                    state.mark_read(uid)
-                log("[read] marked all (stdin)")
-            elif cmd == "status":
-                for uid in state.get_unread_uids():
-                    log(f"[status] uid={uid} unread={state.get_unread_count(uid)}")
+            fn = commands.get(cmd)
+            if not fn or (cmd == "read" and len(parts) < 2):
+                log(f"Commands: read <uid> | {' | '.join(c for c in sorted(commands) if c != 'read')}")
+                continue
+            try:
+                result = fn({"uids": parts[1:]} if cmd == "read" else {})
+            except Exception as e:
+                log(f"[{cmd}] failed: {e}", "warning")
+                continue
+            if cmd == "status":
+                for row in result:
+                    log(f"[status] uid={row['uid']} unread={row['count']}")
             else:
-                log("Commands: read <uid> | readall | status")
+                log(f"[{cmd}] {json.dumps(result, ensure_ascii=False, default=str)}")
 
     t = threading.Thread(target=run, daemon=True)
     t.start()
+    return t
+
+
+def format_ts(ts):
+    return datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S") if ts else "unknown"
+
+
+class Poller:
+    # One poll/diff/notify pipeline; main() drives it against the live API,
+    # tools/replay.py against a recorded capture and tools/simulate.py
+    # against a modelled feed in virtual time.
+    def __init__(
+        self,
+        session: requests.Session,
+        state: ReadState,
+        uids,
+        rules=None,
+        vc_policy: VcPolicy = None,
+        search: SearchIndex = None,
+        archive: Archive = None,
+        initial_time_ts: int = None,
+        debug_uid: str = "",
+        notifier=None,
+        breaker: CircuitBreaker = None,
+        cycle_budget: float = None,
+        webhooks: WebhookSink = None,
+        images: ImageCache = None,
+        engagement: EngagementTracker = None,
+        forwards: ForwardIndex = None,
+        catchup_rate: float = CATCHUP_RATE,
+        max_pages: int = CATCHUP_MAX_PAGES,
+        latency: LatencyTracker = None,
+        verifier: Verifier = None,
+        clock=None,
+        baseline_uids=(),
+    ):
+        self.session = session
+        self.state = state
+        self.uids = list(uids)
+        self.rules = rules
+        self.vc_policy = vc_policy
+        self.search = search
+        self.archive = archive
+        self.initial_time_ts = initial_time_ts
+        self.debug_uid = debug_uid
+        # notifier(title, message, url); None disables notifications
+        self.notifier = notifier
+        self.breaker = breaker
+        # Seconds a cycle may spend polling; the rest roll over to the next cycle
+        self.cycle_budget = cycle_budget
+        self.webhooks = webhooks
+        self.images = images
+        self.engagement = engagement
+        self.forwards = forwards
+        self.timings = {}  # uid -> last poll: at, ms, new, error
+        self.latency = latency
+        self.verifier = verifier
+        # SYSTEM_CLOCK, or a VirtualClock when simulated
+        self.clock = clock or SYSTEM_CLOCK
+        self.catchup_rate = catchup_rate
+        self.max_pages = max_pages
+        # After a sleep: uid -> expected missed posts, polled in this order
+        self.catchup = {}
+        # UIDs init_all could not initialize; poll_uid does it later
+        self.deferred = set()
+        # Followed UIDs whose old posts must not become unread: their first
+        # init only records the newest post
+        self.baseline = set(baseline_uids)
+        self.post_rates = {}  # uid -> posts/s seen on the last first page
+        self._clock_mark = None
+        self._next_slot = 0.0
+        self._recoveries = breaker.recoveries if breaker else 0
+        self.catchups = 0
+        self.extra_pages = 0
+        # uid -> digest of the last fully processed first page; an identical
+        # body next time cannot change anything, so it is not even decoded
+        self.digests = {}
+        self.unchanged = 0
+        self.decoded = 0
+        # UID changes from other threads, applied between cycles
+        self._uid_changes = deque()
+        self.cursor = 0
+        self.items_diffed = 0
+        self.detected = 0
+        self.rolled_over = 0
+
+    def _observe(self, uid: str, items):
+        self.items_diffed += len(items)
+        if self.search:
+            index_items(self.search, uid, items)
+        if self.archive:
+            self.archive.submit(uid, items)
+        if self.engagement:
+            self.engagement.observe(uid, items)
+        if self.verifier:
+            self.verifier.observe(uid, items, self.clock.time())
+
+    def _add_unread(self, uid: str, new_ids, items=(), fetched_at=None):
+        # fetched_at is set for regular polls; only those count toward latency
+        if not new_ids:
+            return
+        self.detected += len(new_ids)
+        by_id = {it.get("id_str"): it for it in items if isinstance(it, dict)}
+        if self.forwards:
+            new_ids = self._collapse_forwards(uid, new_ids, by_id)
+            if not new_ids:
+                return
+        self.state.add_unread_entries(uid, self._entries(new_ids, by_id))
+        if self.verifier:
+            self.verifier.track(uid, [(x, by_id.get(x)) for x in new_ids], self.clock.time())
+        if self.latency and fetched_at:
+            added_at = self.clock.time()
+            for x in new_ids:
+                latency = self.latency.detected(uid, x, get_item_pub_ts(by_id.get(x)), fetched_at, added_at)
+                if latency is not None:
+                    log(f"[latency] uid={uid} id={x} {latency:.0f}s after posting", "debug", uid=uid, latency=round(latency, 1))
+        if self.webhooks:
+            now = int(self.clock.time())
+            name = self.state.get_name(uid) or uid
+            self.webhooks.submit(
+                {
+                    "type": "dynamic",
+                    "uid": uid,
+                    "name": name,
+                    "id": x,
+                    "url": f"https://t.bilibili.com/{x}",
+                    "detected_at": now,
+                }
+                for x in new_ids
+            )
 
+    def _collapse_forwards(self, uid: str, new_ids, by_id):
+        # Forwards of an original that is already unread (posted or forwarded
+        # by another UID) become reposters of that entry instead of new ones
+        now = self.clock.time()
+        kept = []
+        for x in new_ids:
+            key = get_orig_id(by_id.get(x)) or x
+            hit = self.forwards.lookup(key, now)
+            if hit and hit != (uid, x) and self.state.add_reposter(hit[0], hit[1], {"uid": uid, "id": x}):
+                self.forwards.collapsed += 1
+                log(f"[dedupe] uid={uid} id={x} folded into uid={hit[0]} id={hit[1]}", "debug", uid=uid)
+                continue
+            self.forwards.register(key, uid, x, now)
+            kept.append(x)
+        return kept
+
+    def _entries(self, new_ids, by_id):
+        now = int(self.clock.time())
+        entries = []
+        for x in new_ids:
+            item = by_id.get(x)
+            entry = {"id": x, "ts": now}
+            orig = get_orig_id(item)
+            if orig:
+                entry["orig"] = orig
+            if self.images:
+                # Local thumbnail paths; downloads start right away
+                cover, face = get_item_images(item)
+                if cover:
+                    entry["img"] = self.images.local_url(cover)
+                if face:
+                    entry["face"] = self.images.local_url(face)
+                self.images.prefetch([cover, face])
+            entries.append(entry)
+        return entries
+
+    def update_uids(self, added=(), removed=()):
+        self._uid_changes.append((list(added), list(removed)))
+
+    def pending_uid_changes(self) -> int:
+        return len(self._uid_changes)
+
+    def _apply_uid_changes(self):
+        while self._uid_changes:
+            added, removed = self._uid_changes.popleft()
+            gone = set(removed)
+            current = set(self.uids)
+            # New UIDs get their baseline from poll_uid on first poll
+            uids = [u for u in self.uids if u not in gone] + [u for u in added if u not in current]
+            for uid in gone:
+                self.catchup.pop(uid, None)
+                self.baseline.discard(uid)
+            # Including re-follows: what they posted while unfollowed is not news
+            self.baseline.update(u for u in added if u not in current)
+            if uids != self.uids:
+                self.uids = uids
+                self.cursor = self.cursor % len(uids) if uids else 0
+                log(f"[poll] now watching {len(uids)} UIDs (+{len(added)} -{len(gone)})")
+
+    def resolve_names(self, custom_names: dict):
+        # Custom first, then fetch
+        for uid in self.uids:
+            cname = custom_names.get(uid)
+            if cname:
+                self.state.set_name(uid, cname)
+                continue
+            if not self.state.get_name(uid):
+                try:
+                    name = fetch_user_name(self.session, uid)
+                    if name:
+                        self.state.set_name(uid, name)
+                except Exception as e:
+                    log(f"[name] fetch failed for {uid}: {e}", "warning", uid=uid)
+
+    def init_uid(self, uid: str, baseline: bool = False):
+        # Initialize last seen and catch up missed updates (mode 1). With
+        # baseline, only record where the feed is now; nothing becomes unread.
+        state = self.state
+        last_seen = state.get_last_seen(uid)
+        items, paged, _ = self._fetch_items(uid, last_seen, state.get_last_seen_ts(uid))
+        self._observe(uid, items)
+        latest, latest_ts = latest_non_pinned_id_ts(items)
+        if latest and baseline:
+            state.set_last_seen(uid, latest, latest_ts)
+        elif latest and not last_seen:
+            # First run: use initial_time_ts to filter old dynamics
+            self._add_unread(uid, collect_new_ids(items, None, self.initial_time_ts, self.rules, uid), items)
+            state.set_last_seen(uid, latest, latest_ts)
+        elif latest and last_seen:
+            new_ids = collect_new_ids(items, last_seen, rules=self.rules, uid=uid)
+            if not new_ids and paged:
+                new_ids = self._newer_than_anchor(uid, items, last_seen)
+            if new_ids:
+                self._add_unread(uid, new_ids, items)
+                state.set_last_seen(uid, latest, latest_ts)
+        log(
+            f"[init] uid={uid} latest_id={latest} last_seen_time={format_ts(state.get_last_seen_ts(uid))} items={len(items)}"
+            + (" baseline" if baseline else ""),
+            uid=uid,
+        )
 
-def main():
+    def init_all(self):
+        for i, uid in enumerate(self.uids):
+            self.state.heartbeat()
+            if self.breaker and self.breaker.is_open:
+                # Left for poll_uid, which gives them the same first-run treatment
+                log("[init] offline, deferring remaining UIDs", "warning")
+                self.deferred.update(self.uids[i:])
+                break
+            try:
+                self.init_uid(uid, baseline=uid in self.baseline)
+                self.baseline.discard(uid)
+                if self.breaker:
+                    self.breaker.record_success()
+            except Exception as e:
+                log(f"Init fetch failed for {uid}: {e}", "warning", uid=uid)
+                self.deferred.add(uid)
+                if self.breaker and is_connection_error(e):
+                    self.breaker.record_failure()
+
+    def poll_uid(self, uid: str):
+        state, rules, vc_policy = self.state, self.rules, self.vc_policy
+        if uid in self.baseline or not state.get_last_seen(uid):
+            # Never initialized, or followed mid-run. UIDs init_all could not
+            # reach (offline at startup) get their first run now; any other
+            # UID only gets a baseline, so its old posts never become unread.
+            self.init_uid(uid, baseline=uid in self.baseline or uid not in self.deferred)
+            self.baseline.discard(uid)
+            self.deferred.discard(uid)
+            return []
+        last_seen = state.get_last_seen(uid)
+        last_seen_ts = state.get_last_seen_ts(uid)
+        known = self.digests.get(uid)
+        if known and vc_policy and vc_policy.reason(uid, (), last_seen, last_seen_ts, self.clock.time()):
+            known = None  # a vc fetch is due; take the full path
+        items, paged, digest = self._fetch_items(uid, last_seen, last_seen_ts, known)
+        fetched_at = self.clock.time()
+        if items is None:
+            self.unchanged += 1
+            if self.verifier:
+                self.verifier.touch(uid, fetched_at)
+            return []
+        self.decoded += 1
+        self._observe(uid, items)
+        new_ids = collect_new_ids(items, last_seen, rules=rules, uid=uid)
+        if not new_ids and paged:
+            new_ids = self._newer_than_anchor(uid, items, last_seen)
+        feed_ids = {it.get("id_str") for it in items if isinstance(it, dict)}
+        vc_reason = None
+        if vc_policy and last_seen:
+            vc_reason = vc_policy.should_fetch(
+                uid, items, last_seen, state.get_last_seen_ts(uid), self.clock.time()
+            )
+        if vc_reason:
+            try:
+                vc_cards = fetch_latest_cards_vc(self.session, uid)
+            except Exception as e:
+                vc_cards = []
+                log(f"[vc] fetch failed uid={uid}: {e}", "warning", uid=uid)
+            vc_ids = {x for x, _ in vc_cards}
+            last_seen_ts = state.get_last_seen_ts(uid)
+            if last_seen not in feed_ids and last_seen in vc_ids and last_seen_ts:
+                # Feed lost the anchor but vc still has it: trust feed
+                # items newer than the anchor's time
+                new_ids = collect_new_ids(items, None, last_seen_ts + 1, rules, uid)
+            # Only merge if last_seen was found in either source; this
+            # prevents duplicate notifications when the anchor is lost.
+            if last_seen in feed_ids or last_seen in vc_ids:
+                new_ids, vc_only = merge_vc_ids(items, new_ids, vc_cards, last_seen)
+                fresh = vc_policy.filter_delivered(uid, vc_only)
+                stale = set(vc_only).difference(fresh)
+                if stale:
+                    new_ids = [x for x in new_ids if x not in stale]
+                vc_policy.record_vc_only(uid, fresh, self.clock.time())
+        self._add_unread(uid, new_ids, items, fetched_at)
+        newest, newest_ts = latest_non_pinned_id_ts(items)
+        # Advance past filtered-only updates too, or last_seen would
+        # eventually scroll off the first page
+        if newest and newest != last_seen and (new_ids or (rules and last_seen in feed_ids)):
+            state.set_last_seen(uid, newest, newest_ts)
+        # Quiet polls are routine and sampled per UID; detections always log
+        log(
+            f"[uid] {uid} items={len(items)} last_seen_id={last_seen} last_seen_time={format_ts(state.get_last_seen_ts(uid))} new={len(new_ids)}"
+            + (f" vc={vc_reason}" if vc_reason else ""),
+            uid=uid,
+            sample=None if new_ids else "poll",
+            new=len(new_ids),
+        )
+        if vc_reason in ("anchor", "pub_ts"):
+            # Decided by the feed itself: the same body must be looked at again
+            self.digests.pop(uid, None)
+        else:
+            self.digests[uid] = digest
+        if self.debug_uid and uid == self.debug_uid:
+            # dump recent ids/tags for debugging
+            for it in items[:10]:
+                if not isinstance(it, dict):
+                    continue
+                tag = get_item_tag(it)
+                log(f"[debug] uid={uid} id={it.get('id_str')} tag={tag}", uid=uid)
+        return new_ids
+
+    def _fetch_items(self, uid: str, last_seen=None, last_seen_ts=None, known_digest=None):
+        # First page, plus older pages while they are all newer than
+        # last_seen (more was posted than one page holds, e.g. over a sleep).
+        # Returns (items, paged, digest of the first page); items is None
+        # when the first page matches known_digest.
+        self._pace()
+        raw = fetch_feed_body(self.session, uid)
+        digest = body_digest(raw)
+        if digest is not None and digest == known_digest:
+            return None, False, digest
+        items, offset, has_more = parse_items_page(raw, uid)
+        self.post_rates[uid] = post_rate(items, self.clock.time())
+        pages = 1
+        page = items
+        while (
+            last_seen and last_seen_ts and has_more and offset and pages < self.max_pages
+            and not reaches_anchor(page, last_seen, last_seen_ts)
+        ):
+            if not self._pace():
+                self.clock.sleep(PAGE_DELAY_SECONDS)
+            page, offset, has_more = fetch_items_page(self.session, uid, offset)
+            items = items + page
+            pages += 1
+        if pages > 1:
+            self.extra_pages += pages - 1
+            log(f"[catchup] uid={uid} paged back {pages} pages ({len(items)} items)", uid=uid)
+        return items, pages > 1, digest
+
+    def _newer_than_anchor(self, uid: str, items, last_seen):
+        # Paged back without meeting last_seen itself (deleted, or past the
+        # page limit): everything newer than its timestamp is new
+        if any(isinstance(it, dict) and it.get("id_str") == last_seen for it in items):
+            return []
+        last_seen_ts = self.state.get_last_seen_ts(uid)
+        return collect_new_ids(items, None, last_seen_ts + 1, self.rules, uid) if last_seen_ts else []
+
+    def _pace(self) -> bool:
+        # Spreads catch-up requests at catchup_rate; False when not catching up
+        if not self.catchup or not self.catchup_rate:
+            return False
+        now = self.clock.monotonic()
+        slot = max(now, self._next_slot)
+        self._next_slot = slot + 1.0 / self.catchup_rate
+        if slot > now:
+            self.clock.sleep(slot - now)
+        return True
+
+    def _clock_gap(self) -> float:
+        # The monotonic clock stops while the machine sleeps, wall time doesn't
+        wall, mono = self.clock.time(), self.clock.monotonic()
+        mark, self._clock_mark = self._clock_mark, (wall, mono)
+        if not mark:
+            return 0.0
+        return (wall - mark[0]) - (mono - mark[1])
+
+    def plan_catchup(self, gap: float, offline: bool = False):
+        # Most missed posts first: each UID's recent posting rate times the
+        # time since it was last polled (median rate for UIDs not seen yet).
+        # After an outage only UIDs not polled during it are planned.
+        now = self.clock.time()
+        known = sorted(self.post_rates.values())
+        default = known[len(known) // 2] if known else 0.0
+        expected = {}
+        for uid in self.uids:
+            last = self.timings.get(uid) or {}
+            since = now - last.get("at", now - gap)
+            if offline and since < gap and not last.get("error"):
+                continue
+            expected[uid] = self.post_rates.get(uid, default) * since
+        if not expected:
+            return
+        self.catchup = dict(sorted(expected.items(), key=lambda kv: kv[1], reverse=True))
+        self._next_slot = self.clock.monotonic()
+        self.catchups += 1
+        top = [f"{u}~{n:.1f}" for u, n in list(self.catchup.items())[:3]]
+        cause = f"back online after {int(gap)}s offline" if offline else f"woke after {int(gap)}s asleep"
+        log(
+            f"[catchup] {cause}, catching up {len(self.catchup)} UIDs"
+            f" at {self.catchup_rate}/s (first: {', '.join(top)})",
+            "warning",
+        )
+
+    def notify_unread(self):
+        state = self.state
+        notify_items = []
+        for uid in state.get_unread_uids():
+            count = state.get_unread_count(uid)
+            if count > 0:
+                name = state.get_name(uid) or uid
+                notify_items.append(f"{name} {count}条")
+                log(f"[notify] uid={uid} count={count}", uid=uid, sample="notify")
+        if notify_items and self.notifier:
+            url = f"http://{SERVER_HOST}:{SERVER_PORT}/?token={state.token}"
+            message = ", ".join(notify_items)
+            self.notifier("Bilibili 动态更新", f"{message}，点击查看", url)
+            if self.latency:
+                self.latency.notified(self.clock.time())
+
+    def poll_cycle(self):
+        log("[poll]", "debug")
+        self.state.heartbeat()
+        self._apply_uid_changes()
+        gap = self._clock_gap()
+        if gap >= GAP_SECONDS:
+            self.plan_catchup(gap)
+        if self.breaker and not self.breaker.allow():
+            log(f"[net] offline, skipping poll ({self.breaker.failures} failures)", "debug")
+            self.notify_unread()
+            return
+        if self.breaker and self.breaker.recoveries != self._recoveries:
+            # The probe may have been sent by the verifier or follow sync;
+            # whoever saw it, UIDs skipped while offline go first now
+            self._recoveries = self.breaker.recoveries
+            self.plan_catchup(self.breaker.last_outage, offline=True)
+        # Round-robin from where the previous cycle stopped, so UIDs cut off by
+        # the deadline (or an outage) are first in line next time. A catch-up
+        # plan takes over until it is drained.
+        catching_up = bool(self.catchup)
+        uids = list(self.catchup) if catching_up else self.uids
+        start = 0 if catching_up else self.cursor
+        n = len(uids)
+        deadline = self.clock.monotonic() + self.cycle_budget if self.cycle_budget else None
+        done = 0
+        while done < n:
+            if (deadline and self.clock.monotonic() >= deadline) or (self.breaker and self.breaker.is_open):
+                if catching_up:
+                    log(f"[catchup] {n - done} UIDs left for the next cycle", "debug")
+                    break
+                self.rolled_over += n - done
+                log(f"[poll] cycle stopped early, {n - done} UIDs rolled to next cycle", "warning")
+                break
+            uid = uids[(start + done) % n]
+            done += 1
+            self.state.heartbeat()
+            started = self.clock.monotonic()
+            error = None
+            new_ids = []
+            try:
+                new_ids = self.poll_uid(uid) or []
+                if self.breaker:
+                    self.breaker.record_success()
+            except Exception as e:
+                error = str(e)
+                log(f"Fetch failed for {uid}: {e}", "warning", uid=uid)
+                if self.breaker and is_connection_error(e):
+                    self.breaker.record_failure()
+            self.timings[uid] = {
+                "at": int(self.clock.time()),
+                "ms": round((self.clock.monotonic() - started) * 1000, 1),
+                "new": len(new_ids),
+                "error": error,
+            }
+            if catching_up:
+                # Failed UIDs page back on their next regular poll anyway
+                self.catchup.pop(uid, None)
+        if catching_up:
+            if not self.catchup:
+                log("[catchup] done")
+        else:
+            self.cursor = (self.cursor + done) % n if n else 0
+        self.notify_unread()
+
+    def queue(self):
+        # UIDs in the order the next cycle will poll them. Called from the
+        # control thread, so work on copies of what the poll thread mutates
+        catchup = list(self.catchup)
+        uids = list(self.uids)
+        n = len(uids)
+        cursor = self.cursor
+        order = [uids[(cursor + i) % n] for i in range(n)]
+        pending = set(catchup)
+        return catchup + [u for u in order if u not in pending]
+
+    def next_delay(self, poll_seconds: float) -> float:
+        # While offline, wake up for the next probe instead of a full interval
+        if self.breaker and self.breaker.is_open:
+            return min(poll_seconds, max(1.0, self.breaker.seconds_until_probe()))
+        if self.catchup:
+            return 1.0  # the catch-up plan paces itself
+        return poll_seconds
+
+    def run(self, poll_seconds: float, until: float = None):
+        # Poll forever, or until clock.time() reaches `until`
+        cycles = 0
+        while until is None or self.clock.time() < until:
+            self.poll_cycle()
+            cycles += 1
+            self.clock.sleep(self.next_delay(poll_seconds))
+        return cycles
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=f"{APP_DISPLAY_NAME} monitor")
+    parser.add_argument(
+        "--record",
+        metavar="PATH",
+        help="capture API responses to PATH (.jsonl.gz) for tools/replay.py",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    LOGGER.configure(path=LOG_FILE)
+    atexit.register(LOGGER.flush)
+    # launchd / menubar stop the monitor with SIGTERM; exit through atexit
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
     log(f"Starting {APP_DISPLAY_NAME} v{APP_VERSION}")
     config = load_config()
+    try:
+        LOGGER.configure(
+            level=str(config.get("log_level", "info")),
+            max_bytes=float(config.get("log_max_mb", 5)) * 1024 * 1024,
+            backups=int(config.get("log_backups", 3)),
+            sample_seconds=int(config.get("log_sample_seconds", 600)),
+        )
+    except ValueError as e:
+        log(f"{e}", "error")
+        sys.exit(1)
     uids = [str(x) for x in config.get("uids", [])]
     sender = config.get("sender")
     mode = int(config.get("mode", 2))
@@ -634,8 +2091,36 @@ def main():
     click_action = config.get("click_action", "open")
     backend = config.get("notify_backend", "terminal-notifier")
     notifier_path = config.get("terminal_notifier_path")
-    use_vc_api = bool(config.get("use_vc_api", False))
+    try:
+        vc_policy = build_vc_policy(config)
+    except ValueError as e:
+        log(f"{e}", "error")
+        sys.exit(1)
     debug_uid = str(config.get("debug_uid", "")).strip()
+    use_search = bool(config.get("search_index", False))
+    use_archive = bool(config.get("archive", False))
+    use_live = bool(config.get("live_monitor", False))
+    use_images = bool(config.get("image_cache", False))
+    use_engagement = bool(config.get("engagement", False))
+    use_followings = bool(config.get("sync_followings", False))
+    use_dedupe = bool(config.get("dedupe_forwards", False))
+    use_verify = bool(config.get("verify_unread", False))
+    try:
+        webhooks = WebhookSink(
+            config.get("webhooks") or [],
+            os.path.join(APP_DIR, "webhooks"),
+            concurrency=int(config.get("webhook_concurrency", 4)),
+        )
+    except (ValueError, TypeError) as e:
+        log(f"Invalid webhooks in config.json: {e}", "error")
+        sys.exit(1)
+    try:
+        rules = compile_filter_rules(config.get("filters"))
+    except (ValueError, re.error) as e:
+        log(f"Invalid filters in config.json: {e}", "error")
+        sys.exit(1)
+    if rules:
+        log(f"[filter] compiled {rules.keyword_count} keywords, {len(rules.uid_rules)} per-UID rule sets")
     global SERVER_PORT
     SERVER_PORT = int(config.get("port", SERVER_PORT))
     global POLL_SECONDS
@@ -648,150 +2133,266 @@ def main():
                 datetime.strptime(initial_time_str, "%Y-%m-%d %H:%M:%S").timestamp()
             )
         except Exception:
-            log("Invalid initial_install_time format. Use YYYY-MM-DD HH:MM:SS")
+            log("Invalid initial_install_time format. Use YYYY-MM-DD HH:MM:SS", "warning")
     global NOTIFIER_BIN
     NOTIFIER_BIN = find_terminal_notifier(notifier_path)
     if backend == "terminal-notifier" and not NOTIFIER_BIN:
-        log("terminal-notifier not found in PATH. Falling back to osascript.")
+        log("terminal-notifier not found in PATH. Falling back to osascript.", "warning")
         backend = "osascript"
     if mode not in (1, 2):
-        log("Invalid mode in config.json. Use 1 or 2.")
+        log("Invalid mode in config.json. Use 1 or 2.", "error")
         sys.exit(1)
-    if not uids:
-        log("No UIDs configured in config.json")
+    if not uids and not use_followings:
+        log("No UIDs configured in config.json", "error")
         sys.exit(1)
 
-    session = requests.Session()
+    if args.record:
+        session = RecordingSession(args.record, {"uids": uids, "app_version": APP_VERSION})
+        atexit.register(session.close)
+        log(f"[record] capturing API responses to {args.record}")
+    else:
+        session = requests.Session()
     session.headers.update({"User-Agent": USER_AGENT})
 
     load_cookies(session)
     if not is_logged_in(session):
         login_via_qr(session, config)
         if not is_logged_in(session):
-            log("Login failed. Please try again.")
+            log("Login failed. Please try again.", "error")
+            sys.exit(1)
+
+    egress = config.get("egress") or {}
+    if egress.get("exits") and args.record:
+        log("[egress] ignored while recording; captures go through the login session", "warning")
+    elif egress.get("exits"):
+        if any(str(x.get("proxy") if isinstance(x, dict) else x).startswith("socks") for x in egress["exits"]):
+            try:
+                import socks  # noqa: F401
+            except ImportError:
+                log("SOCKS proxies need PySocks: pip install 'requests[socks]'", "error")
+                sys.exit(1)
+        try:
+            session = EgressPool(
+                session, egress["exits"], evict_seconds=int(egress.get("evict_seconds", 1800))
+            )
+        except (ValueError, TypeError, OSError) as e:
+            log(f"Invalid egress in config.json: {e}", "error")
             sys.exit(1)
+        atexit.register(session.close)
+        log(f"[egress] {len(session.exits)} exits: {', '.join(e.name for e in session.exits)}")
 
     state = ReadState(persist=(mode == 1))
     state.load()
-    start_server(state)
+    # Read-only status for local readers (menu bar) without HTTP or JSON
+    state.snapshot = SnapshotWriter(STATUS_FILE)
+    state.publish()
+    followings = None
+    baseline_uids = []
+    if use_followings:
+        followings = FollowingsSync(
+            session,
+            os.path.join(APP_DIR, "followings.json"),
+            interval=int(config.get("followings_sync_seconds", 3600)),
+            exclude=config.get("followings_exclude"),
+        )
+        followings.load()
+        if not followings.uids:
+            # First run: the initial poll needs the list
+            followings.run_once()
+        configured = set(uids)
+        followed = [u for u in followings.watched() if u not in configured]
+        uids = uids + followed
+        # Newly followed UIDs start from their newest post instead of
+        # flooding unread with their history
+        baseline_uids = [u for u in followed if not state.get_last_seen(u)]
+        for uid, name in followings.names.items():
+            if name and uid not in custom_names and not state.get_name(uid):
+                state.set_name(uid, name)
+        log(f"[follow] {followings.stats()}")
+        if not uids:
+            log("No UIDs configured and no followings found", "error")
+            sys.exit(1)
+    search = None
+    if use_search:
+        search = SearchIndex(os.path.join(APP_DIR, "search") if mode == 1 else None)
+        search.load()
+        search.start()
+        atexit.register(search.stop)
+        log(f"[search] index loaded: {search.stats()}")
+    archive = None
+    if use_archive:
+        archive = Archive(
+            os.path.join(APP_DIR, "archive"),
+            normalize=normalize_item,
+            retention_days=int(config.get("archive_retention_days", 365)),
+            retention_mb=int(config.get("archive_max_mb", 512)),
+        )
+        archive.load()
+        archive.start()
+        atexit.register(archive.stop)
+        log(f"[archive] {archive.stats()}")
+    if webhooks.endpoints:
+        webhooks.load()
+        webhooks.start()
+        atexit.register(webhooks.stop)
+        log(f"[webhook] {len(webhooks.endpoints)} endpoints")
+    images = None
+    if use_images:
+        images = ImageCache(
+            os.path.join(APP_DIR, "images"),
+            max_bytes=int(float(config.get("image_cache_mb", 100)) * 1024 * 1024),
+            concurrency=int(config.get("image_concurrency", 4)),
+        )
+        images.load()
+        images.start()
+        atexit.register(images.stop)
+        log(f"[img] {images.stats()}")
+    engagement = None
+    if use_engagement:
+        try:
+            engagement = EngagementTracker(
+                os.path.join(APP_DIR, "engagement.json.gz") if mode == 1 else None,
+                days=int(config.get("engagement_days", 7)),
+                max_tracked=int(config.get("engagement_max_tracked", 5000)),
+                alerts=config.get("engagement_alerts"),
+                pub_ts=get_item_pub_ts,
+                name_of=state.get_name,
+            )
+        except (ValueError, TypeError, KeyError) as e:
+            log(f"Invalid engagement_alerts in config.json: {e}", "error")
+            sys.exit(1)
+        engagement.load()
+        atexit.register(engagement.save)
+        log(f"[engagement] {engagement.stats()}")
+    try:
+        latency = LatencyTracker(
+            os.path.join(APP_DIR, "latency.json") if mode == 1 else None,
+            slo=config.get("latency_slo"),
+            window_hours=int(config.get("latency_window_hours", 24)),
+        )
+    except (ValueError, TypeError) as e:
+        log(f"Invalid latency_slo in config.json: {e}", "error")
+        sys.exit(1)
+    latency.load()
+    atexit.register(latency.save)
+    start_server(state, search, archive, images, engagement, latency)
     write_token(state.token)
-    start_stdin_commands(state)
     log(f"Dashboard: http://{SERVER_HOST}:{SERVER_PORT}/?token={state.token}")
     log(f"Read server: http://{SERVER_HOST}:{SERVER_PORT}/read?uid=<UID>&token=...")
 
-    # Resolve names (custom first, then fetch)
-    for uid in uids:
-        cname = custom_names.get(uid)
-        if cname:
-            state.set_name(uid, cname)
-            continue
-        if not state.get_name(uid):
-            try:
-                name = fetch_user_name(session, uid)
-                if name:
-                    state.set_name(uid, name)
-            except Exception as e:
-                log(f"[name] fetch failed for {uid}: {e}")
+    def send_notification(title, message, url):
+        notify(
+            title=title,
+            message=message,
+            open_url=url,
+            sender=sender,
+            click_action=click_action,
+            backend=backend,
+        )
 
-    # Initialize last seen and catch up missed updates (mode 1)
-    for uid in uids:
-        try:
-            items = fetch_latest_items(session, uid)
-            latest, latest_ts = latest_non_pinned_id_ts(items)
-            last_seen = state.get_last_seen(uid)
-            if latest and not last_seen:
-                # First run: use initial_time_ts to filter old dynamics
-                new_ids = collect_new_ids(items, None, initial_time_ts)
-                if new_ids:
-                    state.add_unread(uid, new_ids)
-                state.set_last_seen(uid, latest, latest_ts)
-            elif latest and last_seen:
-                new_ids = collect_new_ids(items, last_seen)
-                if new_ids:
-                    state.add_unread(uid, new_ids)
-                    state.set_last_seen(uid, latest, latest_ts)
-            last_ts = state.get_last_seen_ts(uid)
-            last_ts_str = (
-                datetime.fromtimestamp(last_ts).strftime("%Y-%m-%d %H:%M:%S")
-                if last_ts
-                else "unknown"
-            )
-            log(
-                f"[init] uid={uid} latest_id={latest} last_seen_time={last_ts_str} items={len(items)}"
-            )
-        except Exception as e:
-            log(f"Init fetch failed for {uid}: {e}")
+    if engagement:
+        engagement.notifier = send_notification
+    forwards = None
+    if use_dedupe:
+        forwards = ForwardIndex(window=int(float(config.get("dedupe_window_hours", 72)) * 3600))
+        forwards.rebuild(state.unread_snapshot()[1], time.time())
+    verifier = None
+    if use_verify:
+        verifier = Verifier(
+            session,
+            state,
+            get_item_pub_ts,
+            get_item_content,
+            budget=int(config.get("verify_budget_per_hour", 60)),
+            max_age=int(float(config.get("verify_max_age_hours", 72)) * 3600),
+        )
 
-    log("Monitoring started. Press Ctrl+C to stop.")
+    poller = Poller(
+        session,
+        state,
+        uids,
+        rules=rules,
+        vc_policy=vc_policy,
+        search=search,
+        archive=archive,
+        initial_time_ts=initial_time_ts,
+        debug_uid=debug_uid,
+        notifier=send_notification,
+        breaker=CircuitBreaker(
+            http_probe(session), threshold=int(config.get("offline_failure_threshold", 3))
+        ),
+        cycle_budget=float(config.get("cycle_budget_seconds", POLL_SECONDS * 0.9)),
+        webhooks=webhooks if webhooks.endpoints else None,
+        images=images,
+        engagement=engagement,
+        forwards=forwards,
+        catchup_rate=float(config.get("catchup_rate", CATCHUP_RATE)),
+        max_pages=int(config.get("catchup_max_pages", CATCHUP_MAX_PAGES)),
+        latency=latency,
+        verifier=verifier,
+        baseline_uids=baseline_uids,
+    )
+    poller.resolve_names(custom_names)
+    poller.init_all()
+    if verifier:
+        verifier.breaker = poller.breaker
+        verifier.start()
+        atexit.register(verifier.stop)
+    if followings:
+        configured = set(str(x) for x in config.get("uids", []))
+
+        def on_follow_change(added, removed):
+            for uid, name in added.items():
+                if name and uid not in custom_names:
+                    state.set_name(uid, name)
+            # UIDs listed in config.json stay watched after an unfollow
+            poller.update_uids(added, [u for u in removed if u not in configured])
+
+        followings.on_change = on_follow_change
+        followings.breaker = poller.breaker
+        followings.start()
+        atexit.register(followings.stop)
+    live = None
+    if use_live:
+        live = LiveMonitor(
+            session,
+            state,
+            lambda: poller.uids,
+            notifier=send_notification,
+            interval=int(config.get("live_poll_seconds", 60)),
+            breaker=poller.breaker,
+        )
+        live.start()
+        atexit.register(live.stop)
+        log(f"[live] watching {len(uids)} UIDs every {live.interval}s")
+
+    commands = build_commands(
+        state,
+        poller,
+        {
+            "search": search,
+            "archive": archive,
+            "webhooks": webhooks,
+            "images": images,
+            "engagement": engagement,
+            "followings": followings,
+            "live": live,
+            "latency": latency,
+            "verifier": verifier,
+        },
+    )
+    control = ControlServer(CONTROL_SOCKET, commands)
+    try:
+        control.start()
+        atexit.register(control.stop)
+        log(f"Control socket: {CONTROL_SOCKET} (tools/bilimsg_ctl.py)")
+    except (OSError, RuntimeError) as e:
+        log(f"Control socket unavailable: {e}", "warning")
+    start_stdin_commands(commands)
 
-    while True:
-        log("[poll]")
-        for uid in uids:
-            try:
-                items = fetch_latest_items(session, uid)
-                if use_vc_api:
-                    try:
-                        extra_ids = fetch_latest_ids_vc(session, uid)
-                    except Exception as e:
-                        extra_ids = []
-                        log(f"[vc] fetch failed uid={uid}: {e}")
-                last_seen = state.get_last_seen(uid)
-                new_ids = collect_new_ids(items, last_seen)
-                if use_vc_api and extra_ids and new_ids:
-                    # Only add extra ids if we found the last_seen ID in normal API
-                    # This prevents duplicate notifications when last_seen is not found
-                    for xid in extra_ids:
-                        if xid == last_seen:
-                            break
-                        if xid not in new_ids:
-                            new_ids.append(xid)
-                if new_ids:
-                    state.add_unread(uid, new_ids)
-                    newest, newest_ts = latest_non_pinned_id_ts(items)
-                    if newest:
-                        state.set_last_seen(uid, newest, newest_ts)
-                last_ts = state.get_last_seen_ts(uid)
-                last_ts_str = (
-                    datetime.fromtimestamp(last_ts).strftime("%Y-%m-%d %H:%M:%S")
-                    if last_ts
-                    else "unknown"
-                )
-                log(
-                    f"[uid] {uid} items={len(items)} last_seen_id={last_seen} last_seen_time={last_ts_str} new={len(new_ids)}"
-                )
-                if debug_uid and uid == debug_uid:
-                    # dump recent ids/tags for debugging
-                    for it in items[:10]:
-                        if not isinstance(it, dict):
-                            continue
-                        tag = get_item_tag(it)
-                        log(f"[debug] uid={uid} id={it.get('id_str')} tag={tag}")
-            except Exception as e:
-                log(f"Fetch failed for {uid}: {e}")
-
-        # Notify for unread
-        unread_uids = state.get_unread_uids()
-        if unread_uids:
-            notify_items = []
-            for uid in unread_uids:
-                count = state.get_unread_count(uid)
-                if count > 0:
-                    name = state.get_name(uid) or uid
-                    notify_items.append(f"{name} {count}条")
-                    log(f"[notify] uid={uid} count={count}")
-            if notify_items:
-                url = f"http://{SERVER_HOST}:{SERVER_PORT}/?token={state.token}"
-                message = ", ".join(notify_items)
-                notify(
-                    title="Bilibili 动态更新",
-                    message=f"{message}，点击查看",
-                    open_url=url,
-                    sender=sender,
-                    click_action=click_action,
-                    backend=backend,
-                )
+    log("Monitoring started. Press Ctrl+C to stop.")
 
-        time.sleep(POLL_SECONDS)
+    poller.run(POLL_SECONDS)
 
 
 if __name__ == "__main__":
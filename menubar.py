@@ -9,6 +9,8 @@ from datetime import datetime
 import requests
 import rumps
 
+from snapshot import SnapshotReader
+
 APP_DISPLAY_NAME = "B站关注通知"
 APP_VERSION = "1.1.0"
 APP_DIR = os.path.join(
@@ -19,9 +21,12 @@ APP_DIR = os.path.join(
 )
 CONFIG_FILE = os.path.join(APP_DIR, "config.json")
 TOKEN_FILE = os.path.join(APP_DIR, "token.txt")
-LOG_FILE = os.path.join(APP_DIR, "main.log")
+LOG_FILE = os.path.join(APP_DIR, "main.log")  # written and rotated by main.py
+ERR_FILE = os.path.join(APP_DIR, "main.err.log")
 PID_FILE = os.path.join(APP_DIR, "main.pid")
-STATE_FILE = os.path.join(APP_DIR, "state.json")
+STATUS_FILE = os.path.join(APP_DIR, "status.bin")  # published by main.py
+SNAPSHOT_HEARTBEAT_SECONDS = 30  # main.py rewrites status.bin at least this often
+STALE_AFTER_POLLS = 3
 SERVER_HOST = "127.0.0.1"
 SERVER_PORT = 8765
 
@@ -77,8 +82,8 @@ def status_url(token: str):
     return f"http://{SERVER_HOST}:{SERVER_PORT}/status?token={token}"
 
 
-def read_url(uid: str, token: str):
-    return f"http://{SERVER_HOST}:{SERVER_PORT}/read?uid={uid}&token={token}"
+def batch_read_url(token: str):
+    return f"http://{SERVER_HOST}:{SERVER_PORT}/api/read?token={token}"
 
 
 def dashboard_url(token: str):
@@ -130,11 +135,13 @@ def start_main_process():
     try:
         cfg = load_config()
         py = preferred_python(cfg)
-        with open(LOG_FILE, "a", encoding="utf-8") as log:
+        # main.py logs to LOG_FILE itself; keep stderr for crashes only
+        with open(ERR_FILE, "w", encoding="utf-8") as err:
             proc = subprocess.Popen(
                 [py, script],
-                stdout=log,
-                stderr=log,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL,
+                stderr=err,
                 start_new_session=True,
             )
         try:
@@ -180,10 +187,12 @@ class BiliMenuApp(rumps.App):
         self.last_total = 0
         self.next_refresh_ts = None
         self.refresh_interval = 60
+        self.snapshot = SnapshotReader(STATUS_FILE)
         self.menu = [
             rumps.MenuItem(f"Version {APP_VERSION}"),
             None,
             rumps.MenuItem("Open Dashboard", callback=self.open_dashboard),
+            rumps.MenuItem("全部已读", callback=self.read_all),
             rumps.MenuItem("Start Monitor", callback=self.start_monitor),
             rumps.MenuItem("Edit Config", callback=self.edit_config),
             rumps.MenuItem("View Logs", callback=self.view_logs),
@@ -199,26 +208,17 @@ class BiliMenuApp(rumps.App):
 
     def quit_app(self, _):
         stop_main_process()
-        if os.path.exists(LOG_FILE):
-            try:
-                os.remove(LOG_FILE)
-            except Exception:
-                pass
         rumps.quit_application()
 
     def show_last_seen_times(self, _):
-        if not os.path.exists(STATE_FILE):
-            rumps.alert("暂无已读时间点记录")
-            return
         try:
-            with open(STATE_FILE, "r", encoding="utf-8") as f:
-                state_data = json.load(f)
-            last_seen_ts = state_data.get("last_seen_ts", {})
+            self.snapshot.refresh()
+            last_seen_ts = [(uid, ts) for uid, _, _, ts in self.snapshot.rows() if ts]
             if not last_seen_ts:
                 rumps.alert("暂无已读时间点记录")
                 return
             lines = []
-            for uid, ts in last_seen_ts.items():
+            for uid, ts in last_seen_ts:
                 try:
                     time_str = datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S")
                     lines.append(f"UID: {uid}\n时间: {time_str}")
@@ -278,7 +278,8 @@ class BiliMenuApp(rumps.App):
             # create empty log so tail works
             with open(LOG_FILE, "a", encoding="utf-8"):
                 pass
-        cmd = f'tell application "Terminal" to do script "tail -f \\"{LOG_FILE}\\""'
+        # -F keeps following main.log across rotation
+        cmd = f'tell application "Terminal" to do script "tail -F \\"{LOG_FILE}\\""'
         try:
             subprocess.run(["/usr/bin/osascript", "-e", cmd], check=False)
         except Exception:
@@ -295,35 +296,44 @@ class BiliMenuApp(rumps.App):
         if not self.token:
             self.token = read_token()
 
-        if not is_server_up(self.token):
+        # A fresh status.bin proves main.py is alive; HTTP only when it is not
+        self.snapshot.refresh()
+        live = self._snapshot_live()
+        if not live and not is_server_up(self.token):
             if cfg.get("autostart_main", True):
                 start_main_process()
                 time.sleep(1)
                 self.token = read_token()
 
-        if not is_server_up(self.token):
-            self.title = "B站(!)"
-            self._render_items([])
-            return
-
-        try:
-            r = requests.get(status_url(self.token), timeout=3)
-            if r.status_code != 200:
+            if not is_server_up(self.token):
                 self.title = "B站(!)"
                 self._render_items([])
                 return
-            data = r.json()
-            items = data.get("items", [])
+
+        try:
+            if live:
+                items = self.snapshot.unread()
+            else:
+                r = requests.get(status_url(self.token), timeout=3)
+                if r.status_code != 200:
+                    self.title = "B站(!)"
+                    self._render_items([])
+                    return
+                items = r.json().get("items", [])
             self._render_items(items)
             self.next_refresh_ts = time.time() + self.refresh_interval
         except Exception:
             self.title = "B站(!)"
             self._render_items([])
 
+    def _snapshot_live(self):
+        return self.snapshot.fresh(STALE_AFTER_POLLS * self.refresh_interval + SNAPSHOT_HEARTBEAT_SECONDS)
+
     def _render_items(self, items):
         fixed = [
             f"Version {APP_VERSION}",
             "Open Dashboard",
+            "全部已读",
             "Start Monitor",
             "Edit Config",
             "View Logs",
@@ -349,20 +359,29 @@ class BiliMenuApp(rumps.App):
                 "Open Dashboard", rumps.MenuItem(title, callback=self._make_read(uid))
             )
 
+    def _mark_read(self, body):
+        if not self.token:
+            return
+        try:
+            requests.post(batch_read_url(self.token), json=body, timeout=3)
+        except Exception:
+            pass
+        self.refresh(None)
+
+    def read_all(self, _):
+        self._mark_read({"all": True})
+
     def _make_read(self, uid):
         def _cb(_):
-            if not self.token:
-                return
-            try:
-                requests.get(read_url(uid, self.token), timeout=3)
-            except Exception:
-                pass
-            self.refresh(None)
+            self._mark_read({"uids": [uid]})
         return _cb
 
     def _tick(self, _):
         if not self.next_refresh_ts:
             return
+        # One stat() per second; the menu is rebuilt only when main published a change
+        if self.snapshot.refresh():
+            self._render_items(self.snapshot.unread())
         remaining = max(0, int(self.next_refresh_ts - time.time()))
         base = f"B站({self.last_total})" if self.last_total else "B站"
         self.title = f"{base} {remaining}s"
@@ -0,0 +1,479 @@
+#!/usr/bin/env python3
+import array
+import itertools
+import json
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+import unicodedata
+import zlib
+
+from applog import log
+
+SEGMENT_MAGIC = b"BMSI"
+SEGMENT_VERSION = 1
+SEGMENT_HEADER = struct.Struct("<4sHHQQ")  # magic, version, flags, footer_off, footer_len
+DOC_BLOCK_SIZE = 128
+POSTINGS_ZLIB_MIN = 64  # shorter posting lists are stored raw
+FLUSH_DOCS = 500
+FLUSH_SECONDS = 300
+MERGE_FACTOR = 6  # segments of one size tier merged at a time
+MAINTENANCE_SECONDS = 30
+
+_CJK = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff"
+_TOKEN_RE = re.compile(rf"([{_CJK}]+)|([^\W{_CJK}]+)")
+_QUERY_RE = re.compile(r'(-?)"([^"]*)"|(\S+)')
+
+
+def normalize_text(text: str) -> str:
+    return unicodedata.normalize("NFKC", text or "").lower()
+
+
+def tokenize(text: str, query: bool = False):
+    # Latin/digit runs are whole words; CJK runs yield unigrams + bigrams so
+    # that single-character and multi-character queries both hit the index.
+    # Queries only need the unigram when the run is a single character.
+    tokens = []
+    for m in _TOKEN_RE.finditer(normalize_text(text)):
+        run = m.group(1)
+        if run is None:
+            tokens.append(m.group(2))
+            continue
+        if not query or len(run) == 1:
+            tokens.extend(run)
+        tokens.extend(run[i : i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def _query_term(needle: str, phrase: bool):
+    needle = normalize_text(needle).strip()
+    tokens = set(tokenize(needle, query=True))
+    if not tokens:
+        return None
+    # Multi-token terms are confirmed against the stored text (substring)
+    verify = phrase or len(tokens) > 1
+    return (needle, tokens, verify)
+
+
+def parse_query(q: str):
+    # Space = AND, `OR` between terms, `-term` excludes, "quoted phrase"
+    groups = []
+    pending_or = False
+    for m in _QUERY_RE.finditer(q or ""):
+        neg = False
+        if m.group(3) is not None:
+            word = m.group(3)
+            if word == "OR":
+                pending_or = bool(groups)
+                continue
+            if word.startswith("-") and len(word) > 1:
+                neg, word = True, word[1:]
+            term = _query_term(word, phrase=False)
+        else:
+            neg = m.group(1) == "-"
+            term = _query_term(m.group(2), phrase=True)
+        if term is None:
+            continue
+        if pending_or and not neg and not groups[-1]["neg"]:
+            groups[-1]["alts"].append(term)
+        else:
+            groups.append({"neg": neg, "alts": [term]})
+        pending_or = False
+    return groups
+
+
+def _encode_postings(docs) -> bytes:
+    deltas = array.array("I", (b - a for a, b in zip(itertools.chain((0,), docs), docs)))
+    raw = deltas.tobytes()
+    if len(docs) >= POSTINGS_ZLIB_MIN:
+        return b"z" + zlib.compress(raw, 6)
+    return b"r" + raw
+
+
+def _decode_postings(blob) -> list:
+    raw = zlib.decompress(blob[1:]) if blob[:1] == b"z" else bytes(blob[1:])
+    deltas = array.array("I")
+    deltas.frombytes(raw)
+    return list(itertools.accumulate(deltas))
+
+
+class MemSegment:
+    def __init__(self):
+        self.ids = []
+        self.uids = []
+        self.ts = []
+        self.texts = []
+        self.terms = {}
+        self.created = time.time()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, doc_id: str, uid: str, ts: int, text: str):
+        n = len(self.ids)
+        self.ids.append(doc_id)
+        self.uids.append(uid)
+        self.ts.append(int(ts or 0))
+        self.texts.append(text or "")
+        for tok in set(tokenize(text)):
+            self.terms.setdefault(tok, []).append(n)
+
+    def postings(self, term: str):
+        return self.terms.get(term, ())
+
+    def text(self, n: int) -> str:
+        return self.texts[n]
+
+    def iter_docs(self):
+        return zip(self.ids, self.uids, self.ts, self.texts)
+
+
+class Segment:
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self.buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, _, footer_off, footer_len = SEGMENT_HEADER.unpack_from(self.buf, 0)
+        if magic != SEGMENT_MAGIC or version != SEGMENT_VERSION:
+            raise ValueError(f"Bad search segment {path}")
+        footer = json.loads(zlib.decompress(self.buf[footer_off : footer_off + footer_len]))
+        self.term_offs = dict(zip(footer["terms"], footer["offs"]))
+        self.blocks = footer["blocks"]
+        self.ids = footer["ids"]
+        self.uids = footer["uids"]
+        self.ts = footer["ts"]
+        self._block_cache = (None, None)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def postings(self, term: str):
+        loc = self.term_offs.get(term)
+        if not loc:
+            return ()
+        return _decode_postings(self.buf[loc[0] : loc[0] + loc[1]])
+
+    def _block(self, b: int):
+        cached_b, docs = self._block_cache
+        if cached_b != b:
+            off, length = self.blocks[b]
+            docs = json.loads(zlib.decompress(self.buf[off : off + length]))
+            self._block_cache = (b, docs)
+        return docs
+
+    def text(self, n: int) -> str:
+        return self._block(n // DOC_BLOCK_SIZE)[n % DOC_BLOCK_SIZE]
+
+    def iter_docs(self):
+        for n in range(len(self.ids)):
+            yield self.ids[n], self.uids[n], self.ts[n], self.text(n)
+
+
+def write_segment(path: str, docs):
+    # docs: iterable of (id, uid, ts, text); doc numbers follow input order
+    ids, uids, tss, texts = [], [], [], []
+    terms = {}
+    for n, (doc_id, uid, ts, text) in enumerate(docs):
+        ids.append(doc_id)
+        uids.append(uid)
+        tss.append(int(ts or 0))
+        texts.append(text or "")
+        for tok in set(tokenize(text)):
+            terms.setdefault(tok, []).append(n)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(b"\0" * SEGMENT_HEADER.size)
+        offs = []
+        sorted_terms = sorted(terms)
+        for term in sorted_terms:
+            blob = _encode_postings(terms[term])
+            offs.append([f.tell(), len(blob)])
+            f.write(blob)
+        blocks = []
+        for i in range(0, len(texts), DOC_BLOCK_SIZE):
+            blob = zlib.compress(
+                json.dumps(texts[i : i + DOC_BLOCK_SIZE], ensure_ascii=False).encode("utf-8"), 6
+            )
+            blocks.append([f.tell(), len(blob)])
+            f.write(blob)
+        footer = zlib.compress(
+            json.dumps(
+                {
+                    "terms": sorted_terms,
+                    "offs": offs,
+                    "blocks": blocks,
+                    "ids": ids,
+                    "uids": uids,
+                    "ts": tss,
+                },
+                ensure_ascii=False,
+                separators=(",", ":"),
+            ).encode("utf-8"),
+            6,
+        )
+        footer_off = f.tell()
+        f.write(footer)
+        f.seek(0)
+        f.write(SEGMENT_HEADER.pack(SEGMENT_MAGIC, SEGMENT_VERSION, 0, footer_off, len(footer)))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class SearchIndex:
+    def __init__(self, directory: str = None):
+        # directory=None keeps the index in memory only (mode 2)
+        self.dir = directory
+        self.lock = threading.Lock()
+        self.merge_lock = threading.Lock()
+        self.segments = []
+        self.mem = MemSegment()
+        self.frozen = []  # memtables being written out, still searchable
+        self.known_ids = set()
+        self.next_seq = 1
+        self._stop = threading.Event()
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.dir, "manifest.json")
+
+    def load(self):
+        if not self.dir:
+            return
+        os.makedirs(self.dir, exist_ok=True)
+        if not os.path.exists(self.manifest_path):
+            return
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            self.next_seq = int(manifest.get("next_seq", 1))
+            for name in manifest.get("segments", []):
+                seg = Segment(os.path.join(self.dir, name))
+                self.segments.append(seg)
+                self.known_ids.update(seg.ids)
+        except Exception as e:
+            log(f"[search] failed to load index: {e}", "error")
+
+    def _write_manifest(self):
+        data = {
+            "next_seq": self.next_seq,
+            "segments": [os.path.basename(s.path) for s in self.segments],
+        }
+        tmp = self.manifest_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp, self.manifest_path)
+
+    def _new_segment_path(self):
+        path = os.path.join(self.dir, "seg-%06d.bin" % self.next_seq)
+        self.next_seq += 1
+        return path
+
+    def contains(self, doc_id: str) -> bool:
+        return doc_id in self.known_ids
+
+    def add(self, docs):
+        # docs: iterable of (id, uid, ts, text); already-indexed ids are skipped
+        flush = False
+        with self.lock:
+            for doc_id, uid, ts, text in docs:
+                if not doc_id or doc_id in self.known_ids:
+                    continue
+                self.known_ids.add(doc_id)
+                self.mem.add(doc_id, uid, ts, text)
+            flush = len(self.mem) >= FLUSH_DOCS
+        if flush:
+            self.flush()
+
+    def flush(self):
+        # Runs on the poll thread too: the memtable is swapped out under
+        # self.lock and written without waiting for a background merge
+        if not self.dir:
+            return
+        with self.lock:
+            mem = self.mem
+            if not len(mem):
+                return
+            self.mem = MemSegment()
+            self.frozen.append(mem)
+            path = self._new_segment_path()
+        try:
+            write_segment(path, mem.iter_docs())
+            seg = Segment(path)
+        except Exception as e:
+            log(f"[search] flush failed: {e}", "error")
+            with self.lock:
+                # Put the docs back in front of anything added meanwhile
+                self.frozen.remove(mem)
+                fresh = MemSegment()
+                for doc in itertools.chain(mem.iter_docs(), self.mem.iter_docs()):
+                    fresh.add(*doc)
+                self.mem = fresh
+            return
+        with self.lock:
+            self.frozen.remove(mem)
+            self.segments.append(seg)
+            self._write_manifest()
+
+    @staticmethod
+    def _tier(seg) -> int:
+        # Tier t holds segments of up to FLUSH_DOCS * MERGE_FACTOR**t docs, so
+        # merging one full tier lands in the next and each doc is rewritten
+        # about log(N) times instead of on every merge
+        tier, cap = 0, FLUSH_DOCS
+        while len(seg) > cap:
+            tier += 1
+            cap *= MERGE_FACTOR
+        return tier
+
+    def _pick_victims(self):
+        tiers = {}
+        for seg in self.segments:
+            tiers.setdefault(self._tier(seg), []).append(seg)
+        for tier in sorted(tiers):
+            if len(tiers[tier]) >= MERGE_FACTOR:
+                return sorted(tiers[tier], key=len)[:MERGE_FACTOR]
+        return None
+
+    def merge(self):
+        if not self.dir or len(self.segments) < MERGE_FACTOR:
+            return
+        with self.merge_lock:
+            with self.lock:
+                victims = self._pick_victims()
+                if not victims:
+                    return
+                path = self._new_segment_path()
+            # Keep doc order roughly chronological inside the merged segment
+            docs = sorted(
+                itertools.chain.from_iterable(s.iter_docs() for s in victims),
+                key=lambda d: d[2],
+            )
+            try:
+                write_segment(path, docs)
+                merged = Segment(path)
+            except Exception as e:
+                log(f"[search] merge failed: {e}", "error")
+                return
+            with self.lock:
+                keep = [s for s in self.segments if s not in victims]
+                self.segments = keep + [merged]
+                self._write_manifest()
+            for s in victims:
+                try:
+                    os.remove(s.path)
+                except OSError:
+                    pass
+            log(f"[search] merged {len(victims)} segments into {os.path.basename(path)}")
+
+    def start(self):
+        def run():
+            while not self._stop.wait(MAINTENANCE_SECONDS):
+                try:
+                    if len(self.mem) and time.time() - self.mem.created >= FLUSH_SECONDS:
+                        self.flush()
+                    self.merge()
+                except Exception as e:
+                    log(f"[search] maintenance failed: {e}", "error")
+
+        t = threading.Thread(target=run, daemon=True)
+        t.start()
+        return t
+
+    def stop(self):
+        self._stop.set()
+        self.flush()
+
+    def search(self, q: str, uids=None, since: int = None, until: int = None, limit: int = 20):
+        groups = parse_query(q)
+        if not any(not g["neg"] for g in groups):
+            raise ValueError("query needs at least one positive term")
+        uids = set(uids) if uids else None
+        with self.lock:
+            segments = self.frozen + self.segments
+            # Memtable is mutated in place, so evaluate it under the lock
+            mem = self.mem
+            hits = self._candidates(mem, groups, uids, since, until)
+            mem_hits = [(mem.ts[n], mem, n) for n in hits]
+            mem_texts = {n: mem.texts[n] for n in hits}
+        found = mem_hits
+        for seg in segments:
+            found.extend((seg.ts[n], seg, n) for n in self._candidates(seg, groups, uids, since, until))
+        found.sort(key=lambda x: x[0], reverse=True)
+
+        results = []
+        needs_text = any(t[2] for g in groups for t in g["alts"])
+        for ts, seg, n in found:
+            text = mem_texts[n] if seg is mem else seg.text(n)
+            if needs_text and not self._verify(normalize_text(text), groups):
+                continue
+            results.append({"id": seg.ids[n], "uid": seg.uids[n], "ts": ts, "text": text})
+            if len(results) >= limit:
+                break
+        return results, len(found)
+
+    @staticmethod
+    def _term_docs(seg, term):
+        docs = None
+        for tok in sorted(term[1], key=len, reverse=True):
+            p = seg.postings(tok)
+            docs = set(p) if docs is None else docs.intersection(p)
+            if not docs:
+                return set()
+        return docs
+
+    def _candidates(self, seg, groups, uids, since, until):
+        result = None
+        for g in groups:
+            if g["neg"]:
+                continue
+            union = set()
+            for term in g["alts"]:
+                union |= self._term_docs(seg, term)
+            result = union if result is None else result & union
+            if not result:
+                return set()
+        for g in groups:
+            if not g["neg"]:
+                continue
+            for term in g["alts"]:
+                # Only exact-token negations can be applied without text
+                if not term[2]:
+                    result -= self._term_docs(seg, term)
+        if uids is not None or since or until:
+            result = {
+                n
+                for n in result
+                if (uids is None or seg.uids[n] in uids)
+                and (not since or seg.ts[n] >= since)
+                and (not until or seg.ts[n] < until)
+            }
+        return result
+
+    @staticmethod
+    def _verify(text: str, groups) -> bool:
+        tokens = None
+
+        def has(term):
+            nonlocal tokens
+            if term[2]:
+                return term[0] in text
+            if tokens is None:
+                tokens = set(tokenize(text))
+            return term[1] <= tokens
+
+        for g in groups:
+            if any(has(t) for t in g["alts"]) == g["neg"]:
+                return False
+        return True
+
+    def stats(self):
+        with self.lock:
+            return {
+                "docs": len(self.known_ids),
+                "segments": len(self.segments),
+                "memtable": len(self.mem) + sum(len(m) for m in self.frozen),
+            }
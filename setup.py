@@ -2,7 +2,28 @@ from setuptools import setup
 import os
 
 APP = ["menubar.py"]
-DATA_FILES = ["main.py", "config.example.json", "config.app.example.json"]
+DATA_FILES = [
+    "main.py",
+    "applog.py",
+    "archive.py",
+    "capture.py",
+    "circuit.py",
+    "clock.py",
+    "control.py",
+    "egress.py",
+    "engagement.py",
+    "filters.py",
+    "followings.py",
+    "images.py",
+    "latency.py",
+    "live.py",
+    "search_index.py",
+    "snapshot.py",
+    "verifier.py",
+    "webhook.py",
+    "config.example.json",
+    "config.app.example.json",
+]
 
 iconfile = None
 if os.path.exists("BiliNotify.icns"):
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+import mmap
+import os
+import struct
+import time
+
+# status.bin: header, fixed-size rows sorted by UID, then a UTF-8 string pool.
+# Every write goes to a new file renamed over the old one, so a mapped file
+# never changes underneath a reader.
+MAGIC = b"BMSN"
+FORMAT = 1
+# magic, format, header size, writer instance, state version, written at,
+# rows, total unread, string pool bytes
+HEADER = struct.Struct("<4sHHQQqIII")
+# uid offset, name offset, uid length, name length, unread, last seen ts
+ROW = struct.Struct("<IIHHIq")
+NAME_MAX = 200
+
+
+class SnapshotWriter:
+    def __init__(self, path: str):
+        self.path = path
+        # Versions restart at 0 with the process; readers compare both
+        self.instance = int.from_bytes(os.urandom(8), "little")
+        self.writes = 0
+
+    def write(self, version: int, rows):
+        # rows: (uid, name, unread count, last seen ts)
+        encoded = sorted(
+            (uid.encode("utf-8"), (name or "")[:NAME_MAX].encode("utf-8"), unread, ts or 0)
+            for uid, name, unread, ts in rows
+        )
+        packed = bytearray()
+        pool = bytearray()
+        total = 0
+        for uid, name, unread, ts in encoded:
+            packed += ROW.pack(len(pool), len(pool) + len(uid), len(uid), len(name), unread, ts)
+            pool += uid
+            pool += name
+            total += unread
+        header = HEADER.pack(
+            MAGIC, FORMAT, HEADER.size, self.instance, version, int(time.time()), len(encoded), total, len(pool)
+        )
+        tmp = self.path + ".tmp"
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            f.write(header)
+            f.write(packed)
+            f.write(pool)
+        os.replace(tmp, self.path)
+        self.writes += 1
+
+
+class SnapshotReader:
+    # Maps status.bin read-only. refresh() costs one stat() while nothing
+    # changed; rows are decoded only when asked for.
+    def __init__(self, path: str):
+        self.path = path
+        self._map = None
+        self._key = None
+        self._rows_at = 0
+        self._pool_at = 0
+        self.instance = None
+        self.version = None
+        self.written_at = 0
+        self.count = 0
+        self.total_unread = 0
+
+    def refresh(self) -> bool:
+        # True when a snapshot with a different (instance, version) is now mapped
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return False
+        key = (st.st_ino, st.st_mtime_ns, st.st_size)
+        if key == self._key or st.st_size < HEADER.size:
+            return False
+        with open(self.path, "rb") as f:
+            m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, fmt, header_size, instance, version, written_at, count, total, pool = HEADER.unpack_from(m, 0)
+        if magic != MAGIC or fmt != FORMAT or len(m) < header_size + count * ROW.size + pool:
+            m.close()
+            return False
+        if self._map is not None:
+            self._map.close()
+        self._map = m
+        self._key = key
+        self._rows_at = header_size
+        self._pool_at = header_size + count * ROW.size
+        changed = (instance, version) != (self.instance, self.version)
+        self.instance, self.version = instance, version
+        self.written_at, self.count, self.total_unread = written_at, count, total
+        return changed
+
+    def fresh(self, max_age: float) -> bool:
+        # A snapshot is only rewritten by a running monitor; an old one was
+        # left behind by a process that is gone (or stuck)
+        return self._map is not None and time.time() - self.written_at <= max_age
+
+    def row(self, i: int):
+        # (uid, name, unread, last seen ts)
+        uid_off, name_off, uid_len, name_len, unread, ts = ROW.unpack_from(self._map, self._rows_at + i * ROW.size)
+        base = self._pool_at
+        uid = self._map[base + uid_off : base + uid_off + uid_len].decode("utf-8")
+        name = self._map[base + name_off : base + name_off + name_len].decode("utf-8")
+        return uid, name, unread, ts
+
+    def rows(self):
+        return [self.row(i) for i in range(self.count)] if self._map is not None else []
+
+    def get(self, uid: str):
+        # Binary search over the UID-sorted rows
+        if self._map is None:
+            return None
+        key = uid.encode("utf-8")
+        lo, hi = 0, self.count
+        base = self._pool_at
+        while lo < hi:
+            mid = (lo + hi) // 2
+            uid_off, _, uid_len, _, _, _ = ROW.unpack_from(self._map, self._rows_at + mid * ROW.size)
+            probe = self._map[base + uid_off : base + uid_off + uid_len]
+            if probe < key:
+                lo = mid + 1
+            elif probe > key:
+                hi = mid
+            else:
+                return self.row(mid)
+        return None
+
+    def unread(self):
+        # Same shape as the /status items
+        return [{"uid": uid, "name": name or uid, "count": n} for uid, name, n, _ in self.rows() if n]
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+        self._map = None
+        self._key = None
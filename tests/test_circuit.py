@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from applog import LOGGER  # noqa: E402
+from circuit import CircuitBreaker  # noqa: E402
+
+
+class CircuitBreakerTest(unittest.TestCase):
+    def setUp(self):
+        LOGGER.configure(echo=False, level="error")
+        self.now = 1000.0
+        self.probes = 0
+        self.up = False
+
+    def probe(self):
+        self.probes += 1
+        time.sleep(0.1)
+        return self.up
+
+    def breaker(self):
+        breaker = CircuitBreaker(self.probe, threshold=2, probe_min=10, clock=lambda: self.now)
+        breaker.record_failure()
+        breaker.record_failure()
+        self.assertTrue(breaker.is_open)
+        return breaker
+
+    def allow_from_threads(self, breaker, n=8):
+        start = threading.Barrier(n)
+        results = []
+
+        def worker():
+            start.wait()
+            results.append(breaker.allow())
+
+        threads = [threading.Thread(target=worker) for _ in range(n)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return results
+
+    def test_fails_fast_until_probe_due(self):
+        breaker = self.breaker()
+        self.assertFalse(breaker.allow())
+        self.assertEqual(self.probes, 0)
+
+    def test_single_probe_under_concurrency(self):
+        breaker = self.breaker()
+        self.now += 10
+        self.up = True
+        results = self.allow_from_threads(breaker)
+        self.assertEqual(self.probes, 1)
+        self.assertEqual(results.count(True), 1)
+        self.assertFalse(breaker.is_open)
+        self.assertTrue(breaker.allow())
+
+    def test_failed_probe_backs_off(self):
+        breaker = self.breaker()
+        self.now += 10
+        self.assertEqual(self.allow_from_threads(breaker).count(True), 0)
+        self.assertEqual(self.probes, 1)
+        self.assertEqual(breaker.seconds_until_probe(), 20)
+        self.now += 20
+        self.up = True
+        self.assertTrue(breaker.allow())
+        self.assertEqual(breaker.stats()["recoveries"], 1)
+        self.assertEqual(breaker.last_outage, 30)
+
+
+if __name__ == "__main__":
+    unittest.main()
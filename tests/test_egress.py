@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+import os
+import socket
+import sys
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import requests
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import egress  # noqa: E402
+from applog import LOGGER  # noqa: E402
+from egress import EgressPool  # noqa: E402
+
+FEED_URL = "http://api.bilibili.test/x/polymer/web-dynamic/v1/feed/space"
+DETAIL_URL = "http://api.bilibili.test/x/polymer/web-dynamic/v1/detail"
+
+
+class StandInProxy:
+    # Plays an HTTP proxy: answers absolute-form requests itself instead of
+    # forwarding them, and remembers which UIDs and dynamic ids came through it
+    def __init__(self):
+        self.uids = []
+        self.ids = []
+        self.risk = False
+        proxy = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                query = parse_qs(urlparse(self.path).query)
+                if "id" in query:
+                    proxy.ids.append(query["id"][0])
+                else:
+                    proxy.uids.append(query.get("host_mid", [""])[0])
+                body = b'{"code":-412,"message":"risk"}' if proxy.risk else b'{"code":0,"data":{}}'
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def closed_port_url():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return f"http://127.0.0.1:{s.getsockname()[1]}"
+
+
+class EgressPoolTest(unittest.TestCase):
+    def setUp(self):
+        LOGGER.configure(echo=False, level="error")
+        self.proxies = {name: StandInProxy() for name in ("a", "b", "c")}
+        self.now = 1000.0
+        self.uids = [str(100000 + i) for i in range(200)]
+
+    def tearDown(self):
+        for p in self.proxies.values():
+            p.close()
+
+    def pool(self, names=("a", "b", "c"), extra=()):
+        specs = [{"name": n, "proxy": self.proxies[n].url} for n in names] + list(extra)
+        pool = EgressPool(requests.Session(), specs, evict_seconds=600, clock=lambda: self.now)
+        self.addCleanup(pool.close)
+        return pool
+
+    def assignment(self, pool):
+        return {uid: pool.exit_for(uid).name for uid in self.uids}
+
+    def fetch(self, pool, uid):
+        return pool.get(FEED_URL, params={"host_mid": uid}, timeout=5)
+
+    def test_requests_go_through_the_assigned_proxy(self):
+        pool = self.pool()
+        assigned = self.assignment(pool)
+        for uid in self.uids[:30]:
+            self.fetch(pool, uid)
+        for uid in self.uids[:30]:
+            self.assertIn(uid, self.proxies[assigned[uid]].uids)
+        self.assertEqual(set(assigned.values()), {"a", "b", "c"})
+
+    def test_detail_requests_spread_by_dynamic_id(self):
+        pool = self.pool()
+        ids = [str(9 * 10**17 + i) for i in range(60)]
+        for dynamic_id in ids:
+            pool.get(DETAIL_URL, params={"id": dynamic_id}, timeout=5)
+        used = [name for name, p in self.proxies.items() if p.ids]
+        self.assertEqual(sorted(used), ["a", "b", "c"])
+        # Rechecking the same dynamic goes through the same exit
+        first = next(name for name, p in self.proxies.items() if ids[0] in p.ids)
+        pool.get(DETAIL_URL, params={"id": ids[0]}, timeout=5)
+        self.assertEqual(self.proxies[first].ids.count(ids[0]), 2)
+
+    def test_health_changes_do_not_move_uids(self):
+        pool = self.pool()
+        before = self.assignment(pool)
+        pool._failed(pool.exits[0], OSError("flaky"))
+        self.assertTrue(pool.exits[0].available(self.now))
+        pool._succeeded(pool.exits[1])
+        self.assertEqual(self.assignment(pool), before)
+
+    def test_removing_an_exit_only_moves_its_uids(self):
+        before = self.assignment(self.pool())
+        after = self.assignment(self.pool(names=("a", "b")))
+        for uid, name in before.items():
+            if name != "c":
+                self.assertEqual(after[uid], name)
+
+    def test_risk_control_evicts_and_fails_over(self):
+        pool = self.pool()
+        uid = next(u for u, n in self.assignment(pool).items() if n == "a")
+        self.proxies["a"].risk = True
+        r = self.fetch(pool, uid)
+        self.assertEqual(r.json()["code"], 0)
+        self.assertFalse(pool.exits[0].available(self.now))
+        self.assertEqual(pool.stats()["failovers"], 1)
+        # Back after evict_seconds, with its UIDs
+        self.proxies["a"].risk = False
+        self.now += 601
+        self.assertEqual(pool.exit_for(uid).name, "a")
+
+    def test_unreachable_proxy_fails_over_and_is_skipped(self):
+        pool = self.pool(names=("a",), extra=[{"name": "dead", "proxy": closed_port_url()}])
+        uids = [u for u in self.uids if pool.exit_for(u).name == "dead"][: egress.FAIL_THRESHOLD]
+        for uid in uids:
+            self.assertEqual(self.fetch(pool, uid).json()["code"], 0)
+        dead = pool.exits[1]
+        self.assertFalse(dead.available(self.now))
+        self.assertEqual(self.proxies["a"].uids, uids)
+
+
+if __name__ == "__main__":
+    unittest.main()
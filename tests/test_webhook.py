@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import webhook  # noqa: E402
+from applog import LOGGER  # noqa: E402
+from webhook import WebhookSink  # noqa: E402
+
+
+class Receiver:
+    # Local webhook endpoint; answers `status` (503 while failing) and keeps every body
+    def __init__(self):
+        self.bodies = []
+        self.status = 200
+        self.fail_next = 0
+        receiver = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                if receiver.fail_next:
+                    receiver.fail_next -= 1
+                    status = 503
+                else:
+                    status = receiver.status
+                body["status"] = status
+                receiver.bodies.append(body)
+                self.send_response(status)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = HTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/hook"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def delivered(self):
+        return [b for b in self.bodies if b["status"] == 200]
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def wait_for(cond, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if cond():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def event(n):
+    return {"type": "dynamic", "uid": "1", "name": "a", "id": str(n), "url": "", "detected_at": n}
+
+
+class WebhookSinkTest(unittest.TestCase):
+    def setUp(self):
+        LOGGER.configure(echo=False, level="error")
+        self.receiver = Receiver()
+        self.dir = tempfile.mkdtemp()
+        self.retry_min = webhook.RETRY_MIN_SECONDS
+        webhook.RETRY_MIN_SECONDS = 0.05
+        self.sinks = []
+
+    def tearDown(self):
+        for sink in self.sinks:
+            sink.stop(timeout=1)
+        webhook.RETRY_MIN_SECONDS = self.retry_min
+        self.receiver.close()
+
+    def sink(self):
+        sink = WebhookSink([{"url": self.receiver.url, "batch_window": 0.05}], directory=self.dir)
+        sink.load()
+        sink.start()
+        self.sinks.append(sink)
+        return sink
+
+    def journal(self):
+        return [n for n in os.listdir(self.dir) if n.endswith(".json")]
+
+    def test_batches_and_delivers(self):
+        sink = self.sink()
+        sink.submit([event(1), event(2)])
+        sink.submit([event(3)])
+        self.assertTrue(wait_for(lambda: len(self.receiver.delivered()) == 1))
+        body = self.receiver.delivered()[0]
+        self.assertEqual([e["id"] for e in body["events"]], ["1", "2", "3"])
+        self.assertEqual(body["source"], "bilibiliMessage")
+        self.assertTrue(wait_for(lambda: not self.journal()))
+
+    def test_retries_with_the_same_batch_id(self):
+        self.receiver.fail_next = 2
+        sink = self.sink()
+        sink.submit([event(1)])
+        self.assertTrue(wait_for(lambda: len(self.receiver.delivered()) == 1))
+        self.assertEqual(len(self.receiver.bodies), 3)
+        self.assertEqual(len({b["batch"] for b in self.receiver.bodies}), 1)
+        stats = sink.stats()[self.receiver.url]
+        self.assertEqual((stats["sent"], stats["failed"]), (1, 2))
+
+    def test_journal_survives_restart(self):
+        self.receiver.status = 503
+        first = self.sink()
+        first.submit([event(1)])
+        self.assertTrue(wait_for(lambda: self.receiver.bodies))
+        first.stop(timeout=1)
+        self.assertEqual(len(self.journal()), 1)
+        failed_id = self.receiver.bodies[0]["batch"]
+
+        self.receiver.status = 200
+        self.sink()
+        self.assertTrue(wait_for(lambda: self.receiver.delivered()))
+        delivered = self.receiver.delivered()[0]
+        self.assertEqual(delivered["batch"], failed_id)
+        self.assertEqual(delivered["events"][0]["id"], "1")
+        self.assertTrue(wait_for(lambda: not self.journal()))
+
+    def test_batch_ids_not_reused_after_restart(self):
+        first = self.sink()
+        first.submit([event(1)])
+        self.assertTrue(wait_for(lambda: len(self.receiver.delivered()) == 1))
+        first.stop(timeout=1)
+        self.assertFalse(self.journal())
+
+        self.sink().submit([event(2)])
+        self.assertTrue(wait_for(lambda: len(self.receiver.delivered()) == 2))
+        ids = [b["batch"] for b in self.receiver.delivered()]
+        self.assertNotEqual(ids[0], ids[1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+import argparse
+import http.client
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+import main as app  # noqa: E402
+
+DEFAULT_SCENARIOS = "10:100,1000:10000,10000:100000"
+ENDPOINTS = ("/status", "/", "/api/unread", "/read", "/readall")
+
+
+class TimedLock:
+    # Drop-in for ReadState.lock (writers only) that records how long acquirers waited
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.acquired = 0
+        self.contended = 0
+        self.wait_s = 0.0
+        self.max_wait_s = 0.0
+        self.poller_waits = []
+
+    def __enter__(self):
+        if self._lock.acquire(blocking=False):
+            self.acquired += 1
+            return self
+        started = time.perf_counter()
+        self._lock.acquire()
+        waited = time.perf_counter() - started
+        self.acquired += 1
+        self.contended += 1
+        self.wait_s += waited
+        self.max_wait_s = max(self.max_wait_s, waited)
+        if threading.current_thread().name == "poller":
+            self.poller_waits.append(waited)
+        return self
+
+    def __exit__(self, *exc):
+        self._lock.release()
+
+    def stats(self):
+        waits = sorted(self.poller_waits)
+        return {
+            "acquired": self.acquired,
+            "contended": self.contended,
+            "wait_ms": round(self.wait_s * 1000, 1),
+            "max_wait_ms": round(self.max_wait_s * 1000, 2),
+            "poller_contended": len(waits),
+            "poller_p99_wait_ms": round(percentile(waits, 99) * 1000, 2) if waits else 0.0,
+        }
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    i = min(len(sorted_values) - 1, int(round(p / 100 * (len(sorted_values) - 1))))
+    return sorted_values[i]
+
+
+def fill_state(state, uids: int, items: int, seed: int = 1):
+    rng = random.Random(seed)
+    now = int(time.time())
+    per_uid = max(1, items // uids)
+    unread, names = {}, {}
+    for u in range(uids):
+        uid = str(100000 + u)
+        names[uid] = f"user{u}"
+        # Detection order, like add_unread: ts never decreases along the list
+        stamps = sorted(now - rng.randrange(86400 * 7) for _ in range(per_uid))
+        unread[uid] = [{"id": str(9 * 10**17 + u * 10**6 + i), "ts": ts} for i, ts in enumerate(stamps)]
+    state.restore({"unread": unread, "names": names})
+
+
+class SimulatedPoller:
+    # Mutates the state the way poll cycles do while clients hammer the server
+    def __init__(self, state, uids, rate: float):
+        self.state = state
+        self.uids = uids
+        self.rate = rate
+        self.ops = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def run(self):
+        n = 0
+        interval = 1.0 / self.rate if self.rate else 0
+        while not self._stop.is_set():
+            uid = self.uids[n % len(self.uids)]
+            new_id = str(8 * 10**17 + n)
+            self.state.add_unread(uid, [new_id])
+            self.state.set_last_seen(uid, new_id, int(time.time()))
+            self.ops += 1
+            n += 1
+            if interval:
+                self._stop.wait(interval)
+
+    def start(self):
+        if self.rate <= 0:
+            return
+        self._thread = threading.Thread(target=self.run, name="poller", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+
+def request(port: int, path: str, timeout: float = 30):
+    conn = http.client.HTTPConnection(app.SERVER_HOST, port, timeout=timeout)
+    try:
+        conn.request("GET", path)
+        resp = conn.getresponse()
+        body = resp.read()
+        return resp.status, len(body)
+    finally:
+        conn.close()
+
+
+def drive(port: int, make_path, clients: int, duration: float):
+    latencies = []
+    errors = [0]
+    sizes = [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker(seed):
+        rng = random.Random(seed)
+        local = []
+        size = 0
+        errs = 0
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                status, n = request(port, make_path(rng))
+                if status != 200:
+                    errs += 1
+                size += n
+            except OSError:
+                errs += 1
+            local.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(local)
+            sizes[0] += size
+            errors[0] += errs
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(clients)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return summarize(latencies, errors[0], sizes[0], time.perf_counter() - started)
+
+
+def summarize(latencies, errors, size, elapsed):
+    latencies.sort()
+    n = len(latencies)
+    return {
+        "requests": n,
+        "errors": errors,
+        "req_per_s": round(n / elapsed, 1) if elapsed else None,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "max_ms": round(latencies[-1] * 1000, 2) if n else 0.0,
+        "avg_bytes": int(size / n) if n else 0,
+    }
+
+
+def bench_readall(state, port: int, token: str, uids: int, items: int, iterations: int):
+    # Each call empties the state, so refill and time one request at a time
+    latencies = []
+    errors = 0
+    size = 0
+    started = time.perf_counter()
+    for i in range(iterations):
+        fill_state(state, uids, items, seed=i)
+        t = time.perf_counter()
+        status, n = request(port, f"/readall?token={token}")
+        latencies.append(time.perf_counter() - t)
+        errors += status != 200
+        size += n
+    return summarize(latencies, errors, size, sum(latencies) or (time.perf_counter() - started))
+
+
+def run_scenario(uids: int, items: int, args):
+    state = app.ReadState(persist=args.persist)
+    state.lock = TimedLock()
+    fill_state(state, uids, items)
+    uid_list = state.get_unread_uids()
+    token = state.token
+    app.SERVER_PORT = 0
+    server = app.start_server(state)
+    port = server.server_address[1]
+    paths = {
+        "/status": lambda rng: f"/status?token={token}",
+        "/": lambda rng: f"/?token={token}",
+        "/api/unread": lambda rng: f"/api/unread?token={token}&limit=50",
+        "/read": lambda rng: f"/read?uid={rng.choice(uid_list)}&token={token}",
+    }
+    poller = SimulatedPoller(state, uid_list, args.poller_rate)
+    poller.start()
+    results = {}
+    try:
+        for endpoint in args.endpoints:
+            if endpoint == "/readall":
+                continue
+            results[endpoint] = drive(port, paths[endpoint], args.clients, args.duration)
+        poller_ops = poller.ops
+    finally:
+        poller.stop()
+    if "/readall" in args.endpoints:
+        results["/readall"] = bench_readall(state, port, token, uids, items, args.readall_iterations)
+    server.shutdown()
+    server.server_close()
+    return {
+        "scenario": {"uids": uids, "unread_items": items, "clients": args.clients, "persist": args.persist},
+        "endpoints": results,
+        "lock": state.lock.stats(),
+        "poller": {"ops": poller_ops, "target_per_s": args.poller_rate},
+    }
+
+
+def parse_scenarios(text: str):
+    out = []
+    for part in text.split(","):
+        uids, _, items = part.partition(":")
+        out.append((int(uids), int(items or uids)))
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the local read/status server with synthetic state")
+    parser.add_argument(
+        "--scenarios",
+        default=DEFAULT_SCENARIOS,
+        help=f"comma-separated UIDS:UNREAD_ITEMS pairs (default {DEFAULT_SCENARIOS})",
+    )
+    parser.add_argument("--clients", type=int, default=8, help="concurrent clients per endpoint")
+    parser.add_argument("--duration", type=float, default=3.0, help="seconds per endpoint")
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS))
+    parser.add_argument("--readall-iterations", type=int, default=5)
+    parser.add_argument(
+        "--poller-rate", type=float, default=50, help="state mutations/s from a simulated poller (0 disables)"
+    )
+    parser.add_argument("--persist", action="store_true", help="write state.json (to a temp dir) on every mutation")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+    args.endpoints = [e for e in args.endpoints.split(",") if e]
+    unknown = set(args.endpoints).difference(ENDPOINTS)
+    if unknown:
+        print(f"Unknown endpoints: {', '.join(sorted(unknown))}. Use {', '.join(ENDPOINTS)}")
+        sys.exit(1)
+
+    # Keep the real config dir and main.log out of it
+    tmp = tempfile.mkdtemp(prefix="bench_server_")
+    app.APP_DIR = tmp
+    app.STATE_FILE = os.path.join(tmp, "state.json")
+    app.LOGGER.configure(echo=False, level="warning")
+
+    reports = [run_scenario(uids, items, args) for uids, items in parse_scenarios(args.scenarios)]
+    if args.json:
+        print(json.dumps(reports, indent=2))
+        return
+    for report in reports:
+        sc = report["scenario"]
+        print(f"== {sc['uids']} UIDs / {sc['unread_items']} unread, {sc['clients']} clients")
+        print(f"  {'endpoint':<12} {'req':>7} {'err':>5} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'max ms':>9} {'bytes':>9}")
+        for endpoint, r in report["endpoints"].items():
+            print(
+                f"  {endpoint:<12} {r['requests']:>7} {r['errors']:>5} {r['req_per_s']:>9} "
+                f"{r['p50_ms']:>9} {r['p99_ms']:>9} {r['max_ms']:>9} {r['avg_bytes']:>9}"
+            )
+        print(f"  lock: {report['lock']}")
+        print(f"  poller: {report['poller']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+from control import CONTROL_SOCKET, call  # noqa: E402
+
+
+def fmt_ts(ts):
+    return time.strftime("%H:%M:%S", time.localtime(ts)) if ts else "-"
+
+
+def show(cmd, result):
+    if cmd == "status":
+        if not result:
+            print("No unread")
+        for row in result:
+            print(f"{row['uid']:>12}  {row['count']:>4}  {row['name']}")
+    elif cmd == "queue":
+        print(f"{result['uids']} UIDs, cursor {result['cursor']}, {result['rolled_over']} rolled over, "
+              f"{result['pending_changes']} pending UID changes, {result['catching_up']} catching up")
+        for uid in result["next"]:
+            print(f"  {uid}")
+    elif cmd == "timings":
+        for row in result:
+            err = f"  {row['error']}" if row.get("error") else ""
+            print(f"{row['uid']:>12}  {row['ms']:>7} ms  +{row['new']}  at {fmt_ts(row['at'])}{err}")
+    elif cmd == "latency":
+        slo = result["slo"]
+        state = "met" if slo["met"] else "MISSED"
+        print(f"SLO {slo['target']}: {state} ({slo['within']}/{slo['samples']} within, "
+              f"error budget left {slo['error_budget_left']}) over {result['window_hours']}h")
+        for stage, h in result["stages"].items():
+            print(f"  {stage:<7} n={h['count']:<6} p50<={h['p50']}s p90<={h['p90']}s p95<={h['p95']}s p99<={h['p99']}s")
+        print("  median steps: " + ", ".join(f"{k} {v}s" for k, v in result["breakdown"].items()))
+        for row in result["uids"]:
+            print(f"{row['uid']:>12}  n={row['samples']:<3} p50 {row['p50']}s  p95 {row['p95']}s  max {row['max']}s")
+        for r in result.get("recent", []):
+            notified = f"{r['notified'] - r['pub']:.0f}s" if r["notified"] else "-"
+            print(f"  {r['id']}  posted {fmt_ts(r['pub'])}  added +{r['added'] - r['pub']:.0f}s  notified {notified}")
+    elif cmd in ("read", "readall", "mark"):
+        print(f"Removed {result['removed']}")
+    else:
+        print(json.dumps(result, indent=2, ensure_ascii=False))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query or drive a running monitor over its control socket")
+    parser.add_argument("--socket", default=CONTROL_SOCKET, help=f"default {CONTROL_SOCKET}")
+    parser.add_argument("--json", action="store_true", help="print the raw result as JSON")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("status", help="unread counts per UID")
+    p = sub.add_parser("read", help="mark UIDs read")
+    p.add_argument("uids", nargs="+")
+    sub.add_parser("readall", help="mark everything read")
+    p = sub.add_parser("mark", help="mark single dynamics / older entries read")
+    p.add_argument("--uid", action="append", default=[], help="limit to this UID (repeatable)")
+    p.add_argument("--ids", nargs="+", default=[])
+    p.add_argument("--before", type=int, help="unix time; entries older than this")
+    p = sub.add_parser("queue", help="poll order from the current cursor")
+    p.add_argument("--limit", type=int, default=20)
+    sub.add_parser("backoff", help="circuit breaker, egress and vc fallback state")
+    p = sub.add_parser("timings", help="last fetch time per UID, slowest first")
+    p.add_argument("--uid")
+    p.add_argument("--limit", type=int, default=20)
+    sub.add_parser("stats", help="counters of every subsystem")
+    p = sub.add_parser("latency", help="posting-to-detection latency and SLO")
+    p.add_argument("--uid", help="one UID with its recent detections")
+    args = parser.parse_args()
+
+    if args.cmd == "read":
+        params = {"uids": args.uids}
+    elif args.cmd == "mark":
+        if not (args.ids or args.before):
+            parser.error("mark needs --ids or --before")
+        params = {"uids": args.uid, "ids": args.ids, "before": args.before}
+    elif args.cmd in ("queue", "timings"):
+        params = {"limit": args.limit, "uid": getattr(args, "uid", None)}
+    elif args.cmd == "latency":
+        params = {"uid": args.uid}
+    else:
+        params = {}
+
+    try:
+        reply = call(args.socket, args.cmd, params)
+    except (OSError, ValueError) as e:
+        print(f"Cannot reach the monitor at {args.socket}: {e}")
+        sys.exit(1)
+    if not reply.get("ok"):
+        print(f"Error: {reply.get('error')}")
+        sys.exit(1)
+    if args.json:
+        print(json.dumps(reply["result"], indent=2, ensure_ascii=False))
+    else:
+        show(args.cmd, reply["result"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+import argparse
+import gc
+import hashlib
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+import main as app  # noqa: E402
+from capture import ReplaySession  # noqa: E402
+from filters import compile_filter_rules  # noqa: E402
+
+
+def gc_collections():
+    return sum(s["collections"] for s in gc.get_stats())
+
+
+def unread_digest(state):
+    _, unread, _ = state.unread_snapshot()
+    lines = sorted(f"{uid}:{x.get('id')}" for uid, items in unread.items() for x in items)
+    return hashlib.sha1("\n".join(lines).encode("utf-8")).hexdigest()[:12], len(lines), len(unread)
+
+
+def replay(path: str, config: dict, realtime: bool, trace: bool, show_log: bool = False):
+    # Never touch the real main.log; only echo when asked to
+    app.LOGGER.configure(echo=show_log, level="info" if show_log else "warning")
+    session = ReplaySession(path, realtime=realtime)
+    uids = session.uids()
+    state = app.ReadState(persist=False)
+    notifications = []
+    poller = app.Poller(
+        session,
+        state,
+        uids,
+        rules=compile_filter_rules(config.get("filters")),
+        vc_policy=app.build_vc_policy(config),
+        notifier=lambda title, message, url: notifications.append(message),
+    )
+    gc.collect()
+    if trace:
+        tracemalloc.start()
+    blocks_before = sys.getallocatedblocks()
+    gc_before = gc_collections()
+    cycles = 0
+    started = time.perf_counter()
+    if session.remaining("name") or config.get("uid_names"):
+        poller.resolve_names(config.get("uid_names", {}) or {})
+    poller.init_all()
+    while session.remaining("feed"):
+        poller.poll_cycle()
+        cycles += 1
+    elapsed = time.perf_counter() - started
+    app.LOGGER.flush()
+    report = {
+        "capture": {
+            "path": path,
+            "responses": session.total,
+            "served": session.served,
+            "missing": session.missing,
+            "recorded_network_s": round(session.recorded_elapsed, 3),
+        },
+        "replay": {
+            "speed": "recorded" if realtime else "fast",
+            "uids": len(uids),
+            "cycles": cycles,
+            "wall_s": round(elapsed, 4),
+        },
+        "throughput": {
+            "items_diffed": poller.items_diffed,
+            "items_per_s": round(poller.items_diffed / elapsed, 1) if elapsed else None,
+            "unchanged_skips": poller.unchanged,
+            "decoded": poller.decoded,
+        },
+        "detections": {
+            "new_ids": poller.detected,
+            "notifications": len(notifications),
+        },
+        "allocations": {
+            "net_blocks": sys.getallocatedblocks() - blocks_before,
+            "gc_collections": gc_collections() - gc_before,
+        },
+    }
+    digest, unread_items, unread_uids = unread_digest(state)
+    report["detections"].update(
+        {"unread_items": unread_items, "unread_uids": unread_uids, "digest": digest}
+    )
+    if trace:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        report["allocations"]["peak_kib"] = round(peak / 1024, 1)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Replay a capture recorded with `main.py --record` through the poll loop"
+    )
+    parser.add_argument("capture")
+    parser.add_argument("--speed", choices=("fast", "recorded"), default="fast")
+    parser.add_argument("--config", help="config.json to take filters / vc policy from")
+    parser.add_argument("--tracemalloc", action="store_true", help="also report peak memory (slower)")
+    parser.add_argument("--log", action="store_true", help="echo the monitor log while replaying")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.capture):
+        print(f"Capture not found: {args.capture}")
+        sys.exit(1)
+    config = {}
+    if args.config:
+        with open(args.config, "r", encoding="utf-8") as f:
+            config = json.load(f)
+    report = replay(args.capture, config, args.speed == "recorded", args.tracemalloc, args.log)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        for section, values in report.items():
+            print(f"{section}:")
+            for k, v in values.items():
+                print(f"  {k}: {v}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,390 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import time
+
+from urllib.parse import urlparse
+
+import requests
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+import main as app  # noqa: E402
+from capture import classify  # noqa: E402
+from circuit import CircuitBreaker  # noqa: E402
+from clock import VirtualClock  # noqa: E402
+from latency import LatencyTracker  # noqa: E402
+from verifier import DETAIL_URL, RUN_SECONDS, Verifier  # noqa: E402
+
+PAGE_SIZE = 12
+HISTORY = 20  # posts per UID from before the simulation starts
+VC_CARDS = 20
+ID_BASE = 9 * 10**17
+STAT_SECONDS = 600  # like counts on feed items tick this often
+
+
+class FeedModel:
+    # Posting creators. Each UID posts as a Poisson process; rates are
+    # lognormal around posts_per_day, so a few UIDs post far more than most.
+    # Posts are generated lazily up to the clock, newest last.
+    def __init__(self, uids: int, clock, posts_per_day: float, pinned: float, seed: int):
+        self.clock = clock
+        self.rng = random.Random(seed)
+        self.start = clock.time()
+        self.next_id = ID_BASE
+        self.uids = [str(100000 + u) for u in range(uids)]
+        self.rates = {}
+        self.posts = {}  # uid -> [(id, pub_ts)], oldest first
+        self.positions = {}  # uid -> id -> index in posts
+        self.owner = {}  # id -> uid
+        self.next_at = {}
+        self.pinned = {}
+        for uid in self.uids:
+            rate = self.rng.lognormvariate(math.log(posts_per_day), 1.0) / 86400
+            self.rates[uid] = rate
+            ts = self.start
+            history = []
+            for _ in range(HISTORY):
+                ts -= self.rng.expovariate(rate)
+                history.append(int(ts))
+            self.posts[uid] = []
+            self.positions[uid] = {}
+            for pub in reversed(history):
+                self._post(uid, pub)
+            if self.rng.random() < pinned:
+                self.pinned[uid] = self.posts[uid][0]
+            self.next_at[uid] = self.start + self.rng.expovariate(rate)
+
+    def _post(self, uid: str, pub_ts: int):
+        self.next_id += 1
+        entry = (str(self.next_id), pub_ts)
+        self.positions[uid][entry[0]] = len(self.posts[uid])
+        self.owner[entry[0]] = uid
+        self.posts[uid].append(entry)
+
+    def advance(self, uid: str):
+        now = self.clock.time()
+        while self.next_at[uid] <= now:
+            self._post(uid, int(self.next_at[uid]))
+            self.next_at[uid] += self.rng.expovariate(self.rates[uid])
+
+    def new_posts(self):
+        # Everything posted after the start; what the monitor should have found
+        for uid in self.uids:
+            self.advance(uid)
+        return {uid: [x for x, ts in posts if ts >= self.start] for uid, posts in self.posts.items()}
+
+    def item(self, uid: str, entry, pinned: bool = False):
+        dynamic_id, pub_ts = entry
+        modules = {
+            "module_author": {"pub_ts": pub_ts, "name": f"user{uid}"},
+            "module_dynamic": {"desc": {"text": f"post {dynamic_id}"}},
+            # Counts keep moving while the post list stays the same
+            "module_stat": {"like": {"count": max(0, self.stat_epoch() - pub_ts // STAT_SECONDS)}},
+        }
+        if pinned:
+            modules["module_tag"] = {"text": "置顶"}
+        return {"id_str": dynamic_id, "type": "DYNAMIC_TYPE_WORD", "modules": modules}
+
+    def stat_epoch(self) -> int:
+        return int(self.clock.time() // STAT_SECONDS)
+
+    def page(self, uid: str, offset: str = ""):
+        self.advance(uid)
+        posts = self.posts[uid]
+        end = self.positions[uid].get(offset, len(posts)) if offset else len(posts)
+        start = max(0, end - PAGE_SIZE)
+        items = [self.item(uid, e) for e in reversed(posts[start:end])]
+        if not offset and uid in self.pinned:
+            items.insert(0, self.item(uid, self.pinned[uid], pinned=True))
+        return {
+            "items": items,
+            "offset": posts[start][0] if start > 0 else "",
+            "has_more": start > 0,
+        }
+
+    def detail(self, dynamic_id: str):
+        uid = self.owner.get(dynamic_id)
+        if uid is None:
+            return None
+        return self.item(uid, self.posts[uid][self.positions[uid][dynamic_id]])
+
+    def cards(self, uid: str):
+        self.advance(uid)
+        return [
+            {"desc": {"dynamic_id_str": x, "timestamp": ts}}
+            for x, ts in reversed(self.posts[uid][-VC_CARDS:])
+        ]
+
+
+class SimulatedResponse:
+    # The part of requests.Response the monitor uses; far cheaper to build
+    status_code = 200
+
+    def __init__(self, content: bytes):
+        self.content = content
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class SimulatedSession(requests.Session):
+    # Answers the feed, vc and name endpoints from a FeedModel. Every request
+    # costs request_seconds of virtual time and fails during an outage.
+    def __init__(self, model: FeedModel, clock, request_seconds: float, outages=()):
+        super().__init__()
+        self.model = model
+        self.clock = clock
+        self.request_seconds = request_seconds
+        self.outages = list(outages)  # (start, end) wall times
+        self.served = {"feed": 0, "vc": 0, "name": 0, "detail": 0}
+        self.failed = 0
+        self._bodies = {}  # (uid, offset) -> (posts, body); first pages repeat a lot
+
+    def offline(self) -> bool:
+        now = self.clock.time()
+        return any(start <= now < end for start, end in self.outages)
+
+    def request(self, method, url, params=None, **kwargs):
+        kind, uid = classify(url, params)
+        if urlparse(url).path == urlparse(DETAIL_URL).path:
+            kind, uid = "detail", (params or {}).get("id", "")
+        if not kind:
+            raise requests.ConnectionError(f"Not simulated: {url}")
+        self.clock.sleep(self.request_seconds)
+        if self.offline():
+            self.failed += 1
+            raise requests.ConnectionError("simulated outage")
+        self.served[kind] += 1
+        if kind == "feed":
+            offset = (params or {}).get("offset", "")
+            self.model.advance(uid)
+            key = (uid, offset)
+            count = (len(self.model.posts[uid]), self.model.stat_epoch())
+            cached = self._bodies.get(key)
+            if cached and cached[0] == count:
+                body = cached[1]
+            else:
+                body = json.dumps({"code": 0, "data": self.model.page(uid, offset)}).encode("utf-8")
+                self._bodies[key] = (count, body)
+        elif kind == "vc":
+            body = json.dumps({"code": 0, "data": {"cards": self.model.cards(uid)}}).encode("utf-8")
+        elif kind == "detail":
+            item = self.model.detail(uid)
+            data = {"code": 0, "data": {"item": item}} if item else {"code": 4101131, "data": None}
+            body = json.dumps(data).encode("utf-8")
+        else:
+            body = json.dumps({"code": 0, "data": {"name": f"user{uid}"}}).encode("utf-8")
+        return SimulatedResponse(body)
+
+
+class RecordingState(app.ReadState):
+    # Remembers every id that ever became unread, read or not
+    def __init__(self, clock):
+        super().__init__(persist=False, clock=clock)
+        self.found = set()
+
+    def add_unread_entries(self, uid: str, entries):
+        self.found.update(x.get("id") for x in entries or () if isinstance(x, dict))
+        super().add_unread_entries(uid, entries)
+
+
+def parse_window(text: str):
+    # "START_HOURS:HOURS" -> (start offset, length) in seconds
+    try:
+        start, length = (float(x) for x in text.split(":"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected START_HOURS:HOURS, got {text!r}")
+    return start * 3600, length * 3600
+
+
+def simulate(args):
+    app.LOGGER.configure(echo=args.log, level="info" if args.log else "warning")
+    clock = VirtualClock()
+    model = FeedModel(args.uids, clock, args.posts_per_day, args.pinned, args.seed)
+    start = clock.time()
+    end = start + args.days * 86400
+    session = SimulatedSession(
+        model, clock, args.request_ms / 1000, [(start + s, start + s + n) for s, n in args.outage]
+    )
+    state = RecordingState(clock)
+    latency = LatencyTracker(window_hours=int(args.days * 24) + 1)
+    notifications = []
+    config = {"use_vc_api": args.vc}
+    poller = app.Poller(
+        session,
+        state,
+        model.uids,
+        vc_policy=app.build_vc_policy(config),
+        initial_time_ts=int(start),
+        notifier=lambda title, message, url: notifications.append(clock.time()),
+        breaker=CircuitBreaker(lambda: not session.offline(), clock=clock.monotonic),
+        cycle_budget=args.poll_seconds * 0.9,
+        catchup_rate=args.catchup_rate,
+        max_pages=args.max_pages,
+        latency=latency,
+        clock=clock,
+    )
+    verifier = None
+    if args.verify:
+        verifier = Verifier(
+            session, state, app.get_item_pub_ts, app.get_item_content, breaker=poller.breaker, clock=clock
+        )
+        poller.verifier = verifier
+    # Machine sleeps, the user reading everything and verifier runs, in wall-time order
+    events = [(start + s, "suspend", n) for s, n in args.suspend]
+    if verifier:
+        events += [(start + t, "verify", 0) for t in range(RUN_SECONDS, int(end - start), RUN_SECONDS)]
+    if args.read_every:
+        t = start + args.read_every * 3600
+        while t < end:
+            events.append((t, "read", 0))
+            t += args.read_every * 3600
+    events.sort()
+
+    started = time.perf_counter()
+    poller.resolve_names({})
+    poller.init_all()
+    cycles = 0
+    reads = 0
+    for at, kind, seconds in events + [(end, "end", 0)]:
+        cycles += poller.run(args.poll_seconds, until=min(at, end))
+        if kind == "suspend":
+            clock.suspend(seconds)
+        elif kind == "read":
+            reads += state.mark_read_batch(all_uids=True)
+        elif kind == "verify":
+            verifier.run_once()
+    # Drain: one unhurried pass so posts from the last interval count as found
+    model.advance = lambda uid: None
+    poller.cycle_budget = None
+    while poller.catchup:
+        poller.poll_cycle()
+    poller.poll_cycle()
+    elapsed = time.perf_counter() - started
+    app.LOGGER.flush()
+
+    expected = model.new_posts()
+    missed = sum(1 for ids in expected.values() for x in ids if x not in state.found)
+    hours = (clock.time() - start) / 3600
+    requests_total = sum(session.served.values()) + session.failed
+    _, unread, names = state.unread_snapshot()
+    report = latency.report(now=clock.time())
+    out = {
+        "scenario": {
+            "uids": args.uids,
+            "days": args.days,
+            "poll_seconds": args.poll_seconds,
+            "posts_per_day": args.posts_per_day,
+            "seed": args.seed,
+        },
+        "run": {
+            "virtual_hours": round(hours, 1),
+            "wall_s": round(elapsed, 2),
+            "speedup": round(hours * 3600 / elapsed) if elapsed else None,
+            "cycles": cycles,
+        },
+        "requests": {
+            **session.served,
+            "failed": session.failed,
+            "per_hour": round(requests_total / hours, 1) if hours else None,
+            "extra_pages": poller.extra_pages,
+            "unchanged_skips": poller.unchanged,
+        },
+        "detection": {
+            "posted": sum(len(v) for v in expected.values()),
+            "found": len(state.found),
+            "missed": missed,
+            "p50_s": report["stages"]["detect"]["p50"],
+            "p95_s": report["stages"]["detect"]["p95"],
+            "p99_s": report["stages"]["detect"]["p99"],
+            "slo_met": report["slo"]["met"],
+        },
+        "behaviour": {
+            "notifications": len(notifications),
+            "read_events": sum(1 for e in events if e[1] == "read"),
+            "marked_read": reads,
+            "breaker_trips": poller.breaker.trips,
+            "catchups": poller.catchups,
+            "rolled_over": poller.rolled_over,
+        },
+        "state": {
+            "unread_items": sum(len(v) for v in unread.values()),
+            "unread_uids": len(unread),
+            "json_bytes": len(json.dumps({"unread": unread, "names": names})),
+        },
+    }
+    if verifier:
+        out["verify"] = verifier.stats()
+    return out
+
+
+def check(report: dict, args):
+    failures = []
+    per_hour = report["requests"]["per_hour"]
+    if args.max_requests_per_hour is not None and per_hour > args.max_requests_per_hour:
+        failures.append(f"requests/hour {per_hour} > {args.max_requests_per_hour}")
+    p95 = report["detection"]["p95_s"]
+    if args.max_p95 is not None and (p95 is None or p95 > args.max_p95):
+        failures.append(f"detection p95 {p95}s > {args.max_p95}s")
+    missed = report["detection"]["missed"]
+    if args.max_missed is not None and missed > args.max_missed:
+        failures.append(f"missed posts {missed} > {args.max_missed}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run the poll loop against a simulated feed in virtual time (no login or network)"
+    )
+    parser.add_argument("--uids", type=int, default=100)
+    parser.add_argument("--days", type=float, default=7)
+    parser.add_argument("--poll-seconds", type=float, default=app.POLL_SECONDS)
+    parser.add_argument("--posts-per-day", type=float, default=2.0, help="median per UID")
+    parser.add_argument("--pinned", type=float, default=0.2, help="share of UIDs with a pinned post")
+    parser.add_argument("--request-ms", type=float, default=150, help="virtual time per request")
+    parser.add_argument("--vc", action="store_true", help="also poll the vc API (smart policy)")
+    parser.add_argument("--verify", action="store_true", help="re-verify unread entries (detail API)")
+    parser.add_argument("--catchup-rate", type=float, default=app.CATCHUP_RATE)
+    parser.add_argument("--max-pages", type=int, default=app.CATCHUP_MAX_PAGES)
+    parser.add_argument("--outage", type=parse_window, action="append", default=[],
+                        metavar="START_H:HOURS", help="network down for a while (repeatable)")
+    parser.add_argument("--suspend", type=parse_window, action="append", default=[],
+                        metavar="START_H:HOURS", help="machine asleep for a while (repeatable)")
+    parser.add_argument("--read-every", type=float, default=0, metavar="HOURS",
+                        help="mark everything read this often")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--max-requests-per-hour", type=float)
+    parser.add_argument("--max-p95", type=float, metavar="SECONDS")
+    parser.add_argument("--max-missed", type=int)
+    parser.add_argument("--log", action="store_true", help="echo the monitor log")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+    if args.uids < 1 or args.days <= 0 or args.poll_seconds <= 0 or args.posts_per_day <= 0:
+        parser.error("--uids, --days, --poll-seconds and --posts-per-day must be positive")
+
+    report = simulate(args)
+    failures = check(report, args)
+    if args.json:
+        print(json.dumps(dict(report, failures=failures), indent=2))
+    else:
+        for section, values in report.items():
+            print(f"{section}:")
+            for k, v in values.items():
+                print(f"  {k}: {v}")
+        for f in failures:
+            print(f"FAIL {f}")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+import heapq
+import threading
+import zlib
+
+import requests
+
+from applog import log
+from clock import SYSTEM_CLOCK
+
+DETAIL_URL = "https://api.bilibili.com/x/polymer/web-dynamic/v1/detail"
+REQUEST_TIMEOUT = (3.05, 10)
+# detail answers for a dynamic that no longer exists
+DELETED_CODES = (4101131,)
+VERIFY_BUDGET = 60  # detail requests per hour
+VERIFY_MAX_AGE = 72 * 3600
+RECHECK_SECONDS = 3600
+RUN_SECONDS = 60
+MAX_TRACKED = 5000
+PINNED_TAG = "置顶"
+
+
+def fetch_dynamic(session: requests.Session, dynamic_id: str):
+    # The item, or None when it was deleted
+    r = session.get(
+        DETAIL_URL,
+        params={"id": dynamic_id, "features": "itemOpusStyle"},
+        headers={"Referer": f"https://t.bilibili.com/{dynamic_id}"},
+        timeout=REQUEST_TIMEOUT,
+    )
+    r.raise_for_status()
+    data = r.json()
+    if data.get("code") in DELETED_CODES:
+        return None
+    if data.get("code") != 0:
+        raise RuntimeError(f"Fetch dynamic {dynamic_id} failed: {data}")
+    item = (data.get("data") or {}).get("item")
+    if not isinstance(item, dict):
+        # Only DELETED_CODES mean deleted; a truncated reply is retried
+        raise RuntimeError(f"Fetch dynamic {dynamic_id} returned no item: {data}")
+    return item
+
+
+def is_pinned(item) -> bool:
+    modules = item.get("modules") or {}
+    return (modules.get("module_tag") or {}).get("text") == PINNED_TAG
+
+
+class Record:
+    __slots__ = ("uid", "pub", "digest", "checked", "suspect", "feed_hidden", "on_page")
+
+    def __init__(self, uid: str, pub: int, digest: int, checked: float):
+        self.uid = uid
+        self.pub = pub
+        self.digest = digest
+        self.checked = checked
+        self.suspect = False
+        self.feed_hidden = False  # exists, but the feed leaves it out
+        self.on_page = False  # on the last first page observed
+
+
+class Verifier:
+    # Re-checks unread dynamics for deletion and edits. Feed pages the
+    # poller fetched anyway are free: anything on them is verified, and an
+    # entry missing from a page that spans its pub_ts becomes a suspect.
+    # Suspects, then entries that scrolled off the first page, are checked
+    # against the detail endpoint within `budget` requests per hour.
+    def __init__(self, session, state, pub_ts, content_of, budget: int = VERIFY_BUDGET,
+                 max_age: int = VERIFY_MAX_AGE, recheck: int = RECHECK_SECONDS,
+                 max_tracked: int = MAX_TRACKED, breaker=None, clock=None):
+        self.session = session
+        self.state = state
+        self.pub_ts = pub_ts
+        # content_of(item) -> str; edits are changes to this
+        self.content_of = content_of
+        self.budget = budget
+        self.max_age = max_age
+        self.recheck = recheck
+        self.max_tracked = max_tracked
+        self.breaker = breaker
+        self.clock = clock or SYSTEM_CLOCK
+        self.lock = threading.Lock()
+        self.records = {}  # dynamic id -> Record
+        self.by_uid = {}  # uid -> dynamic ids, so a page only touches its UID
+        self.tokens = max(1.0, budget / 12)
+        self.refilled = self.clock.monotonic()
+        self.page_checks = 0
+        self.requests = 0
+        self.deleted = 0
+        self.edited = 0
+        self._stop = threading.Event()
+
+    def _digest(self, item) -> int:
+        return zlib.crc32((self.content_of(item) or "").encode("utf-8"))
+
+    def track(self, uid: str, entries, now: float = None):
+        # entries: (dynamic id, feed item) for new unread entries
+        now = now or self.clock.time()
+        with self.lock:
+            for entry_id, item in entries:
+                pub = self.pub_ts(item) if item else None
+                if not pub or now - pub > self.max_age:
+                    continue
+                self.records[entry_id] = Record(uid, pub, self._digest(item), now)
+                self.by_uid.setdefault(uid, set()).add(entry_id)
+            if len(self.records) > self.max_tracked:
+                extra = len(self.records) - self.max_tracked
+                for entry_id in heapq.nsmallest(extra, self.records, key=lambda k: self.records[k].pub):
+                    self._drop(entry_id)
+
+    def _drop(self, entry_id: str):
+        rec = self.records.pop(entry_id, None)
+        if rec is None:
+            return
+        ids = self.by_uid.get(rec.uid)
+        if ids is not None:
+            ids.discard(entry_id)
+            if not ids:
+                del self.by_uid[rec.uid]
+
+    def observe(self, uid: str, items, now: float = None):
+        now = now or self.clock.time()
+        if uid not in self.by_uid:
+            return
+        page = {it.get("id_str"): it for it in items if isinstance(it, dict)}
+        # A pinned post can be months old; it says nothing about what the page spans
+        stamps = [self.pub_ts(it) for it in page.values() if not is_pinned(it)]
+        oldest = min((t for t in stamps if t), default=None)
+        edits = []
+        with self.lock:
+            for entry_id in self.by_uid.get(uid, ()):
+                rec = self.records[entry_id]
+                item = page.get(entry_id)
+                rec.on_page = item is not None
+                if item is not None:
+                    self.page_checks += 1
+                    rec.checked = now
+                    rec.suspect = False
+                    digest = self._digest(item)
+                    if digest != rec.digest:
+                        rec.digest = digest
+                        edits.append(entry_id)
+                elif oldest and rec.pub >= oldest and not rec.feed_hidden:
+                    rec.suspect = True
+        for entry_id in edits:
+            self._edited(uid, entry_id, now)
+
+    def touch(self, uid: str, now: float = None):
+        # The first page held the same posts as last time: whatever was on
+        # it is still there. Edits wait for the next decoded page.
+        now = now or self.clock.time()
+        with self.lock:
+            for entry_id in self.by_uid.get(uid, ()):
+                rec = self.records[entry_id]
+                if rec.on_page:
+                    rec.checked = now
+
+    def _edited(self, uid: str, entry_id: str, now: float):
+        if self.state.update_unread_entry(uid, entry_id, {"edited": int(now)}):
+            self.edited += 1
+            log(f"[verify] uid={uid} id={entry_id} was edited", uid=uid)
+
+    def _deleted(self, uid: str, entry_id: str):
+        with self.lock:
+            self._drop(entry_id)
+        if self.state.remove_unread(uid, [entry_id]):
+            self.deleted += 1
+            log(f"[verify] uid={uid} id={entry_id} was deleted, removed from unread", uid=uid)
+
+    def _prune(self, now: float):
+        # Stop tracking entries that were read or are past max_age
+        with self.lock:
+            uids = list(self.by_uid)
+        unread = {uid: {e.get("id") for e in self.state.get_unread_items(uid)} for uid in uids}
+        with self.lock:
+            for entry_id in [
+                k for k, rec in self.records.items()
+                if k not in unread.get(rec.uid, ()) or now - rec.pub > self.max_age
+            ]:
+                self._drop(entry_id)
+
+    def _take_tokens(self) -> int:
+        now = self.clock.monotonic()
+        cap = max(1.0, self.budget / 12)  # at most five minutes of budget at once
+        self.tokens = min(cap, self.tokens + (now - self.refilled) * self.budget / 3600)
+        self.refilled = now
+        return int(self.tokens)
+
+    def due(self, limit: int, now: float):
+        # Suspects first, then the entries verified longest ago
+        with self.lock:
+            candidates = [
+                (not rec.suspect, rec.checked, entry_id, rec.uid)
+                for entry_id, rec in self.records.items()
+                if rec.suspect or now - rec.checked >= self.recheck
+            ]
+        return [(entry_id, uid) for _, _, entry_id, uid in heapq.nsmallest(limit, candidates)]
+
+    def run_once(self, now: float = None):
+        now = now or self.clock.time()
+        self._prune(now)
+        if self.breaker and self.breaker.is_open:
+            return
+        for entry_id, uid in self.due(self._take_tokens(), now):
+            self.tokens -= 1
+            self.requests += 1
+            try:
+                item = fetch_dynamic(self.session, entry_id)
+            except Exception as e:
+                log(f"[verify] check failed for {entry_id}: {e}", "warning", uid=uid)
+                break
+            if item is None:
+                self._deleted(uid, entry_id)
+                continue
+            with self.lock:
+                rec = self.records.get(entry_id)
+                if rec is None:
+                    continue
+                rec.feed_hidden = rec.suspect
+                rec.suspect = False
+                rec.checked = now
+                digest = self._digest(item)
+                changed = digest != rec.digest
+                rec.digest = digest
+            if changed:
+                self._edited(uid, entry_id, now)
+
+    def start(self):
+        def run():
+            while not self._stop.wait(RUN_SECONDS):
+                try:
+                    self.run_once()
+                except Exception as e:
+                    log(f"[verify] run failed: {e}", "error")
+
+        t = threading.Thread(target=run, daemon=True)
+        t.start()
+        return t
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        with self.lock:
+            tracked = len(self.records)
+            suspects = sum(1 for r in self.records.values() if r.suspect)
+        return {
+            "tracked": tracked,
+            "suspects": suspects,
+            "page_checks": self.page_checks,
+            "requests": self.requests,
+            "deleted": self.deleted,
+            "edited": self.edited,
+        }
@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+import hashlib
+import heapq
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from applog import log
+
+BATCH_WINDOW = 2.0
+BATCH_MAX = 100
+CONCURRENCY = 4
+RETRY_MIN_SECONDS = 5
+RETRY_MAX_SECONDS = 600
+MAX_AGE_SECONDS = 86400
+REQUEST_TIMEOUT = (3.05, 10)
+
+
+class Endpoint:
+    def __init__(self, spec):
+        if isinstance(spec, str):
+            spec = {"url": spec}
+        if not isinstance(spec, dict) or not str(spec.get("url", "")).startswith(("http://", "https://")):
+            raise ValueError(f"webhook needs an http(s) url: {spec!r}")
+        self.url = spec["url"]
+        self.headers = dict(spec.get("headers") or {})
+        self.window = float(spec.get("batch_window", BATCH_WINDOW))
+        self.max_batch = int(spec.get("max_batch", BATCH_MAX))
+        # Stable across restarts and config reordering; names queue files
+        self.key = hashlib.sha1(self.url.encode("utf-8")).hexdigest()[:12]
+        self.session = requests.Session()
+        # One in-flight batch per endpoint, so a small pool is enough for keep-alive
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=2))
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=2))
+        self.pending = []  # events waiting for the batch window
+        self.window_ends = None
+        self.ready = []  # journaled batches in order; the head is sent next
+        self.busy = False
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+
+
+class WebhookSink:
+    # submit() only enqueues. A dispatcher thread batches events per endpoint,
+    # journals each batch to disk, and hands it to a bounded worker pool;
+    # failed batches are retried with backoff until they are delivered or
+    # older than max_age.
+    def __init__(self, endpoints, directory=None, concurrency: int = CONCURRENCY,
+                 max_age: float = MAX_AGE_SECONDS, clock=time.time):
+        self.endpoints = {}
+        for spec in endpoints:
+            ep = Endpoint(spec)
+            self.endpoints[ep.key] = ep
+        self.directory = directory
+        self.concurrency = concurrency
+        self.max_age = max_age
+        self.clock = clock
+        self.inbox = queue.SimpleQueue()
+        self.retry_heap = []  # (due, seq, key)
+        self._seq = 0
+        # Batch ids must not repeat across restarts, while seq starts over
+        # whenever the journal is empty
+        self.instance = os.urandom(4).hex()
+        self._pool = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    # Durable queue: one JSON file per batch, rewritten on each attempt
+
+    def _path(self, batch):
+        return os.path.join(self.directory, f"{batch['key']}-{batch['seq']:012d}.json")
+
+    def _journal(self, batch):
+        if not self.directory:
+            return
+        path = self._path(batch)
+        tmp = path + ".tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(batch, f, ensure_ascii=True)
+            os.replace(tmp, path)
+        except OSError as e:
+            log(f"[webhook] failed to journal batch: {e}", "error")
+
+    def _forget(self, batch):
+        if not self.directory:
+            return
+        try:
+            os.remove(self._path(batch))
+        except OSError:
+            pass
+
+    def load(self):
+        if not self.directory:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        restored = 0
+        for name in sorted(os.listdir(self.directory)):
+            path = os.path.join(self.directory, name)
+            if name.endswith(".tmp"):
+                os.remove(path)
+                continue
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    batch = json.load(f)
+            except (OSError, ValueError) as e:
+                log(f"[webhook] dropping unreadable batch {name}: {e}", "warning")
+                os.remove(path)
+                continue
+            ep = self.endpoints.get(batch.get("key"))
+            if not ep:
+                log(f"[webhook] dropping batch for removed endpoint {batch.get('url')}", "warning")
+                os.remove(path)
+                continue
+            self._seq = max(self._seq, int(batch["seq"]))
+            ep.ready.append(batch)
+            restored += 1
+        if restored:
+            log(f"[webhook] restored {restored} undelivered batches")
+
+    def submit(self, events):
+        events = list(events)
+        if events and self.endpoints:
+            self.inbox.put(events)
+
+    def _close_batches(self, now, force=False):
+        for ep in self.endpoints.values():
+            while ep.pending and (force or now >= ep.window_ends or len(ep.pending) >= ep.max_batch):
+                events, ep.pending = ep.pending[: ep.max_batch], ep.pending[ep.max_batch :]
+                self._seq += 1
+                batch = {
+                    "key": ep.key,
+                    "url": ep.url,
+                    "seq": self._seq,
+                    "id": f"{ep.key}-{self.instance}-{self._seq}",
+                    "created": now,
+                    "attempts": 0,
+                    "events": events,
+                }
+                self._journal(batch)
+                ep.ready.append(batch)
+                if ep.pending:
+                    ep.window_ends = now + ep.window
+
+    def _dispatch(self, now):
+        # Due retries first, then any idle endpoint with a queued batch
+        while self.retry_heap and self.retry_heap[0][0] <= now:
+            _, _, key = heapq.heappop(self.retry_heap)
+            self.endpoints[key].busy = False
+        for ep in self.endpoints.values():
+            if ep.busy or not ep.ready:
+                continue
+            ep.busy = True
+            self._pool.submit(self._send, ep, ep.ready[0])
+
+    def _send(self, ep, batch):
+        body = json.dumps(
+            # batch id lets receivers drop redeliveries (delivery is at-least-once)
+            {"source": "bilibiliMessage", "batch": batch.get("id") or f"{ep.key}-{batch['seq']}", "events": batch["events"]},
+            ensure_ascii=False,
+        ).encode("utf-8")
+        headers = {"Content-Type": "application/json; charset=utf-8"}
+        headers.update(ep.headers)
+        try:
+            r = ep.session.post(ep.url, data=body, headers=headers, timeout=REQUEST_TIMEOUT)
+            ok = 200 <= r.status_code < 300
+            err = None if ok else f"HTTP {r.status_code}"
+        except requests.RequestException as e:
+            ok, err = False, str(e)
+        self.inbox.put(("done", ep.key, batch["seq"], ok, err))
+
+    def _finish(self, key, seq, ok, err):
+        ep = self.endpoints[key]
+        batch = ep.ready[0]
+        now = self.clock()
+        if ok:
+            ep.ready.pop(0)
+            ep.sent += 1
+            ep.busy = False
+            self._forget(batch)
+            return
+        ep.failed += 1
+        batch["attempts"] += 1
+        if now - batch["created"] > self.max_age:
+            ep.ready.pop(0)
+            ep.dropped += 1
+            ep.busy = False
+            self._forget(batch)
+            log(f"[webhook] giving up on batch of {len(batch['events'])} to {ep.url}: {err}", "error")
+            return
+        delay = min(RETRY_MIN_SECONDS * 2 ** (batch["attempts"] - 1), RETRY_MAX_SECONDS)
+        self._journal(batch)
+        # Endpoint stays busy until the retry is due, which keeps batches in order
+        heapq.heappush(self.retry_heap, (now + delay, seq, key))
+        log(f"[webhook] {ep.url} failed ({err}), retry {batch['attempts']} in {delay}s", "warning")
+
+    def _next_timeout(self, now):
+        due = [ep.window_ends for ep in self.endpoints.values() if ep.pending]
+        if self.retry_heap:
+            due.append(self.retry_heap[0][0])
+        return max(0.05, min(due) - now) if due else 1.0
+
+    def _handle(self, msg):
+        # Event lists from submit(); ("done", ...) tuples from workers
+        if isinstance(msg, tuple):
+            self._finish(*msg[1:])
+            return
+        now = self.clock()
+        for ep in self.endpoints.values():
+            if not ep.pending:
+                ep.window_ends = now + ep.window
+            ep.pending.extend(msg)
+
+    def _drain(self, timeout=None):
+        try:
+            msg = self.inbox.get(timeout=timeout) if timeout else self.inbox.get_nowait()
+        except queue.Empty:
+            return
+        while True:
+            self._handle(msg)
+            try:
+                msg = self.inbox.get_nowait()
+            except queue.Empty:
+                return
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._drain(self._next_timeout(self.clock()))
+            now = self.clock()
+            self._close_batches(now)
+            self._dispatch(now)
+
+    def start(self):
+        if not self.endpoints:
+            return None
+        self._pool = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="webhook")
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self, timeout: float = 5.0):
+        # Undelivered events are journaled so the next start picks them up
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+        self._drain()
+        self._close_batches(self.clock(), force=True)
+        if self._pool:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self):
+        return {
+            ep.url: {
+                "sent": ep.sent,
+                "failed": ep.failed,
+                "dropped": ep.dropped,
+                "queued": len(ep.ready) + (1 if ep.pending else 0),
+            }
+            for ep in self.endpoints.values()
+        }